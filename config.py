@@ -36,9 +36,113 @@ ENVIRONMENT = os.getenv("ENVIRONMENT", "DEV")
 # for Redis connection
 REDIS_URL = os.getenv("REDIS_URL")
 ADMIN_SECRET_TOKEN = os.getenv("ADMIN_SECRET_TOKEN")
+# bulk purge of keys by prefix (admin), throttled so webhook traffic is not starved
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "500"))
+PURGE_PAUSE_MS = int(os.getenv("PURGE_PAUSE_MS", "50"))
+# stats hashes retention in days per granularity, override with e.g. STATS_RETENTION_DAYS="hour:7,day:200"
+STATS_RETENTION_DAYS = {"hour": 14, "day": 400, "week": 1100, "month": 1100}
+STATS_RETENTION_DAYS.update(
+    (granularity.strip(), int(days))
+    for granularity, days in (item.split(":") for item in os.getenv("STATS_RETENTION_DAYS", "").split(",") if item)
+)
+# in-process caches (see utils/verdict_cache.py), periodically snapshotted to Redis for warm restarts
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "2000"))
+VERDICT_CACHE_TTL = int(os.getenv("VERDICT_CACHE_TTL", "21600"))  # 6 hours, also the snapshot freshness cutoff
+# past the TTL: served at once while refreshed in the background for VERDICT_STALE_GRACE seconds,
+# then only when GOK fails, up to VERDICT_STALE_MAX seconds
+VERDICT_STALE_GRACE = int(os.getenv("VERDICT_STALE_GRACE", "3600"))
+VERDICT_STALE_MAX = int(os.getenv("VERDICT_STALE_MAX", "604800"))
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "500"))
+WARM_SNAPSHOT_SIZE = int(os.getenv("WARM_SNAPSHOT_SIZE", "300"))
+WARM_SNAPSHOT_INTERVAL = int(os.getenv("WARM_SNAPSHOT_INTERVAL", "900"))
+# verdict cache shared by the worker processes of a machine (see utils/shared_cache.py), e.g. /dev/shm/gok-verdicts
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "")
+SHARED_CACHE_SLOTS = int(os.getenv("SHARED_CACHE_SLOTS", "8192"))  # 512 bytes each
+# barcodes GOK doesn't know: replies cached briefly (the rabbi may add them), requests counted for a ranked report
+NOT_FOUND_CACHE_SIZE = int(os.getenv("NOT_FOUND_CACHE_SIZE", "1000"))
+NOT_FOUND_CACHE_TTL = int(os.getenv("NOT_FOUND_CACHE_TTL", "1800"))
+UNKNOWN_RETENTION_DAYS = int(os.getenv("UNKNOWN_RETENTION_DAYS", "30"))
+# admission control (see utils/admission.py): queued work behind the webhook ack and per-stage concurrency
+ADMISSION_SOFT_PENDING = int(os.getenv("ADMISSION_SOFT_PENDING", "12"))  # start shedding stale/duplicate group work
+ADMISSION_MAX_PENDING = int(os.getenv("ADMISSION_MAX_PENDING", "40"))  # shed all group images, ask Green to retry private
+ADMISSION_STALE_SECONDS = int(os.getenv("ADMISSION_STALE_SECONDS", "120"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "30"))
+STAGE_LIMITS = {"decode": 2, "gok": 4, "send": 4}
+STAGE_LIMITS.update(
+    (stage.strip(), int(limit))
+    for stage, limit in (item.split(":") for item in os.getenv("STAGE_LIMITS", "").split(",") if item)
+)
+DECODE_MEMORY_BUDGET_MB = int(os.getenv("DECODE_MEMORY_BUDGET_MB", "96"))  # decoded bitmaps in flight (256 MB VM)
+# scheduler (see utils/scheduler.py): workers running handlers, fair-share weight per chatId ("id@g.us:0.5,...")
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "4"))
+# seconds a shutdown waits for queued/running handlers - below gunicorn's graceful timeout and fly.toml kill_timeout
+SCHEDULER_DRAIN_TIMEOUT = float(os.getenv("SCHEDULER_DRAIN_TIMEOUT", "20"))
+FAIR_SHARE_WEIGHTS = {
+    chat_id.strip(): float(weight)
+    for chat_id, weight in (item.rsplit(":", 1) for item in os.getenv("FAIR_SHARE_WEIGHTS", "").split(",") if item)
+}
+# event-loop lag monitor (see utils/loop_monitor.py): heartbeat period, and the stall that gets its stack captured
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))  # seconds, 0 disables the monitor
+# token-bucket rate limits, "burst:refill_per_minute"; a chat bucket applies to groups only
+RATE_LIMIT_SENDER = tuple(map(float, os.getenv("RATE_LIMIT_SENDER", "8:4").split(":")))
+RATE_LIMIT_CHAT = tuple(map(float, os.getenv("RATE_LIMIT_CHAT", "40:20").split(":")))
+RATE_LIMIT_NOTICE_SECONDS = int(os.getenv("RATE_LIMIT_NOTICE_SECONDS", "600"))  # one "slow down" reply per window
+# deadlines (see utils/deadline.py): max seconds per stage, and max reply age counted from the webhook timestamp
+STAGE_BUDGETS = {"download": 15, "decode": 10, "gok": 20, "send": 30}
+STAGE_BUDGETS.update(
+    (stage.strip(), float(seconds))
+    for stage, seconds in (item.split(":") for item in os.getenv("STAGE_BUDGETS", "").split(",") if item)
+)
+REPLY_MAX_AGE_GROUP = int(os.getenv("REPLY_MAX_AGE_GROUP", "300"))
+REPLY_MAX_AGE_PRIVATE = int(os.getenv("REPLY_MAX_AGE_PRIVATE", "900"))
+MULTI_BARCODE_LIMIT = int(os.getenv("MULTI_BARCODE_LIMIT", "5"))  # barcodes per image/text answered in one reply
+# admin bulk check (see services/bulk_check.py): kept below the live traffic's GOK share
+BULK_CHECK_WORKERS = int(os.getenv("BULK_CHECK_WORKERS", "2"))  # GOK batch requests in flight, of STAGE_LIMITS["gok"]
+BULK_CHECK_BATCH = int(os.getenv("BULK_CHECK_BATCH", "20"))  # barcodes per GOK request
+BULK_CHECK_MAX_BARCODES = int(os.getenv("BULK_CHECK_MAX_BARCODES", "5000"))
+BULK_CHECK_BACKOFF = float(os.getenv("BULK_CHECK_BACKOFF", "1"))  # seconds to wait while live traffic is queued up
+# photos with a longest side of at least this many pixels are first scanned as localized crops (needs numpy)
+LOCALIZE_MIN_SIDE = int(os.getenv("LOCALIZE_MIN_SIDE", "1000"))
+# decode strategy order learned from which strategy decodes images (see utils/decode_tuner.py)
+DECODE_EXPLORE_RATE = float(os.getenv("DECODE_EXPLORE_RATE", "0.05"))
+DECODE_MIN_SAMPLES = int(os.getenv("DECODE_MIN_SAMPLES", "50"))  # images per context before reordering
+DECODE_STATS_INTERVAL = int(os.getenv("DECODE_STATS_INTERVAL", "300"))
+# opt-in sampled capture of decoded/undecodable images (see utils/decode_corpus.py), off unless a dir is set
+DECODE_CAPTURE_DIR = os.getenv("DECODE_CAPTURE_DIR", "")
+DECODE_CAPTURE_FAILURE_RATE = float(os.getenv("DECODE_CAPTURE_FAILURE_RATE", "0.2"))
+DECODE_CAPTURE_SUCCESS_RATE = float(os.getenv("DECODE_CAPTURE_SUCCESS_RATE", "0"))
+DECODE_CAPTURE_MAX_MB = int(os.getenv("DECODE_CAPTURE_MAX_MB", "200"))
+DECODE_CAPTURE_MAX_SIDE = int(os.getenv("DECODE_CAPTURE_MAX_SIDE", "1600"))
+# opt-in recording of redacted /webhook-green payloads (see utils/webhook_recorder.py), off unless a dir is set
+WEBHOOK_RECORD_DIR = os.getenv("WEBHOOK_RECORD_DIR", "")
+WEBHOOK_RECORD_FILE_MB = int(os.getenv("WEBHOOK_RECORD_FILE_MB", "20"))  # uncompressed bytes per file before rotating
+WEBHOOK_RECORD_MAX_FILES = int(os.getenv("WEBHOOK_RECORD_MAX_FILES", "20"))
+WEBHOOK_RECORD_SALT = os.getenv("WEBHOOK_RECORD_SALT", "")  # phone pseudonyms salt, random per process if empty
+# circuit breakers around GOK and Green (see utils/circuit_breaker.py)
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_WINDOW_SECONDS = int(os.getenv("BREAKER_WINDOW_SECONDS", "60"))
+BREAKER_OPEN_SECONDS = int(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_SYNC_SECONDS = int(os.getenv("BREAKER_SYNC_SECONDS", "5"))
+# hedged GOK requests (see utils/hedge.py), off by default: a 2nd identical request after the p95 latency
+GOK_HEDGING = os.getenv("GOK_HEDGING", "false").lower() == "true"
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.05"))  # max extra requests, share of all requests
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.5"))
+HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", "5"))
 
 #  Working hours, no env-vars, using defaults
 WORKING_HOURS = os.getenv("WORKING_HOURS", "7,22")  # 7 AM to 10 PM
+# pre-warm before working hours: connections, imaging workers and the most requested verdicts
+PREWARM_LEAD_MINUTES = int(os.getenv("PREWARM_LEAD_MINUTES", "10"))
+PREWARM_DAYS = int(os.getenv("PREWARM_DAYS", "3"))
+PREWARM_BARCODES = int(os.getenv("PREWARM_BARCODES", "50"))
+PREWARM_THREADS = int(os.getenv("PREWARM_THREADS", "4"))
+# optional local product index (see utils/product_index.py), off unless a path is set
+PRODUCT_INDEX_PATH = os.getenv("PRODUCT_INDEX_PATH", "")
+PRODUCT_INDEX_SYNC_SECONDS = int(os.getenv("PRODUCT_INDEX_SYNC_SECONDS", "3600"))
+PRODUCT_INDEX_SYNC_BARCODES = int(os.getenv("PRODUCT_INDEX_SYNC_BARCODES", "500"))  # hot barcodes per sync
+PRODUCT_INDEX_REFRESH_HOURS = int(os.getenv("PRODUCT_INDEX_REFRESH_HOURS", "24"))
 MATES = set(phone.strip() for phone in os.getenv('MATES', '').split(','))
 
 RENDER_GIT_COMMIT = os.getenv("RENDER_GIT_COMMIT", "unknown/dev")
@@ -1,95 +1,275 @@
 import io
 import html
+import hashlib
 import time
 import random
 import requests
-from PIL import Image, ImageEnhance
-from pyzbar.pyzbar import decode
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from config import (
     logger,
     GOK_API_TOKEN,
     WHITE_IP,
+    GOK_HEDGING,
+    VERDICT_STALE_GRACE,
+    VERDICT_STALE_MAX,
+    MULTI_BARCODE_LIMIT,
+    LOCALIZE_MIN_SIDE,
+    STAGE_BUDGETS,
 )
 from utils.texts import TEXTS, GOK_STATUS, LISTED_SIGNS
+from utils.admission import admission
+from utils.circuit_breaker import gok_breaker
+from utils.hedge import gok_hedger
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.decode_corpus import decode_corpus
+from utils.decode_tuner import decode_tuner
+from utils.gtin import canonical_key, variants
+from utils.metrics import metrics
+from utils.product_index import product_index
+from utils.shared_cache import shared_verdicts
+from utils.verdict_cache import verdicts, image_barcodes, requested_barcodes, not_found, unknown_barcodes
 
 FOOD_BARCODES = {"EAN13", "EAN8"}  # UPC-A is normalized to GTIN-13 by adding a leading '0' (GS1 standard).
 
 STOP_STATUSES = {GOK_STATUS['not_kosher'], GOK_STATUS['unknown']}
 
+SMART_RETRY_MAX_SLEEP = 25
 
-def extract_barcode_from_image(image: Image) -> list:
-    barcodes = decode(image)
-    if barcodes:
-        return barcodes
+STALENESS_BUCKETS = (60, 300, 900, 3600, 4 * 3600, 86400, 7 * 86400)  # seconds past the TTL
+revalidate_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="revalidate")
+_revalidating = set()
+_revalidating_lock = threading.Lock()
+
+
+def decode(image) -> list:
+    """ pyzbar decode. pyzbar/libzbar is imported on first use, it is a big part of the cold-start cost """
+    from pyzbar.pyzbar import decode as zbar_decode
+    return zbar_decode(image)
+
+
+def warm_imaging():
+    """ Imports Pillow and pyzbar/libzbar ahead of the first image, meant to run off the startup path """
+    from PIL import Image, ImageEnhance  # noqa: F401
+    from pyzbar import pyzbar  # noqa: F401
+    from core import localize  # noqa: F401 - numpy
+
+
+def decode_localized(image: "Image.Image") -> list:
+    """ Barcodes found in the localized crops of a large photo, deduplicated. [] if none (or no numpy) """
+    from core.localize import localize
+
+    found = {}
+    for crop in localize(image, max_crops=MULTI_BARCODE_LIMIT):
+        for barcode in decode(crop):
+            found.setdefault((barcode.type, barcode.data), barcode)
+    if found:
+        metrics.incr("decode.localized")
+    return list(found.values())
+
+
+def decode_contrast(image: "Image.Image") -> list:
+    from PIL import ImageEnhance
 
     enhancer = ImageEnhance.Contrast(image)
     contrast_image = enhancer.enhance(10)
     return decode(contrast_image)
 
 
-def check_barcode(media_url: str, text=False) -> str:
+# looked up at call time (not bound here), so each can be replaced/patched on its own
+DECODE_STRATEGIES = {
+    "localized": lambda image: decode_localized(image),
+    "plain": lambda image: decode(image),
+    "contrast": lambda image: decode_contrast(image),
+}
+
+
+def extract_barcode_from_image(image: "Image.Image", trace: dict = None) -> list:
+    """
+    Tries the decode strategies until one finds a barcode, in the order decode_tuner learned for
+    this kind of image. Default order: localized crops (large photos only), plain, contrast x10.
+    `trace`, if given, is filled with the context, the strategies tried and the winner.
+    """
+    large = max(image.size) >= LOCALIZE_MIN_SIDE
+    context = f"{'large' if large else 'small'}:{(image.format or 'unknown').lower()}"
+    # zbar time grows with the pixel count - on large photos the small crops are the default first try
+    strategies = [name for name in DECODE_STRATEGIES if large or name != "localized"]
+
+    tried = []
+    if trace is not None:
+        trace.update(context=context, tried=tried, winner=None)
+    for name in decode_tuner.order(context, strategies):
+        tried.append(name)
+        if barcodes := DECODE_STRATEGIES[name](image):
+            if trace is not None:
+                trace["winner"] = name
+            decode_tuner.record(context, tried, winner=name)
+            metrics.observe("decode.attempts", len(tried), buckets=(1, 2, 3))
+            return barcodes
+    decode_tuner.record(context, tried)
+    metrics.observe("decode.attempts", len(tried), buckets=(1, 2, 3))
+    return []
+
+
+def check_barcode(media_url: str, text=False, shed_duplicates=False, deadline: Deadline = None) -> str:
     """
     Check barcode from image URL or text input.
     return response string.
+    With shed_duplicates (group images), a barcode looked up moments ago is not asked again while
+    the bot is overloaded - only the barcode line is returned.
+    Raises DeadlineExceeded when the message's deadline runs out between stages.
     """
+    deadline = deadline or Deadline()
     if text:
         logger.info(f"Barcode (text) detected: {media_url}")
         return (
             TEXTS["barcode"]["prefix"] + f"{media_url}\n"
-            + ask_gok(media_url)
+            + ask_gok(media_url, deadline=deadline)
         )
 
     try:
-        response = requests.get(media_url)
-        response.raise_for_status()
-
-        image_bytes = io.BytesIO(response.content)
-        image = Image.open(image_bytes)
-
-        barcodes = extract_barcode_from_image(image)
-
-        if not barcodes:
-            return TEXTS["errors"]["barcode_not_found"]
+        from PIL import Image
 
-        # only EAN** is supported
-        food_barcodes = [b for b in barcodes if b.type in FOOD_BARCODES]
-        if not food_barcodes:
-            logger.debug(f"Not EAN barcodes found: {barcodes}")
-            return TEXTS["errors"]["unsupported_barcode"]
-
-        if len(food_barcodes) > 1:
-            logger.info(f"{len(food_barcodes)} barcodes detected! Invalid image")
-            logger.debug(f"{food_barcodes}")
-            return TEXTS["errors"]["image_processing"]
+        response = requests.get(media_url, timeout=deadline.timeout("download"))
+        response.raise_for_status()
 
-        barcode = food_barcodes[0]
-        barcode_data = barcode.data.decode("utf-8")
-        barcode_type = barcode.type
-        logger.info(f"Barcode ({barcode_type}) detected: {barcode_data}")
+        # reposted/forwarded images usually carry the same bytes - skip decoding them again
+        digest = hashlib.sha1(response.content).hexdigest()
+        if barcode_data := image_barcodes.get(digest):
+            logger.info(f"Barcode (known image) detected: {barcode_data}")
+        else:
+            image_bytes = io.BytesIO(response.content)
+            image = Image.open(image_bytes)
+
+            # open() only reads the header; decoding holds the bitmap plus one enhanced copy (~4 bytes/pixel)
+            trace = {"source_size": list(image.size), "format": image.format}
+            with admission.stage("decode", memory_bytes=image.width * image.height * 4):
+                deadline.check("decode")  # zbar cannot be interrupted - only start it with time left
+                barcodes = extract_barcode_from_image(image, trace)
+                # only EAN** is supported
+                food_barcodes = [b for b in barcodes if b.type in FOOD_BARCODES]
+                trace["barcodes"] = [f"{b.type}:{b.data.decode('utf-8', 'replace')}" for b in barcodes]
+                decode_corpus.sample(image, trace, failed=not food_barcodes)
+
+            if not barcodes:
+                return TEXTS["errors"]["barcode_not_found"]
+
+            if not food_barcodes:
+                logger.debug(f"Not EAN barcodes found: {barcodes}")
+                return TEXTS["errors"]["unsupported_barcode"]
+
+            # a shelf photo - the same product may be decoded more than once
+            barcode_data = ",".join(dict.fromkeys(canonical_key(b.data.decode("utf-8")) for b in food_barcodes))
+            logger.info(f"Barcode ({'/'.join(sorted({b.type for b in food_barcodes}))}) detected: {barcode_data}")
+            image_barcodes.put(digest, barcode_data)
+
+        if "," in barcode_data:
+            return check_barcodes(barcode_data.split(","), shed_duplicates=shed_duplicates, deadline=deadline)
+
+        if shed_duplicates and admission.shed_duplicate_group_barcode(barcode_data):
+            logger.info(f"Overloaded - skipping GOK for just asked barcode {barcode_data}")
+            return TEXTS["barcode"]["prefix"] + f"{barcode_data}\n"
 
         return (
             TEXTS["barcode"]["prefix"] + f"{barcode_data}\n"
-            + ask_gok(barcode_data)
+            + ask_gok(barcode_data, deadline=deadline)
         )
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.exception("error while reading BarCode")
         return TEXTS["errors"]["exception"]
 
 
-def ask_gok(barcode_data: str, retry_seconds=0):
-    is_startswith_zero = barcode_data.startswith('0')
-    z_add = ''
-    queries = [{"barcode": f"{barcode_data}"}]
+def check_barcodes(barcodes: list, shed_duplicates=False, deadline: Deadline = None) -> str:
+    """
+    One reply for several barcodes (shelf photo, pasted list), looked up with a single GOK request.
+    At most MULTI_BARCODE_LIMIT are checked. With shed_duplicates, barcodes asked moments ago are only listed.
+    """
+    barcodes = list(dict.fromkeys(barcodes))
+    checked = barcodes[:MULTI_BARCODE_LIMIT]
+    shed = {b for b in checked if shed_duplicates and admission.shed_duplicate_group_barcode(b)}
+    replies = ask_gok_batch([b for b in checked if b not in shed], deadline=deadline)
+    logger.info(f"{len(barcodes)} barcodes detected, {len(replies)} asked: {checked}")
+    parts = [TEXTS["barcode"]["prefix"] + f"{barcode}\n" + replies.get(barcode, '') for barcode in checked]
+    if len(barcodes) > MULTI_BARCODE_LIMIT:
+        parts.append(TEXTS["barcode"]["truncated"].format(limit=MULTI_BARCODE_LIMIT))
+    return "\n\n".join(part.rstrip("\n") for part in parts)
+
+
+def refresh_verdict(barcode_data: str) -> str:
+    """
+    Asks GOK again even if the verdict is cached or indexed (morning pre-warm, product index sync, revalidation).
+    The cached verdict is kept until replaced, so it can still be served stale if GOK fails.
+    Bounded to one GOK call - a failure is left to the next refresh, no smart_retry sleep.
+    """
+    deadline = Deadline(time.time() + min(STAGE_BUDGETS["gok"], SMART_RETRY_MAX_SLEEP))  # too short to retry
+    return ask_gok(barcode_data, track=False, deadline=deadline, use_cache=False)
 
-    if barcode_data.startswith('0'):
-        num_leading_zeros = len(barcode_data) - len(barcode_data.lstrip('0'))
-        for i in range(1, num_leading_zeros + 1):
-            queries.append({"barcode": barcode_data[i:]})
-            z_add += f"{barcode_data[i:]}\n"
-        logger.debug(f"Barcode starts with '0': {queries}")
 
+def _revalidate(barcode_data: str, key: str) -> None:
+    """ Refreshes a stale verdict in the background, at most one refresh per barcode at a time """
+    with _revalidating_lock:
+        if key in _revalidating:
+            return
+        _revalidating.add(key)
+
+    def _refresh():
+        try:
+            refresh_verdict(barcode_data)
+        finally:
+            with _revalidating_lock:
+                _revalidating.discard(key)
+
+    revalidate_pool.submit(_refresh)
+
+
+def _serve_stale(key: str, max_stale: int, reason: str) -> str:
+    """ The stale verdict of `key` if not older than `max_stale` past the TTL, '' otherwise """
+    if (stale := verdicts.get_stale(key, max_stale)) is None:
+        return ''
+    reply, staleness = stale
+    metrics.incr(f"verdict.stale.{reason}")
+    metrics.observe("verdict.staleness", staleness, buckets=STALENESS_BUCKETS)
+    logger.info(f"{key} stale verdict served ({reason}, {staleness:.0f}s past TTL)")
+    return reply
+
+
+def _cached_verdict(barcode_data: str, key: str, track: bool, store: bool = True) -> str:
+    """
+    A verdict known locally - cache, stale within grace (refreshed in the background), index or not-found.
+    Without store, the caches are only read: no hits counted, nothing promoted or revalidated (bulk checks).
+    """
+    if (cached := verdicts.get(key) if store else verdicts.peek(key)) is not None:
+        logger.debug(f"{barcode_data} verdict served from cache")
+        return cached
+    if (shared := shared_verdicts.get_entry(key)) is not None:
+        logger.debug(f"{barcode_data} verdict served from the shared cache")
+        if store:
+            verdicts.put(key, shared[0], stored_at=shared[1])  # keeps its age - expires with the shared copy
+        return shared[0]
+    if store and (stale := _serve_stale(key, VERDICT_STALE_GRACE, "grace")):
+        _revalidate(barcode_data, key)
+        return stale
+    if (indexed := product_index.get(key)) is not None:
+        logger.debug(f"{barcode_data} verdict served from the product index")
+        metrics.incr("product_index.hit")
+        if store:
+            verdicts.put(key, indexed)
+        return indexed
+    if (cached := not_found.get(key) if store else not_found.peek(key)) is not None:
+        logger.debug(f"{barcode_data} not-found served from cache")
+        metrics.incr("gok.not_found.cached")
+        if track:
+            unknown_barcodes.add(key)
+        return cached
+    return ''
+
+
+def _post_gok(queries: list, timeout: float):
+    """ One products request (hedged if GOK_HEDGING). Raises on any failure """
     url = "https://www.zekasher.com/api/v1/products"
     payload = {
         "queries": queries,
@@ -104,27 +284,42 @@ def ask_gok(barcode_data: str, retry_seconds=0):
         "Referer": "https://kosher.global/"
     }
 
-    try:
-        response = requests.post(url, json=payload, headers=headers)
+    def _post():
+        with admission.stage("gok"):
+            response = requests.post(url, json=payload, headers=headers, timeout=timeout)
         response.raise_for_status()
+        return response
+
+    try:
+        response = gok_hedger.call(_post) if GOK_HEDGING else _post()
         response_list = response.json()
-    except Exception as e:
-        if retry_seconds == 0:
-            return smart_retry(barcode_data, e)
-        else:
-            logger.debug(f"request: {url} payload: {payload}")
-            logger.exception("Cannot get basic response from GOK")
-            return z_add + TEXTS["errors"]["gok_server_error"]
+    except Exception:
+        logger.debug(f"request: {url} payload: {payload}")
+        gok_breaker.record(False)
+        raise
+    gok_breaker.record(True)
+    return response_list
 
-    if not response_list:
+
+def _verdict_reply(barcode_data: str, key: str, products: list, track: bool, retry_seconds=0, store=True) -> str:
+    """ Reply for one barcode from the GOK products found for it. Final verdicts and not-found are cached (store) """
+    codes = variants(barcode_data)
+    z_add = "".join(f"{code}\n" for code in codes[1:])
+    if not products:
         logger.debug(f"{barcode_data} Doesn't exist in GOK system")
-        return z_add + TEXTS["errors"]["gok_not_found"]
+        reply = z_add + TEXTS["errors"]["gok_not_found"]
+        if store:
+            not_found.put(key, reply)
+            verdicts.pop(key)  # a verdict GOK withdrew is not served, nor re-indexed by the sync
+        if track:
+            unknown_barcodes.add(key)
+        return reply
 
     product_info = next((
-        p for p in response_list
+        p for p in products
         if next(iter(p.get('kashrutTypes', [])), 'N/A') in STOP_STATUSES
            or p.get('kashrutCerts')
-    ), response_list[0] if response_list else None)
+    ), products[0])
 
     try:
         logger.debug(f'retry after {retry_seconds} seconds') if retry_seconds else None
@@ -133,38 +328,140 @@ def ask_gok(barcode_data: str, retry_seconds=0):
         product_name = html.unescape(product_info.get('name', '')) + '\n'
         status = product_info['status']
 
-        if is_startswith_zero:
+        if barcode_data.startswith('0'):
             z_add = TEXTS['barcode']['edited'] + product_info.get('barcode') + '\n'
 
         if status != GOK_STATUS['confirmed'] or not product_info.get('kashrutTypes'):
             logger.debug(f"Product status: {status}")
+            # not cached - the rabbi may confirm it any minute. Nor is the verdict it had before
+            if store:
+                verdicts.pop(key)
             return z_add + product_name + TEXTS["product_status"]["in_review"]
 
         kashrut_type = product_info['kashrutTypes'][0]
         if kashrut_type == GOK_STATUS['not_kosher']:
-            return z_add + product_name + TEXTS["product_status"]["not_kosher"]
+            reply = z_add + product_name + TEXTS["product_status"]["not_kosher"]
+        elif kashrut_type == GOK_STATUS['unknown']:
+            reply = z_add + product_name + TEXTS["product_status"]["unknown"]
+        else:
+            logger.debug("Kosher")
+            cert = product_info['kashrutCerts'][0] if product_info['kashrutCerts'] else ''
+            reply = z_add + product_name + TEXTS["product_status"]["kosher_template"].format(
+                kashrut_type=kashrut_type,
+                cert=cert,
+            )
+        if store:
+            verdicts.put(key, reply)
+            shared_verdicts.put(key, reply)  # the other workers of this machine
+        return reply
+
+    except Exception:
+        logger.debug(f"products: {products}")
+        logger.exception("200 OK for asking GOK, But error for parsing")
+        return TEXTS["errors"]["internal_logic_error"]
 
-        if kashrut_type == GOK_STATUS['unknown']:
-            return z_add + product_name + TEXTS["product_status"]["unknown"]
 
-        logger.debug("Kosher")
-        cert = product_info['kashrutCerts'][0] if product_info['kashrutCerts'] else ''
-        return z_add + product_name + TEXTS["product_status"]["kosher_template"].format(
-            kashrut_type=kashrut_type,
-            cert=cert,
-        )
+def ask_gok(barcode_data: str, retry_seconds=0, track=True, deadline: Deadline = None, use_cache=True):
+    key = canonical_key(barcode_data)  # UPC-A and its EAN-13 form share one verdict
+    if track and not retry_seconds:
+        requested_barcodes.add(key)
+    if use_cache and (cached := _cached_verdict(barcode_data, key, track and not retry_seconds)):
+        return cached
+
+    codes = variants(barcode_data)
+    queries = [{"barcode": code} for code in codes]
+    z_add = "".join(f"{code}\n" for code in codes[1:])
+    if barcode_data.startswith('0'):
+        logger.debug(f"Barcode starts with '0': {queries}")
 
+    deadline = deadline or Deadline()
+    timeout = deadline.timeout("gok")
+    if not gok_breaker.allow():
+        logger.warning(f"GOK circuit open - {barcode_data} not queried")
+        return _serve_stale(key, VERDICT_STALE_MAX, "fallback") or z_add + TEXTS["errors"]["gok_server_error"]
+
+    try:
+        response_list = _post_gok(queries, timeout)
     except Exception as e:
-        logger.debug(f"request: {url} payload: {payload}")
-        logger.debug(f"response: {response.json()}")
-        logger.exception("200 OK for asking GOK, But error for parsing")
-        return TEXTS["errors"]["internal_logic_error"]
+        # a verdict we knew beats waiting for a retry
+        if stale := _serve_stale(key, VERDICT_STALE_MAX, "fallback"):
+            return stale
+        # retry only if the reply is still worth something after the longest sleep
+        if retry_seconds == 0 and deadline.remaining() > SMART_RETRY_MAX_SLEEP:
+            return smart_retry(barcode_data, e, deadline)
+        else:
+            logger.exception("Cannot get basic response from GOK")
+            return z_add + TEXTS["errors"]["gok_server_error"]
+
+    return _verdict_reply(barcode_data, key, response_list, track, retry_seconds)
+
+
+def ask_gok_batch(barcodes: list, deadline: Deadline = None, track=True, store=True) -> dict:
+    """
+    Verdicts for several barcodes: the ones known locally are answered from the caches,
+    all the rest (with their leading-zero variants) are asked in one GOK request.
+    Products are matched back to barcodes by their 'barcode' field; a barcode left without a match is
+    not-found (cached), or gets the unmatched products when it is the only one left (another form).
+    No smart_retry - a failed batch answers gok_server_error (or a stale verdict) per barcode.
+    Without track, the lookups stay out of the hot and unknown barcode counts; without store, the caches
+    are only read and the answers not cached (admin bulk checks leave the live hot set alone).
+    """
+    replies, missing = {}, {}
+    for barcode_data in barcodes:
+        key = canonical_key(barcode_data)
+        if track:
+            requested_barcodes.add(key)
+        replies[barcode_data] = _cached_verdict(barcode_data, key, track, store)
+        if not replies[barcode_data]:
+            missing[barcode_data] = key
+    if not missing:
+        return replies
+
+    deadline = deadline or Deadline()
+    timeout = deadline.timeout("gok")
+    queries = [{"barcode": code} for barcode_data in missing for code in variants(barcode_data)]
+    try:
+        if not gok_breaker.allow():
+            raise ConnectionError("GOK circuit open")
+        products = [p for p in _post_gok(queries, timeout) if p]
+    except Exception:
+        logger.exception(f"Cannot get batch response from GOK for {len(missing)} barcodes")
+        for barcode_data, key in missing.items():
+            replies[barcode_data] = (
+                _serve_stale(key, VERDICT_STALE_MAX, "fallback")
+                or "".join(f"{code}\n" for code in variants(barcode_data)[1:]) + TEXTS["errors"]["gok_server_error"]
+            )
+        return replies
+
+    leftovers = {}
+    matched = set()
+    for barcode_data, key in missing.items():
+        codes = set(variants(barcode_data))
+        if found := [p for p in products if str(p.get('barcode', '')) in codes]:
+            matched.update(id(p) for p in found)
+            replies[barcode_data] = _verdict_reply(barcode_data, key, found, track, store=store)
+        else:
+            leftovers[barcode_data] = key
+    # all variants of a leftover were asked - without a product in the answer, it is not in GOK
+    unmatched = [p for p in products if id(p) not in matched]
+    for barcode_data, key in leftovers.items():
+        if unmatched and len(leftovers) == 1:
+            # GOK answered it under another form
+            replies[barcode_data] = _verdict_reply(barcode_data, key, unmatched, track, store=store)
+        elif unmatched:
+            logger.warning(f"{barcode_data} unmatched in a batch with {len(unmatched)} unattributed products")
+            replies[barcode_data] = (  # not cached - one of those products may be it
+                "".join(f"{code}\n" for code in variants(barcode_data)[1:]) + TEXTS["errors"]["gok_not_found"]
+            )
+        else:
+            replies[barcode_data] = _verdict_reply(barcode_data, key, [], track, store=store)
+    return replies
 
 
-def smart_retry(barcode_data, e):
-    sleep_time = random.randint(9, 25)
+def smart_retry(barcode_data, e, deadline: Deadline = None):
+    sleep_time = random.randint(9, SMART_RETRY_MAX_SLEEP)
     logger.debug(f"retrying after {sleep_time} seconds. due to exception: {e}")
     time.sleep(sleep_time)
-    return ask_gok(barcode_data, retry_seconds=sleep_time)
+    return ask_gok(barcode_data, retry_seconds=sleep_time, deadline=deadline)
 
 
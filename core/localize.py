@@ -0,0 +1,126 @@
+"""
+Finds likely 1-D barcode regions in a photo so zbar only scans small crops.
+
+On a downscaled grayscale copy: the structure tensor of the gradients gives, per pixel,
+the energy and coherence of a single dominant orientation - a barcode is a patch of strong,
+parallel edges. Cells with both are closed morphologically into regions; the best regions
+are cropped from the full-size image, rotated so the bars are vertical, and binarized with
+a local-mean threshold.
+"""
+from typing import List
+
+from config import logger
+
+try:
+    import numpy as np
+except ImportError:  # optional - without numpy only the full-frame scan runs
+    np = None
+
+WORK_SIDE = 640  # longest side of the analysed copy
+CELL = 8  # pixels per grid cell (of the analysed copy)
+MIN_COHERENCE = 0.6
+MIN_REGION_CELLS = 6
+PADDING = 0.15  # of the region size, barcodes need their quiet zone
+
+
+def _box_sum(a, radius_y: int, radius_x: int):
+    """ Sum over a (2*ry+1) x (2*rx+1) window, via an integral image, same shape as `a` """
+    padded = np.pad(a, ((radius_y + 1, radius_y), (radius_x + 1, radius_x)), mode="edge").cumsum(0).cumsum(1)
+    h, w = a.shape
+    ky, kx = 2 * radius_y + 1, 2 * radius_x + 1
+    return padded[ky:ky + h, kx:kx + w] - padded[:h, kx:kx + w] - padded[ky:ky + h, :w] + padded[:h, :w]
+
+
+def _close(mask, radius: int = 1):
+    """ Morphological closing (dilate, then erode) with a square kernel """
+    area = (2 * radius + 1) ** 2
+    dilated = _box_sum(mask.astype(np.float32), radius, radius) > 0
+    return _box_sum(dilated.astype(np.float32), radius, radius) >= area - 0.5
+
+
+def _regions(mask) -> list:
+    """ 4-connected components of a small boolean grid, as lists of (row, col) """
+    seen = np.zeros_like(mask, dtype=bool)
+    regions = []
+    for start in zip(*np.nonzero(mask)):
+        if seen[start]:
+            continue
+        seen[start] = True
+        stack, cells = [start], []
+        while stack:
+            r, c = stack.pop()
+            cells.append((r, c))
+            for nr, nc in ((r + 1, c), (r - 1, c), (r, c + 1), (r, c - 1)):
+                if 0 <= nr < mask.shape[0] and 0 <= nc < mask.shape[1] and mask[nr, nc] and not seen[nr, nc]:
+                    seen[nr, nc] = True
+                    stack.append((nr, nc))
+        regions.append(cells)
+    return regions
+
+
+def _binarize(crop: "Image.Image", offset: float = 8) -> "Image.Image":
+    from PIL import Image
+
+    a = np.asarray(crop, dtype=np.float32)
+    radius = max(4, min(a.shape) // 16)
+    mean = _box_sum(a, radius, radius) / (2 * radius + 1) ** 2
+    return Image.fromarray(np.where(a > mean - offset, 255, 0).astype(np.uint8), mode="L")
+
+
+def localize(image: "Image.Image", max_crops: int = 3) -> List["Image.Image"]:
+    """ Up to `max_crops` deskewed, binarized crops of likely barcodes, best first. [] without numpy """
+    if np is None:
+        return []
+    from PIL import Image
+
+    gray = image.convert("L")
+    scale = max(gray.size) / WORK_SIDE
+    small = gray.reduce(max(1, int(scale))) if scale > 1 else gray
+    scale = gray.width / small.width
+    a = np.asarray(small, dtype=np.float32)
+    h, w = (a.shape[0] // CELL) * CELL, (a.shape[1] // CELL) * CELL
+    if h < 4 * CELL or w < 4 * CELL:
+        return []
+    a = a[:h, :w]
+
+    gx = np.zeros_like(a)
+    gy = np.zeros_like(a)
+    gx[:, 1:-1] = a[:, 2:] - a[:, :-2]
+    gy[1:-1, :] = a[2:, :] - a[:-2, :]
+
+    def cells(m):
+        return m.reshape(h // CELL, CELL, w // CELL, CELL).sum(axis=(1, 3))
+
+    # structure tensor summed per cell
+    jxx, jyy, jxy = cells(gx * gx), cells(gy * gy), cells(gx * gy)
+    energy = jxx + jyy
+    coherence = np.sqrt((jxx - jyy) ** 2 + 4 * jxy ** 2) / (energy + 1e-6)
+
+    mask = coherence > MIN_COHERENCE
+    mask &= energy > np.percentile(energy, 75)
+    mask = _close(mask)
+
+    candidates = []
+    for region in _regions(mask):
+        if len(region) < MIN_REGION_CELLS:
+            continue
+        rows, cols = np.array(region).T
+        candidates.append((energy[rows, cols].sum(), rows, cols))
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+    crops = []
+    for _, rows, cols in candidates[:max_crops]:
+        # orientation of the region's summed tensor - dominated by its strongest edges
+        theta = 0.5 * np.arctan2(2 * jxy[rows, cols].sum(), (jxx[rows, cols] - jyy[rows, cols]).sum())
+        top, bottom = rows.min() * CELL * scale, (rows.max() + 1) * CELL * scale
+        left, right = cols.min() * CELL * scale, (cols.max() + 1) * CELL * scale
+        pad_y, pad_x = (bottom - top) * PADDING, (right - left) * PADDING
+        box = (
+            int(max(0, left - pad_x)), int(max(0, top - pad_y)),
+            int(min(gray.width, right + pad_x)), int(min(gray.height, bottom + pad_y)),
+        )
+        # theta is the gradient direction (0 = vertical bars), y pointing down
+        crop = gray.crop(box).rotate(np.degrees(theta), resample=Image.BICUBIC, expand=True, fillcolor=255)
+        crops.append(_binarize(crop))
+    logger.debug(f"Localized {len(crops)} barcode candidates out of {len(candidates)} regions")
+    return crops
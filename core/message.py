@@ -1,11 +1,38 @@
 import requests
 import asyncio
+from time import time
 
-from config import GREEN_ID, GREEN_TOKEN, ENVIRONMENT, logger
+from config import GREEN_ID, GREEN_TOKEN, ENVIRONMENT, logger, BREAKER_OPEN_SECONDS
+from utils.admission import admission
+from utils.circuit_breaker import green_breaker
+from utils.deadline import Deadline, DeadlineExceeded
 from utils.redis_manager import db
 from utils.texts import ADMIN_SIGNS
 
-async def green_send_message(chat_id: str, text: str, reply_to: str = None):
+DEFERRED_MAX_AGE = 3600  # messages without a deadline (admin reports) are kept deferred up to an hour
+
+
+async def green_send_message(chat_id: str, text: str, reply_to: str = None, deadline: Deadline = None):
+    """
+    Sends `text` to `chat_id`. A reply whose deadline has passed is dropped, not sent late.
+    While the Green circuit is open the message is deferred to Redis and sent by deferred_sender_loop.
+    Returns True if the message was sent to Green, False if it was dropped or deferred.
+    """
+    deadline = deadline or Deadline()
+    try:
+        timeout = deadline.timeout("send")
+    except DeadlineExceeded:
+        logger.info(f"Reply to {chat_id} dropped - deadline exceeded")
+        return False
+    if not green_breaker.allow():
+        logger.warning(f"Green circuit open - reply to {chat_id} deferred")
+        await db.push_deferred("green", {
+            "chat_id": chat_id,
+            "text": text,
+            "reply_to": reply_to,
+            "expires_at": deadline.expires_at or time() + DEFERRED_MAX_AGE,
+        })
+        return False
     prefix = "dev: \n" if ENVIRONMENT == "DEV" else ""
     url = f"https://api.green-api.com/waInstance{GREEN_ID}/sendMessage/{GREEN_TOKEN}"
     payload = {
@@ -18,9 +45,15 @@ async def green_send_message(chat_id: str, text: str, reply_to: str = None):
     logger.info(f"Response: {payload}")
 
     def _send():
-        return requests.post(url, json=payload, timeout=30)
+        with admission.stage("send"):
+            return requests.post(url, json=payload, timeout=timeout)
 
-    response = await asyncio.to_thread(_send)
+    try:
+        response = await asyncio.to_thread(_send)
+    except Exception:
+        green_breaker.record(False)
+        raise
+    green_breaker.record(response.status_code < 500)  # 4xx is our request, not Green being down
 
     if not response.ok:
         logger.error(f"Bad response from Green - payload:{payload} - response:{response}")
@@ -28,11 +61,45 @@ async def green_send_message(chat_id: str, text: str, reply_to: str = None):
     logger.info(f"status_code: {response.status_code}, response: {response.text}")
     if text[0] not in ADMIN_SIGNS:
         await db.track_sent_message(is_group=chat_id.endswith("@g.us"))
+    return True
+
+
+async def send_deferred_messages(db) -> int:
+    """
+    Sends deferred messages while the Green circuit lets calls through. Returns how many were sent.
+    Stops at the first message deferred again (half-open with the probe taken by another send).
+    """
+    sent = 0
+    while green_breaker.state != "open" and (item := await db.pop_deferred("green")):
+        if item["expires_at"] <= time():
+            logger.info(f"Deferred reply to {item['chat_id']} dropped - deadline exceeded")
+            continue
+        try:
+            delivered = await green_send_message(
+                item["chat_id"], item["text"], item["reply_to"], Deadline(item["expires_at"])
+            )
+        except Exception:
+            await db.push_deferred("green", item)  # the probe failed - the circuit is open again
+            raise
+        if not delivered:
+            break  # deferred again (or just expired) - next round
+        sent += 1
+    return sent
+
+
+async def deferred_sender_loop(db) -> None:
+    while True:
+        await asyncio.sleep(BREAKER_OPEN_SECONDS)
+        try:
+            if sent := await send_deferred_messages(db):
+                logger.info(f"Sent {sent} deferred messages")
+        except Exception as e:
+            logger.error(f"Failed to send deferred messages: {e}")
 
 
 def is_green_available():
     url = f"https://api.green-api.com/waInstance{GREEN_ID}/getStatusInstance/{GREEN_TOKEN}"
-    response = requests.get(url)
+    response = requests.get(url, timeout=10)
     if response.ok:
         status_instance = response.json().get('statusInstance', 'offline')
         logger.info(f"Green API statusInstance: {status_instance}")
@@ -1,15 +1,43 @@
+from utils.startup import startup_timings, mark, timed  # first import: marks when the app started loading
+
+import json
+import asyncio
 from time import time
+from datetime import date, datetime
+from typing import Optional
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request, BackgroundTasks, HTTPException, Depends, status
+from fastapi import FastAPI, Request, HTTPException, Depends, UploadFile, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import APIKeyHeader
 
-from config import logger, ADMIN_SECRET_TOKEN, MATES, ADMIN_CHAT_ID
-from services.admin import update_admin_startup, update_admin_shutdown
-from services.reports import report_version_update, update_weekly_status
+from config import logger, ADMIN_SECRET_TOKEN, MATES, ADMIN_CHAT_ID, tz_info, ADMISSION_RETRY_AFTER
+from services.admin import update_admin_startup, update_admin_shutdown, start_purge_job, running_purge_job, PURGE_JOBS
+from services.bulk_check import parse_upload, bulk_check
+from services.reports import report_version_update, update_weekly_status, report_unknown_barcodes
+from core.engine import warm_imaging
+from core.message import deferred_sender_loop
 from services.group import group_handler
+from services.prewarm import prewarm, prewarm_loop
+from services.product_sync import sync_product_index, product_sync_loop
 from services.personal_chat import personal_chat_handler
+from utils.admission import admission, ADMITTED, RETRY
+from utils.circuit_breaker import BREAKERS, breaker_sync_loop
+from utils.decode_tuner import decode_tuner, decode_stats_loop
+from utils.hedge import gok_hedger
+from utils.loop_monitor import loop_monitor
+from utils.metrics import metrics
+from utils.product_index import product_index
 from utils.redis_manager import db
+from utils.scheduler import scheduler
 from utils.thin_log import thin_log
+from utils.webhook_recorder import webhook_recorder
+from utils.verdict_cache import (
+    load_warm_snapshot,
+    save_warm_snapshot,
+    warm_snapshot_loop,
+    flush_requested_barcodes,
+    UNKNOWN_BARCODES_NAME,
+)
 
 api_key_header = APIKeyHeader(name="X-Admin-Token")
 
@@ -23,16 +51,53 @@ async def verify_admin(api_key: str = Depends(api_key_header)):
     return api_key
 
 
+async def background_startup():
+    """ Startup steps that the first webhook does not depend on, run concurrently after serving starts """
+    await asyncio.gather(
+        timed("imaging_warmup", asyncio.to_thread(warm_imaging)),
+        timed("warm_cache_load", load_warm_snapshot(db)),
+        timed("admin_startup", update_admin_startup()),
+        timed("version_report", report_version_update(db)),
+    )
+    mark("background_done")
+    logger.info(f"Startup timings: {startup_timings}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Startup/shutdown lifecycle: connect Redis and run admin/report updates."""
+    """Startup/shutdown lifecycle: connect Redis, then run warm-up and admin/report updates in the background."""
+    mark("imports")
     logger.info("🟢🟢🟢 Active")
-    await db.connect()
-    await update_admin_startup()
-    await report_version_update(db)
+    await timed("redis_connect", db.connect(), required=True)
+    # one EXISTS normally; must precede the first webhook so no counter is created before the index is seeded
+    await timed("key_index_seed", db.seed_key_index(), required=True)
+    scheduler.start()
+    loop_monitor.start()
+    startup_task = asyncio.create_task(background_startup())
+    loops = [
+        asyncio.create_task(loop(db))
+        for loop in (
+            warm_snapshot_loop,
+            prewarm_loop,
+            breaker_sync_loop,
+            deferred_sender_loop,
+            product_sync_loop,
+            decode_stats_loop,
+        )
+    ]
+    mark("ready")
     yield
+    for task in loops:
+        task.cancel()
+    await scheduler.stop()
+    await loop_monitor.stop()
+    await asyncio.to_thread(webhook_recorder.close)
+    if not startup_task.done():
+        startup_task.cancel()
     if db.client:
         logger.info("🔴🔴🔴 Inactive")
+        await save_warm_snapshot(db)
+        await flush_requested_barcodes(db)
         await update_admin_shutdown(db)
         await db.client.close()
         logger.info("Redis connection closed")
@@ -52,7 +117,36 @@ async def redis_health():
 async def health_check(request: Request):
     client_ip = request.client.host or "unknown"
     logger.debug(f"health_check from {client_ip}")
-    return {"status": "ok", "ip": client_ip, "time": f"{time()}"}
+    return {
+        "status": "ok",
+        "ip": client_ip,
+        "time": f"{time()}",
+        "breakers": {breaker.name: breaker.stats() for breaker in BREAKERS},
+    }
+
+
+@app.get("/health/startup", tags=["system"])
+async def startup_health():
+    """ Seconds since the app started loading for each startup milestone, and duration of each step """
+    return startup_timings
+
+
+@app.get("/health/metrics", tags=["system"])
+async def metrics_health(admin: str = Depends(verify_admin)):
+    return {
+        "admission": admission.stats(),
+        "scheduler": scheduler.stats(),
+        "gok_hedge": gok_hedger.stats(),
+        "decode_strategies": decode_tuner.stats(),
+        "webhook_recorder": webhook_recorder.stats(),
+        **metrics.snapshot(),
+    }
+
+
+@app.get("/health/loop", tags=["system"])
+async def loop_health(top: int = 10, admin: str = Depends(verify_admin)):
+    """ Event-loop lag histogram and the call sites that blocked the loop longest (stack of the last stall each) """
+    return loop_monitor.stats(top)
 
 
 @app.get("/health/redis/count", tags=["system"])
@@ -73,8 +167,42 @@ async def redis_del_key(key: str = "nothing", admin: str = Depends(verify_admin)
     return {"deleted_keys": deleted}
 
 
+@app.delete("/redis/purge", tags=["system"])
+async def redis_purge_prefix(prefix: str = "", dry_run: bool = True, admin: str = Depends(verify_admin)):
+    """
+    Starts a background job removing all keys starting with `prefix` (dry_run only counts them).
+    Poll /redis/purge/{job_id} for progress.
+    """
+    if not db.client:
+        return {"error": "Redis client not connected"}
+    if not prefix or "*" in prefix:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid prefix provided"
+        )
+    if not dry_run and db.is_index_prefix(prefix):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="The key index (idx:*) cannot be purged"
+        )
+    if running := running_purge_job():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=f"Purge job {running['id']} is still running"
+        )
+    return start_purge_job(db, prefix, dry_run=dry_run)
+
+
+@app.get("/redis/purge/{job_id}", tags=["system"])
+async def redis_purge_status(job_id: str, admin: str = Depends(verify_admin)):
+    if job_id not in PURGE_JOBS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown job")
+    return PURGE_JOBS[job_id]
+
+
 @app.get("/health/redis/all", tags=["system"])
-async def redis_all_data(limit: int = 100, prefix: str = "co", admin: str = Depends(verify_admin)):
+async def redis_all_data(limit: int = 100, prefix: str = "co", cursor: int = 0, admin: str = Depends(verify_admin)):
+    """
+    Streams keys matching `prefix` as NDJSON, one {"key", "type", "value"} object per line.
+    The last line holds the SCAN `cursor` to pass back for the next page (0 = scan complete).
+    """
     if not db.client:
         return {"error": "Redis client not connected"}
     if not prefix or "*" in prefix:
@@ -82,32 +210,90 @@ async def redis_all_data(limit: int = 100, prefix: str = "co", admin: str = Depe
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid prefix provided"
         )
 
-    prefix_match = f"{prefix}*"
-    match_keys = {}
-    async for key in db.client.scan_iter(match=prefix_match, count=100):
-        if len(match_keys) >= limit:
-            break
-        value = await db.client.get(key)
-        match_keys[key] = value
+    async def ndjson_lines():
+        count = 0
+        next_cursor = cursor
+        async for next_cursor, entries in db.iter_prefix(prefix, cursor=cursor, limit=limit):
+            for key, key_type, value in entries:
+                count += 1
+                yield json.dumps({"key": key, "type": key_type, "value": value}, ensure_ascii=False) + "\n"
+        yield json.dumps({"prefix": prefix, "limit": limit, "count": count, "cursor": next_cursor}) + "\n"
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
+@app.post("/prewarm", tags=["system"])
+async def prewarm_now(admin: str = Depends(verify_admin)):
+    """ Wakes a stopped machine (any request does) and warms it - call it from a cron before working hours """
+    return await prewarm(db)
+
+
+@app.post("/product-index/sync", tags=["system"])
+async def product_index_sync(admin: str = Depends(verify_admin)):
+    """ Runs an incremental sync of the local product index now (PRODUCT_INDEX_PATH must be set) """
+    if not product_index.enabled:
+        return {"error": "Product index disabled"}
+    return await sync_product_index(db)
+
 
-    return {"prefix": prefix, "limit": limit, "count": len(match_keys), "data": dict(sorted(match_keys.items()))}
+@app.post("/barcodes/bulk-check", tags=["system"])
+async def barcodes_bulk_check(file: UploadFile, admin: str = Depends(verify_admin)):
+    """
+    Checks an uploaded barcode list - CSV (a barcode/ean/gtin column, or the column of barcodes)
+    or NDJSON ({"barcode": ...} or bare values per line). Streams NDJSON, a line per result as it completes.
+    """
+    items = parse_upload(await file.read(), file.filename or "")
+
+    async def ndjson_lines():
+        async for result in bulk_check(items):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
 
 
 @app.get("/stats", tags=["system"])
-async def get_stats(offset: int = 0, send_whatsapp: bool = False, admin: str = Depends(verify_admin)):
-    """Get statistics for current week and last week only (free tier limitation)"""
-    if offset > 1:
-        return {"error": "Offset too large"}
-    result = await db.get_weekly_stats(offset)
+async def get_stats(
+        offset: int = 0,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        granularity: str = "day",
+        send_whatsapp: bool = False,
+        admin: str = Depends(verify_admin),
+):
+    """
+    Statistics for the week `offset` weeks ago (default), or for start..end (inclusive)
+    broken into hour/day/week/month buckets. History is limited by STATS_RETENTION_DAYS.
+    """
+    if start:
+        try:
+            result = await db.get_stats_range(start, end or datetime.now(tz_info).date(), granularity)
+        except ValueError as e:
+            return {"error": str(e)}
+    else:
+        result = await db.get_weekly_stats(offset)
     if send_whatsapp:
         await update_weekly_status(result)
     return result
 
 
+@app.get("/reports/unknown", tags=["system"])
+async def unknown_barcodes_report(days: int = 14, limit: int = 50, send_whatsapp: bool = False,
+                                  admin: str = Depends(verify_admin)):
+    """ Barcodes GOK doesn't know, ranked by how often they were requested in the last `days` days """
+    await flush_requested_barcodes(db)
+    top = await db.top_daily_counts(UNKNOWN_BARCODES_NAME, days=days, limit=limit)
+    if send_whatsapp:
+        await report_unknown_barcodes(top, days)
+    return {"days": days, "unknown": [{"barcode": barcode, "requests": count} for barcode, count in top]}
+
+
 @app.post("/webhook-green", tags=["whatsapp"])
-async def green_webhook(request: Request, background_tasks: BackgroundTasks):
+async def green_webhook(request: Request):
     whatsapp_request = await request.json()
     thin_log(whatsapp_request)
+    webhook_recorder.record(whatsapp_request)
+    if "first_webhook" not in startup_timings:
+        mark("first_webhook")
 
     type_wh = whatsapp_request.get("typeWebhook")
     sender = whatsapp_request.get("senderData", {})
@@ -128,18 +314,47 @@ async def green_webhook(request: Request, background_tasks: BackgroundTasks):
     # Track that an incoming message was received
     await db.track_received_message(is_group=is_group, is_admin=is_mate)
 
+    type_message = whatsapp_request.get("messageData", {}).get("typeMessage")
     # Group chat handling
     if is_group:
         # Ignore messages from mates
         if is_mate:
             return {"status": "group_mate_ignored"}
         # Only handle image messages in groups
-        if whatsapp_request.get("messageData", {}).get("typeMessage") != "imageMessage":
+        if type_message != "imageMessage":
             return {"status": "group_non_image_ignored"}
-        # Process group message in background
-        background_tasks.add_task(group_handler, whatsapp_request)
-        return {"status": "group_acknowledged"}
+        work_class = "group_image"
+    else:
+        work_class = "private_image" if type_message == "imageMessage" else "private_text"
+
+    decision = admission.admit(work_class, whatsapp_request.get("timestamp"))
+    if decision == RETRY:
+        # Green redelivers it later (and it is counted as received again)
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)},
+            content={"status": "overloaded_retry"},
+        )
+    if decision != ADMITTED:
+        return {"status": f"{work_class}_shed"}
+
+    # Process message in background (by priority and fair share), releasing its admission slot when done
+    handler = group_handler if is_group else personal_chat_handler
+    try:
+        scheduler.submit(work_class, chat_id, lambda: run_admitted(work_class, handler, whatsapp_request))
+    except RuntimeError:
+        # shutting down - Green redelivers it to the next instance
+        admission.release(work_class)
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)},
+            content={"status": "shutting_down_retry"},
+        )
+    return {"status": "group_acknowledged" if is_group else "personal_acknowledged"}
+
 
-    # Personal chat handling
-    background_tasks.add_task(personal_chat_handler, whatsapp_request)
-    return {"status": "personal_acknowledged"}
+async def run_admitted(work_class: str, handler, whatsapp_request: dict):
+    try:
+        await handler(whatsapp_request)
+    finally:
+        admission.release(work_class)
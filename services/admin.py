@@ -1,5 +1,11 @@
 import socket
-from config import ADMIN_CHAT_ID, ENVIRONMENT, RENDER_GIT_COMMIT, SERVER_PROVIDER, APP_GIT_SHA, logger, tz_info
+import asyncio
+from time import time
+from uuid import uuid4
+from config import (
+    ADMIN_CHAT_ID, ENVIRONMENT, RENDER_GIT_COMMIT, SERVER_PROVIDER, APP_GIT_SHA, logger, tz_info,
+    PURGE_BATCH_SIZE, PURGE_PAUSE_MS,
+)
 from core.message import green_send_message, is_green_available
 from datetime import datetime
 import random
@@ -8,7 +14,7 @@ GIT_SHA = RENDER_GIT_COMMIT if SERVER_PROVIDER == "render" else APP_GIT_SHA
 
 
 async def update_admin_startup():
-    if is_green_available():
+    if await asyncio.to_thread(is_green_available):
         logger.info('Green API is available - sending startup message to admin.')
     else:
         logger.error('Green API is not available')
@@ -24,14 +30,59 @@ async def update_admin_startup():
 
 async def update_admin_shutdown(db):
     try:
-        # group_msg_last_24h_count = await db.count_keys('dup:msg-g:*')
-        # personal_msg_last_24h_count = await db.count_keys('dup:msg-p:*')
+        group_msg_last_24h_count = await db.count_keys('dup:msg-g:*')
+        personal_msg_last_24h_count = await db.count_keys('dup:msg-p:*')
         message = (
-            f"🔴Sleep ({ENVIRONMENT}-{SERVER_PROVIDER})"
-            # f"Last 24h processed messages:\n"
-            # f"  - Group: {group_msg_last_24h_count}\n"
-            # f"  - Personal: {personal_msg_last_24h_count}\n"
+            f"🔴Sleep ({ENVIRONMENT}-{SERVER_PROVIDER})\n"
+            f"Last 24h processed messages:\n"
+            f"  - Group: {group_msg_last_24h_count}\n"
+            f"  - Personal: {personal_msg_last_24h_count}\n"
         )
         await green_send_message(ADMIN_CHAT_ID, message)
     except:
         logger.exception("Failed to send shutdown message to admin.")
+
+
+PURGE_JOBS = {}  # job_id -> progress dict, kept for the process lifetime (jobs are rare)
+_purge_tasks = set()
+
+
+def running_purge_job():
+    return next((job for job in PURGE_JOBS.values() if job["state"] == "running"), None)
+
+
+def start_purge_job(db, prefix: str, dry_run: bool = True) -> dict:
+    """
+    Runs db.unlink_prefix in the background and returns its progress dict.
+    Only one purge runs at a time, so live traffic never competes with two scans.
+    """
+    job = {
+        "id": uuid4().hex[:8],
+        "prefix": prefix,
+        "dry_run": dry_run,
+        "state": "running",
+        "scanned": 0,
+        "deleted": 0,
+        "started": time(),
+    }
+    PURGE_JOBS[job["id"]] = job
+
+    async def _run():
+        try:
+            await db.unlink_prefix(
+                prefix,
+                dry_run=dry_run,
+                batch_size=PURGE_BATCH_SIZE,
+                pause_seconds=PURGE_PAUSE_MS / 1000,
+                progress=job,
+            )
+            job["state"] = "done"
+        except Exception:
+            logger.exception(f"Purge job {job['id']} failed")
+            job["state"] = "failed"
+        job["finished"] = time()
+
+    task = asyncio.create_task(_run())
+    _purge_tasks.add(task)
+    task.add_done_callback(_purge_tasks.discard)
+    return job
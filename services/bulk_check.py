@@ -0,0 +1,144 @@
+import asyncio
+import csv
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from config import (
+    logger,
+    BULK_CHECK_WORKERS,
+    BULK_CHECK_BATCH,
+    BULK_CHECK_MAX_BARCODES,
+    BULK_CHECK_BACKOFF,
+)
+from core.engine import ask_gok_batch
+from utils.admission import admission
+from utils.gtin import normalize
+from utils.metrics import metrics
+
+BARCODE_COLUMNS = ("barcode", "ean", "gtin", "upc", "ברקוד")
+NDJSON_SUFFIXES = (".ndjson", ".jsonl", ".json")
+
+# its own threads - a long list never takes the default pool the webhook handlers run on
+_executor = ThreadPoolExecutor(max_workers=BULK_CHECK_WORKERS, thread_name_prefix="bulk-check")
+
+
+def _barcode_column(rows: list) -> int:
+    """ Index of the column holding the barcodes: a known header name, else the most valid GTINs """
+    header = [cell.strip().lower() for cell in rows[0]]
+    for name in BARCODE_COLUMNS:
+        if name in header:
+            return header.index(name)
+    width = max(len(row) for row in rows)
+    valid = [sum(1 for row in rows[:20] if i < len(row) and _normalize(row[i])) for i in range(width)]
+    return valid.index(max(valid))
+
+
+def _parse_csv(text: str) -> list:
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    rows = [(number, row) for number, row in enumerate(csv.reader(io.StringIO(text), dialect), 1) if any(row)]
+    if not rows:
+        return []
+    column = _barcode_column([row for _, row in rows])
+    first = rows[0][1]
+    if column < len(first) and not any(c.isdigit() for c in first[column]):
+        rows = rows[1:]  # header line
+    return [(number, row[column].strip() if column < len(row) else "") for number, row in rows]
+
+
+def _parse_ndjson(text: str) -> list:
+    """ Each line a JSON object with a barcode field, or a bare barcode string/number """
+    items = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError:
+            value = line
+        if isinstance(value, dict):
+            value = next((value[name] for name in BARCODE_COLUMNS if name in value), "")
+        items.append((number, str(value).strip()))
+    return items
+
+
+def parse_upload(content: bytes, filename: str = "") -> list:
+    """ [(line number, raw barcode)] of an uploaded CSV or NDJSON barcode list """
+    text = content.decode("utf-8-sig", errors="replace")
+    if filename.lower().endswith(NDJSON_SUFFIXES) or text.lstrip().startswith("{"):
+        return _parse_ndjson(text)
+    return _parse_csv(text)
+
+
+def _normalize(raw: str):
+    """ Spaces/dashes inside a barcode are allowed, as in a typed message """
+    return normalize("".join(c for c in raw if c.isdigit()))
+
+
+async def bulk_check(items: list):
+    """
+    Yields a result per uploaded line as soon as its batch is answered, then a summary.
+    Invalid barcodes are answered first; valid ones are deduplicated and asked BULK_CHECK_BATCH per
+    GOK request (cached verdicts need none), at most BULK_CHECK_WORKERS at once, and nothing new is
+    sent while admission reports live traffic piling up. Lookups are not counted as hot/unknown barcodes,
+    and their answers are not cached - a long list would evict the live hot set.
+    """
+    started = perf_counter()
+    lines = {}  # barcode -> [(line, raw)], duplicates are asked once
+    invalid = 0
+    for number, raw in items[:BULK_CHECK_MAX_BARCODES]:
+        if barcode := _normalize(raw):
+            lines.setdefault(barcode, []).append((number, raw))
+        else:
+            invalid += 1
+            yield {"line": number, "input": raw, "error": "invalid_barcode"}
+
+    unique = list(lines)
+    batches = [unique[i:i + BULK_CHECK_BATCH] for i in range(0, len(unique), BULK_CHECK_BATCH)]
+    loop = asyncio.get_running_loop()
+    pending, backoffs = {}, 0
+    try:
+        while batches or pending:
+            if batches and len(pending) < BULK_CHECK_WORKERS and not admission.overloaded():
+                batch = batches.pop(0)
+                pending[loop.run_in_executor(_executor, ask_gok_batch, batch, None, False, False)] = batch
+                continue
+            if batches and admission.overloaded():
+                backoffs += 1
+                metrics.incr("bulk_check.backoff")
+            if not pending:
+                await asyncio.sleep(BULK_CHECK_BACKOFF)
+                continue
+            done, _ = await asyncio.wait(
+                pending, timeout=BULK_CHECK_BACKOFF if batches else None, return_when=asyncio.FIRST_COMPLETED
+            )
+            for future in done:
+                batch = pending.pop(future)
+                try:
+                    replies = future.result()
+                except Exception:
+                    logger.exception(f"Bulk check of {len(batch)} barcodes failed")
+                    replies = {}
+                for barcode in batch:
+                    for number, raw in lines[barcode]:
+                        if barcode in replies:
+                            yield {"line": number, "input": raw, "barcode": barcode, "reply": replies[barcode]}
+                        else:
+                            yield {"line": number, "input": raw, "barcode": barcode, "error": "lookup_failed"}
+    finally:
+        for future in pending:
+            future.cancel()  # client went away - queued batches are dropped, running ones finish
+
+    yield {"summary": {
+        "lines": len(items),
+        "checked": min(len(items), BULK_CHECK_MAX_BARCODES) - invalid,
+        "unique": len(unique),
+        "invalid": invalid,
+        "truncated": max(0, len(items) - BULK_CHECK_MAX_BARCODES),
+        "backoffs": backoffs,
+        "seconds": round(perf_counter() - started, 2),
+    }}
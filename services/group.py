@@ -1,10 +1,14 @@
-from config import logger, ADMIN_CHAT_ID
+import asyncio
+
+from config import logger, ADMIN_CHAT_ID, RATE_LIMIT_NOTICE_SECONDS
 from core.engine import check_barcode
 
 from core.message import green_send_message
 from utils.time_check import is_night_hours, is_too_old
 from utils.texts import TEXTS, LISTED_SIGNS
 from utils.redis_manager import db
+from utils.rate_limit import is_rate_limited
+from utils.deadline import Deadline, DeadlineExceeded
 
 async def group_handler(whatsapp_request: dict):
     sender_data = whatsapp_request["senderData"]
@@ -35,16 +39,30 @@ async def group_handler(whatsapp_request: dict):
 
     # reply only for pic with barcode:
     if msg_type == "imageMessage":
+        if await is_rate_limited(db, actual_sender, chat_id):
+            logger.info(f"Rate limited: {actual_sender} in {group_name}")
+            if not await db.is_duplicate('slow', f'{chat_id}:{actual_sender}', ttl_seconds=RATE_LIMIT_NOTICE_SECONDS):
+                await green_send_message(chat_id, TEXTS["errors"]["rate_limited"], reply_to=msg_id)
+            return {"status": "group_rate_limited"}
+
         image_url = msg_data["fileMessageData"]["downloadUrl"]
+        deadline = Deadline.for_message(timestamp, is_group=True)
 
         # analyze image
-        result = check_barcode(image_url)
+        try:
+            result = await asyncio.to_thread(check_barcode, image_url, shed_duplicates=True, deadline=deadline)
+        except DeadlineExceeded as e:
+            logger.info(f"Group image dropped at {e.stage} (deadline): {msg_id} from {actual_sender} in {group_name}")
+            return {"status": "group_deadline_exceeded"}
 
         if TEXTS["errors"]["barcode_not_found"] in result or \
            TEXTS["errors"]["unsupported_barcode"] in result:
             logger.info(f"Group image ignored (no barcode): {msg_id} from {actual_sender} in {group_name}")
             return {"status": "group_image_ignored"}
 
+        if len(parts := _barcode_parts(result)) > 1:
+            return await _multi_barcode_reply(parts, sender_data, msg_id, deadline, actual_sender, group_name)
+
         detected_barcode = "".join(c for c in result if c.isdigit())
         if detected_barcode and await db.is_duplicate('barcode', detected_barcode, ttl_seconds=300):
             logger.info(f"Duplicate barcode {detected_barcode} from {actual_sender} in {group_name}")
@@ -52,34 +70,86 @@ async def group_handler(whatsapp_request: dict):
 
         if TEXTS["errors"]["gok_not_found"] in result:
             logger.info(f"Group image barcode not found in GOK: {msg_id} from {actual_sender} in {group_name}")
-            barcode_or_barcodes_list = "".join(c for c in result if c.isdigit() or c == '\n')
-            unlisted_msg = barcode_or_barcodes_list + TEXTS['group']['unlisted']
-            await green_send_message(sender_data["chatId"], unlisted_msg, reply_to=msg_id)
+            unlisted_msg = _not_found_text(result) + TEXTS['group']['unlisted']
+            await green_send_message(sender_data["chatId"], unlisted_msg, reply_to=msg_id, deadline=deadline)
             return {"status": "group_unlisted"}
 
         if TEXTS["product_status"]["in_review"] in result:
             logger.info(f"Group image barcode found in GOK with unproved status: "
                         f"{msg_id} from {actual_sender} in {group_name}")
-            clean_result = result.replace(
-                TEXTS["product_status"]["in_review"], "").replace(
-                TEXTS['barcode']["prefix"], "").replace(
-                TEXTS["barcode"]["edited"], "").strip()
-            lines = clean_result.splitlines()
-            if len(lines) >= 2 and lines[0] == lines[1]:
-                lines.pop(0)
-            clean_result = "\n".join(lines)
-            unlisted_msg = clean_result + '\n' + TEXTS['group']['unlisted']
-            await green_send_message(sender_data["chatId"], unlisted_msg, reply_to=msg_id)
+            unlisted_msg = _in_review_text(result) + '\n' + TEXTS['group']['unlisted']
+            await green_send_message(sender_data["chatId"], unlisted_msg, reply_to=msg_id, deadline=deadline)
             return {"status": "group_in_db_unlisted"}
 
         if any(sign in result for sign in LISTED_SIGNS):
             logger.info(f"Group image with status: {msg_id} from {actual_sender} in {group_name}")
-            await green_send_message(sender_data["chatId"], TEXTS['group']['listed'], reply_to=msg_id)
+            await green_send_message(sender_data["chatId"], TEXTS['group']['listed'], reply_to=msg_id, deadline=deadline)
             return {"status": "group_listed"}
 
     return {"status": "group_ignored"}
 
 
+def _not_found_text(result: str) -> str:
+    """ The barcode (and its leading-zero variants) lines of a not-found reply """
+    return "".join(c for c in result if c.isdigit() or c == '\n')
+
+
+def _in_review_text(result: str) -> str:
+    """ Barcode and product name of an in-review reply """
+    clean_result = result.replace(
+        TEXTS["product_status"]["in_review"], "").replace(
+        TEXTS['barcode']["prefix"], "").replace(
+        TEXTS["barcode"]["edited"], "").strip()
+    lines = clean_result.splitlines()
+    if len(lines) >= 2 and lines[0] == lines[1]:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def _barcode_parts(result: str) -> list:
+    """ [(barcode, reply part)] of a combined multi-barcode reply (check_barcodes), [] for any other reply """
+    prefix = TEXTS["barcode"]["prefix"]
+    if not result.startswith(prefix):
+        return []
+    parts = []
+    for part in result.split("\n\n" + prefix):
+        part = part.removeprefix(prefix)
+        barcode, _, reply = part.partition("\n")
+        parts.append((barcode, prefix + barcode + "\n" + reply.split("\n\n")[0]))  # drops the truncated notice
+    return parts
+
+
+async def _multi_barcode_reply(parts: list, sender_data, msg_id, deadline, actual_sender, group_name):
+    """ Several barcodes in one image: deduplicated one by one, unlisted/in-review/listed told per barcode """
+    new_parts = [
+        (barcode, part) for barcode, part in parts
+        if not await db.is_duplicate('barcode', barcode, ttl_seconds=300)
+    ]
+    if not new_parts:
+        logger.info(f"Duplicate barcodes {[b for b, _ in parts]} from {actual_sender} in {group_name}")
+        return {"status": "group_duplicate_barcode_ignored"}
+
+    unlisted, listed = [], []
+    for barcode, part in new_parts:
+        if TEXTS["errors"]["gok_not_found"] in part:
+            unlisted.append(_not_found_text(part).strip("\n"))
+        elif TEXTS["product_status"]["in_review"] in part:
+            unlisted.append(_in_review_text(part))
+        elif any(sign in part for sign in LISTED_SIGNS):
+            listed.append(barcode)
+
+    messages = []
+    if unlisted:
+        messages.append("\n".join(unlisted) + "\n" + TEXTS['group']['unlisted'])
+    if listed:
+        messages.append("\n".join(listed) + "\n" + TEXTS['group']['listed'])
+    if not messages:
+        return {"status": "group_ignored"}
+    logger.info(f"Group image with {len(new_parts)} barcodes ({len(unlisted)} unlisted): {msg_id} in {group_name}")
+    await green_send_message(sender_data["chatId"], "\n\n".join(messages), reply_to=msg_id, deadline=deadline)
+    return {"status": "group_unlisted" if unlisted else "group_listed"}
+
+
 async def night_response(sender_data, msg_id, actual_sender, group_name, night_str):
     logger.info(f"Outside working hours - ignoring group message {msg_id} from {actual_sender} in {group_name}")
     text = TEXTS["errors"]["out_of_working_hours"].format(rounded=night_str)
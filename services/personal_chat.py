@@ -1,9 +1,15 @@
-from config import logger
-from core.engine import check_barcode
+import asyncio
+from time import time
+
+from config import logger, RATE_LIMIT_NOTICE_SECONDS
+from core.engine import check_barcode, check_barcodes
 from core.message import green_send_message
 from services.reports import report_new_user_startup, report_bug_request, report_quoted_response
 from utils.texts import HELP_KEYWORDS, TEXTS, THANKS_KEYWORDS
 from utils.redis_manager import db
+from utils.rate_limit import is_rate_limited
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.gtin import extract_gtins
 
 async def personal_chat_handler(whatsapp_request: dict):
     sender_data = whatsapp_request["senderData"]
@@ -11,6 +17,7 @@ async def personal_chat_handler(whatsapp_request: dict):
     msg_data = whatsapp_request["messageData"]
     msg_type = msg_data["typeMessage"]
     msg_id = whatsapp_request["idMessage"]
+    deadline = Deadline.for_message(whatsapp_request.get("timestamp", time()), is_group=False)
 
     # ignore reactions
     if msg_type == 'reactionMessage':
@@ -35,11 +42,17 @@ async def personal_chat_handler(whatsapp_request: dict):
 
     # pic
     if msg_type == "imageMessage":
+        if await is_rate_limited(db, sender):
+            return await slow_down_response(sender, msg_id)
         image_url = msg_data["fileMessageData"]["downloadUrl"]
 
         # analyze image
-        result = check_barcode(image_url)
-        await green_send_message(sender, result)  #, reply_to=msg_id)
+        try:
+            result = await asyncio.to_thread(check_barcode, image_url, deadline=deadline)
+        except DeadlineExceeded as e:
+            logger.info(f"Image from {sender} dropped at {e.stage} (deadline)")
+            return {"status": "deadline_exceeded"}
+        await green_send_message(sender, result, deadline=deadline)  #, reply_to=msg_id)
         return {"status": "image_processed"}
 
     # quoted message
@@ -70,8 +83,22 @@ async def personal_chat_handler(whatsapp_request: dict):
 
         digits = "".join(c for c in text if c.isdigit())
         if digits:
-            result = check_barcode(digits, text=True)
-            await green_send_message(sender, result, reply_to=msg_id)
+            # phone numbers, prices and typos are answered locally, without a GOK round-trip
+            if not (barcodes := extract_gtins(text)):
+                logger.info(f"Invalid barcode from {sender}: {digits}")
+                await green_send_message(sender, TEXTS["errors"]["invalid_barcode"], reply_to=msg_id)
+                return {"status": "invalid_barcode"}
+            if await is_rate_limited(db, sender):
+                return await slow_down_response(sender, msg_id)
+            try:
+                if len(barcodes) > 1:  # a pasted list - one batched lookup, one reply
+                    result = await asyncio.to_thread(check_barcodes, barcodes, deadline=deadline)
+                else:
+                    result = await asyncio.to_thread(check_barcode, barcodes[0], text=True, deadline=deadline)
+            except DeadlineExceeded as e:
+                logger.info(f"Text from {sender} dropped at {e.stage} (deadline)")
+                return {"status": "deadline_exceeded"}
+            await green_send_message(sender, result, reply_to=msg_id, deadline=deadline)
         elif any(keyword in text for keyword in THANKS_KEYWORDS):
             await green_send_message(sender, TEXTS["thanks"], reply_to=msg_id)
         else:
@@ -86,3 +113,10 @@ async def personal_chat_handler(whatsapp_request: dict):
         reply_to=msg_id
     )
     return {"status": "unsupported"}
+
+
+async def slow_down_response(sender, msg_id):
+    logger.info(f"Rate limited: {sender}")
+    if not await db.is_duplicate('slow', sender, ttl_seconds=RATE_LIMIT_NOTICE_SECONDS):
+        await green_send_message(sender, TEXTS["errors"]["rate_limited"], reply_to=msg_id)
+    return {"status": "rate_limited"}
@@ -0,0 +1,53 @@
+import asyncio
+from time import time, perf_counter
+
+from config import logger, PREWARM_LEAD_MINUTES, PREWARM_DAYS, PREWARM_BARCODES, PREWARM_THREADS
+from core.engine import refresh_verdict, warm_imaging
+from core.message import is_green_available
+from utils.time_check import seconds_until_working_hours
+from utils.verdict_cache import HOT_BARCODES_NAME
+
+
+async def prewarm(db) -> dict:
+    """
+    Gets the process ready for the morning rush:
+    Redis + Green connections, worker threads with imaging loaded, and fresh verdicts
+    for the barcodes requested most in the last PREWARM_DAYS days.
+    """
+    started = perf_counter()
+    redis_ok = await db.ping()
+    green_ok = await asyncio.to_thread(is_green_available)
+    # the default executor spawns threads lazily - running these concurrently spawns the decode workers now
+    await asyncio.gather(*(asyncio.to_thread(warm_imaging) for _ in range(PREWARM_THREADS)))
+
+    hot = await db.top_daily_counts(HOT_BARCODES_NAME, days=PREWARM_DAYS, limit=PREWARM_BARCODES)
+    for barcode, _ in hot:
+        await asyncio.to_thread(refresh_verdict, barcode)
+
+    result = {
+        "redis": redis_ok,
+        "green": green_ok,
+        "refreshed_barcodes": len(hot),
+        "seconds": round(perf_counter() - started, 2),
+    }
+    logger.info(f"Pre-warm done: {result}")
+    return result
+
+
+async def prewarm_loop(db) -> None:
+    """
+    Runs prewarm PREWARM_LEAD_MINUTES before working hours start, every day.
+    Only works while the machine is up - a stopped machine is woken by an external
+    scheduled call to POST /prewarm at the same time (see README).
+    """
+    lead_seconds = PREWARM_LEAD_MINUTES * 60
+    while True:
+        wait = seconds_until_working_hours(time()) - lead_seconds
+        if wait < 0:  # already inside the lead window - aim for tomorrow
+            wait += 86400
+        await asyncio.sleep(wait)
+        try:
+            await prewarm(db)
+        except Exception:
+            logger.exception("Pre-warm failed")
+        await asyncio.sleep(lead_seconds + 60)  # past the opening, next wait is counted to tomorrow
@@ -0,0 +1,85 @@
+import asyncio
+from time import time, perf_counter
+
+from config import (
+    logger,
+    PREWARM_DAYS,
+    PREWARM_THREADS,
+    PRODUCT_INDEX_SYNC_SECONDS,
+    PRODUCT_INDEX_SYNC_BARCODES,
+    PRODUCT_INDEX_REFRESH_HOURS,
+)
+from core.engine import refresh_verdict
+from utils.gtin import canonical_key
+from utils.product_index import product_index
+from utils.texts import TEXTS
+from utils.verdict_cache import verdicts, not_found, HOT_BARCODES_NAME
+
+
+def _withdrawn(key: str, reply: str) -> bool:
+    """ GOK answered, but no longer with a final verdict - not found, or back in review """
+    return not_found.get(key) == reply or reply.endswith(TEXTS["product_status"]["in_review"])
+
+
+async def sync_product_index(db) -> dict:
+    """
+    Incremental sync of the local product index:
+    - verdicts already in the in-process cache are added for free;
+    - hot barcodes missing from the index, and indexed ones older than PRODUCT_INDEX_REFRESH_HOURS,
+      are asked from GOK again (products API queries - GOK has no bulk export).
+    Only cacheable verdicts (kosher / not kosher / unknown) are indexed, never "in review" or errors;
+    an indexed product that GOK now answers as in review or not found is dropped (a GOK error keeps it).
+    """
+    started = perf_counter()
+    indexed = await asyncio.to_thread(product_index.items)
+    refresh_before = time() - PRODUCT_INDEX_REFRESH_HOURS * 3600
+    # a verdict served from the index is cached too - only new/changed ones count, or it would never age
+    records = {
+        key: (stored_at, reply)
+        for key, reply, stored_at, _ in verdicts.hottest(verdicts.max_items)
+        if indexed.get(key, (0, None))[1] != reply
+    }
+
+    hot = await db.top_daily_counts(HOT_BARCODES_NAME, days=PREWARM_DAYS, limit=PRODUCT_INDEX_SYNC_BARCODES)
+    candidates = dict.fromkeys(
+        [canonical_key(barcode) for barcode, _ in hot]
+        + [key for key, (stored_at, _) in indexed.items() if stored_at < refresh_before]
+    )
+    due = [key for key in candidates if key not in records and indexed.get(key, (0,))[0] < refresh_before]
+
+    limit = asyncio.Semaphore(PREWARM_THREADS)
+    removed = set()
+
+    async def refresh(key: str) -> None:
+        async with limit:
+            reply = await asyncio.to_thread(refresh_verdict, key)
+        if verdicts.get(key) == reply:  # ask_gok caches only final verdicts
+            records[key] = (time(), reply)
+        elif key in indexed and _withdrawn(key, reply):
+            removed.add(key)
+
+    await asyncio.gather(*(refresh(key) for key in due))
+    if records or removed:
+        total = await asyncio.to_thread(product_index.merge, records, removed)
+    else:
+        total = len(indexed)
+    result = {
+        "updated": len(records),
+        "removed": len(removed),
+        "asked_gok": len(due),
+        "total": total,
+        "seconds": round(perf_counter() - started, 2),
+    }
+    logger.info(f"Product index sync done: {result}")
+    return result
+
+
+async def product_sync_loop(db) -> None:
+    if not product_index.enabled:
+        return
+    while True:
+        try:
+            await sync_product_index(db)
+        except Exception:
+            logger.exception("Product index sync failed")
+        await asyncio.sleep(PRODUCT_INDEX_SYNC_SECONDS)
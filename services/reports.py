@@ -49,22 +49,17 @@ async def report_version_update(db):
 
 async def update_weekly_status(result: dict):
     """
+    result of db.get_weekly_stats (has "week_start") or db.get_stats_range (has "start"/"end"):
     {
-        "week_start": week_key,
-        "received": {
-            "group": int(self.client.get(f"stats:{week_key}:received:group") or 0),
-            "private": int(self.client.get(f"stats:{week_key}:received:private") or 0)\
-            "admin": int(self.sync_client.get(f"stats:{week_key}:received:group:admin") or 0)
-
-        },
-        "sent": {
-            "group": int(self.client.get(f"stats:{week_key}:sent:group") or 0),
-            "private": int(self.client.get(f"stats:{week_key}:sent:private") or 0)
-        }
+        "week_start": "2026-10-18",
+        "received": {"group": int, "private": int, "admin": int},
+        "sent": {"group": int, "private": int, "failed_group": int, "failed_private": int}
     }
     """
+    title = (f"📊 Weekly report from {result['week_start']}:\n\n" if "week_start" in result
+             else f"📊 Report for {result['start']} - {result['end']}:\n\n")
     msg = (
-        f"📊 Weekly report from {result['week_start']}:\n\n"
+        title +
         "🤖Bot private conversations: \n"
         f"   - 📥 Received: {result['received']['private']}\n"
         f"   - 📤 Sent:{result['sent']['private']} (Failed/Delayed: {result['sent']['failed_private']})\n\n"
@@ -73,4 +68,12 @@ async def update_weekly_status(result: dict):
         f"   - 📤 Sent by Bot: {result['sent']['group']} (Failed: {result['sent']['failed_group']})\n"
         f"   - 📤 Sent by Admins: {result['received']['admin']}\n"
     )
-    await green_send_message(REPORTS_CHAT_ID, msg)
\ No newline at end of file
+    await green_send_message(REPORTS_CHAT_ID, msg)
+
+async def report_unknown_barcodes(top: list, days: int):
+    """ top: [(barcode, requests), ...] from db.top_daily_counts, for the GOK team to prioritize """
+    lines = "\n".join(f"{i}. {barcode} - {count}" for i, (barcode, count) in enumerate(top, 1))
+    await green_send_message(
+        REPORTS_CHAT_ID,
+        f"❓ Most requested unknown products, last {days} days:\n\n" + (lines or "None")
+    )
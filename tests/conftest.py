@@ -2,8 +2,28 @@
 import os
 import sys
 
+import pytest
+
 # tests/ is located at <repo_root>/tests; add repo root to sys.path
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
 
+
+@pytest.fixture(autouse=True)
+def reset_process_state():
+    """
+    Process-wide state must not leak between tests: cached verdicts/decoded images,
+    failures that would open a breaker, decode outcomes that would reorder the strategies.
+    """
+    # imported here - the repository root is on sys.path only once this module has run
+    from utils.circuit_breaker import BREAKERS
+    from utils.decode_tuner import decode_tuner
+    from utils.verdict_cache import verdicts, image_barcodes, not_found
+    verdicts.clear()
+    image_barcodes.clear()
+    not_found.clear()
+    for breaker in BREAKERS:
+        breaker.reset()
+    decode_tuner.reset()
+    yield
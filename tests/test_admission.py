@@ -0,0 +1,56 @@
+import threading
+import time
+import pytest
+
+from utils.admission import AdmissionController, ADMITTED, SHED, RETRY
+
+
+@pytest.fixture
+def controller():
+    return AdmissionController(
+        soft_pending=2, max_pending=4, stale_seconds=60,
+        stage_limits={"decode": 1, "gok": 2, "send": 2}, memory_budget_bytes=100,
+    )
+
+
+def test_sheds_stale_group_images_first(controller):
+    now = int(time.time())
+    assert controller.admit("private_text", now) == ADMITTED
+    assert controller.admit("group_image", now - 600) == ADMITTED  # not overloaded yet - even stale is served
+    assert controller.admit("group_image", now - 600) == SHED  # soft limit reached - stale group image shed
+    assert controller.admit("group_image", now) == ADMITTED
+    assert controller.admit("private_image", now) == ADMITTED
+    assert controller.admit("group_image", now) == SHED  # hard limit - all group images shed
+    assert controller.admit("private_text", now) == RETRY
+    controller.release("private_text")
+    assert controller.admit("private_text", now) == ADMITTED
+    assert controller.stats()["pending"] == {"private_text": 1, "private_image": 1, "group_image": 2}
+
+
+def test_duplicate_group_barcode_shed_only_when_overloaded(controller):
+    assert controller.shed_duplicate_group_barcode("729") is False
+    assert controller.shed_duplicate_group_barcode("729") is False  # not overloaded
+    controller.admit("private_text")
+    controller.admit("private_text")
+    assert controller.shed_duplicate_group_barcode("729") is True
+    assert controller.shed_duplicate_group_barcode("111") is False
+
+
+def test_stage_memory_budget_serializes_big_jobs(controller):
+    controller._stages["decode"] = threading.BoundedSemaphore(2)
+    running = []
+    peak = []
+
+    def job():
+        with controller.stage("decode", memory_bytes=60):
+            running.append(1)
+            peak.append(len(running))
+            time.sleep(0.05)
+            running.pop()
+
+    threads = [threading.Thread(target=job) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert max(peak) == 1  # 2 x 60 bytes exceed the 100 bytes budget
@@ -0,0 +1,94 @@
+import pytest
+from unittest.mock import patch, Mock
+
+from services.bulk_check import parse_upload, bulk_check
+from utils.gtin import check_digit
+from utils.texts import TEXTS
+from utils.verdict_cache import verdicts, not_found
+
+
+def _gtin(body: str) -> str:
+    return body + str(check_digit(body))
+
+
+A, B, C = _gtin("729000000001"), _gtin("729000000002"), _gtin("729000000003")
+
+
+def test_parse_csv_by_header_name():
+    content = f"name;price;Barcode\nMilk;5;{A}\nBread;7;{B[:4]}-{B[4:]}\n".encode()
+    assert parse_upload(content, "import.csv") == [(2, A), (3, f"{B[:4]}-{B[4:]}")]
+
+
+def test_parse_csv_without_header_finds_the_barcode_column():
+    content = f"Milk,12,{A}\nBread,7,{B}\n".encode()
+    assert parse_upload(content) == [(1, A), (2, B)]
+
+
+def test_parse_ndjson():
+    content = f'{{"barcode": "{A}", "name": "Milk"}}\n\n{B}\n"{C}"\nnot json\n'.encode()
+    assert parse_upload(content, "list.ndjson") == [(1, A), (3, B), (4, C), (5, "not json")]
+
+
+async def _collect(items):
+    return [result async for result in bulk_check(items)]
+
+
+@pytest.mark.asyncio
+@patch('services.bulk_check.ask_gok_batch')
+async def test_bulk_check_validates_dedups_and_batches(mock_batch):
+    mock_batch.side_effect = lambda barcodes, deadline, track, store: {b: f"verdict {b}" for b in barcodes}
+    items = [(1, A), (2, "12345"), (3, B), (4, A), (5, C)]
+
+    with patch('services.bulk_check.BULK_CHECK_BATCH', 2):
+        results = await _collect(items)
+
+    assert results[0] == {"line": 2, "input": "12345", "error": "invalid_barcode"}
+    by_line = {r["line"]: r for r in results[1:-1]}
+    assert by_line[1]["reply"] == by_line[4]["reply"] == f"verdict {A}"
+    assert by_line[5]["barcode"] == C
+    assert mock_batch.call_count == 2  # 3 unique barcodes, 2 per request
+    assert all(call.args[2:] == (False, False) for call in mock_batch.call_args_list)  # not counted, not cached
+    assert results[-1]["summary"]["unique"] == 3 and results[-1]["summary"]["invalid"] == 1
+
+
+@pytest.mark.asyncio
+@patch('services.bulk_check.ask_gok_batch')
+async def test_bulk_check_waits_while_live_traffic_is_queued(mock_batch):
+    mock_batch.side_effect = lambda barcodes, deadline, track, store: {b: "ok" for b in barcodes}
+    overloaded = iter([True, True, False])
+
+    with patch('services.bulk_check.admission.overloaded', side_effect=lambda: next(overloaded, False)), \
+            patch('services.bulk_check.BULK_CHECK_BACKOFF', 0.01):
+        results = await _collect([(1, A)])
+
+    assert results[0]["reply"] == "ok"
+    assert results[-1]["summary"]["backoffs"] >= 1
+
+
+@pytest.mark.asyncio
+@patch('services.bulk_check.ask_gok_batch', side_effect=RuntimeError("boom"))
+async def test_bulk_check_reports_failed_batches(mock_batch):
+    results = await _collect([(1, A)])
+    assert results[0] == {"line": 1, "input": A, "barcode": A, "error": "lookup_failed"}
+
+
+@pytest.mark.asyncio
+@patch('core.engine.requests.post')
+async def test_bulk_check_leaves_the_live_caches_untouched(mock_post):
+    mock_post.return_value = Mock(json=Mock(return_value=[{
+        'name': 'Product A',
+        'status': TEXTS["gok_strings"]["confirmed"],
+        'kashrutTypes': ['כשר פרווה'],
+        'kashrutCerts': ['GOK'],
+        'barcode': A,
+    }]))
+    verdicts.put(C, "hot verdict")
+    hot_before = verdicts.hottest(10)
+
+    results = await _collect([(1, A), (2, B), (3, C)])
+
+    assert 'Product A' in results[0]["reply"]
+    assert results[1]["reply"] == TEXTS["errors"]["gok_not_found"]
+    assert results[2]["reply"] == "hot verdict"
+    assert verdicts.hottest(10) == hot_before  # no new entries, no hits counted
+    assert len(verdicts) == 1 and not_found.get(B) is None
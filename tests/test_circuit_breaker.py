@@ -0,0 +1,109 @@
+import pytest
+import fakeredis
+from time import time
+from unittest.mock import patch, MagicMock
+
+import requests
+
+from core.engine import ask_gok
+from core.message import green_send_message, send_deferred_messages
+from utils.circuit_breaker import CircuitBreaker, sync_breakers, gok_breaker, green_breaker, CLOSED, OPEN, HALF_OPEN
+from utils.redis_manager import RedisManager
+from utils.texts import TEXTS
+
+
+@pytest.fixture
+def db():
+    rm = RedisManager()
+    rm.client = fakeredis.aioredis.FakeRedis()
+    return rm
+
+
+def make_breaker(**kwargs):
+    return CircuitBreaker("test", **{"error_rate": 0.5, "min_calls": 4, "window_seconds": 60, "open_seconds": 30, **kwargs})
+
+
+def test_opens_on_error_rate_and_probes_after_open_seconds():
+    breaker = make_breaker()
+    for ok in (True, False, True):
+        breaker.record(ok)
+    assert breaker.state == CLOSED  # below min_calls
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert breaker.allow() is False
+
+    with patch('utils.circuit_breaker.time', return_value=time() + 31):
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow() is True   # the probe
+        assert breaker.allow() is False  # only one probe at a time
+        breaker.record(True)
+        assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens():
+    breaker = make_breaker(min_calls=1)
+    breaker.record(False)
+    with patch('utils.circuit_breaker.time', return_value=time() + 31):
+        assert breaker.allow() is True
+        breaker.record(False)
+        assert breaker.state == OPEN
+
+
+@pytest.mark.asyncio
+async def test_open_state_is_shared_through_redis(db):
+    for _ in range(gok_breaker.min_calls):
+        gok_breaker.record(False)
+    await sync_breakers(db)
+    assert await db.get_breakers(["gok", "green"]) == {"gok": pytest.approx(gok_breaker._open_until)}
+
+    other_instance = CircuitBreaker("gok", 0.5, 5, 60, 30)
+    other_instance.apply_shared((await db.get_breakers(["gok"]))["gok"])
+    assert other_instance.state == OPEN
+    assert other_instance.published_open_until() is None  # not re-published as its own
+
+
+@patch('core.engine.requests.post')
+def test_ask_gok_fails_fast_when_open(mock_post):
+    for _ in range(gok_breaker.min_calls):
+        gok_breaker.record(False)
+    result = ask_gok('7290000000000')
+    assert result == TEXTS["errors"]["gok_server_error"]
+    mock_post.assert_not_called()
+
+
+@patch('core.engine.time.sleep')
+@patch('core.engine.requests.post', side_effect=requests.exceptions.ConnectionError("down"))
+def test_ask_gok_failures_open_the_breaker(mock_post, mock_sleep):
+    for _ in range(gok_breaker.min_calls):
+        ask_gok('7290000000000')
+    assert gok_breaker.state == OPEN
+
+
+@pytest.mark.asyncio
+async def test_green_send_deferred_while_open_and_sent_later(db):
+    for _ in range(green_breaker.min_calls):
+        green_breaker.record(False)
+    with patch('core.message.db', db), patch('core.message.requests.post') as mock_post:
+        await green_send_message("972500000000@c.us", "hello", reply_to="MSG1")
+        mock_post.assert_not_called()
+
+        mock_post.return_value = MagicMock(ok=True, status_code=200, text="{}")
+        green_breaker.reset()
+        assert await send_deferred_messages(db) == 1
+        assert mock_post.call_args.kwargs["json"]["quotedMessageId"] == "MSG1"
+        assert await db.pop_deferred("green") is None
+
+
+@pytest.mark.asyncio
+async def test_deferred_sender_stops_when_half_open_probe_is_taken(db):
+    for _ in range(green_breaker.min_calls):
+        green_breaker.record(False)
+    with patch('core.message.db', db), patch('core.message.requests.post') as mock_post:
+        await green_send_message("972500000000@c.us", "hello")
+        with patch('utils.circuit_breaker.time', return_value=time() + green_breaker.open_seconds + 1):
+            assert green_breaker.allow() is True  # another send holds the probe
+            assert green_breaker.state == HALF_OPEN
+            assert await send_deferred_messages(db) == 0
+        mock_post.assert_not_called()
+        assert (await db.pop_deferred("green"))["text"] == "hello"  # still deferred, once
+        assert await db.pop_deferred("green") is None
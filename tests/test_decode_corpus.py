@@ -0,0 +1,79 @@
+import json
+import os
+import threading
+
+from unittest.mock import patch, Mock
+from PIL import Image
+
+from tools.replay_decode import main as replay_main
+from utils.decode_corpus import DecodeCorpus
+
+
+def _photo_with_exif() -> Image.Image:
+    image = Image.new("RGB", (3000, 2000), "white")
+    exif = Image.Exif()
+    exif[0x010F] = "PhoneMaker"  # Make
+    image.info["exif"] = exif.tobytes()
+    return image
+
+
+def test_capture_downscales_strips_metadata_and_rotates(tmp_path):
+    corpus = DecodeCorpus(str(tmp_path), failure_rate=1, success_rate=0, max_bytes=10 ** 6, max_side=800)
+    assert corpus.sample(_photo_with_exif(), {"tried": ["plain", "contrast"], "winner": None}, failed=True)
+    assert not corpus.sample(_photo_with_exif(), {"tried": ["plain"], "winner": "plain"}, failed=False)
+    corpus.flush()
+
+    names = sorted(os.listdir(tmp_path))
+    assert len(names) == 2
+    captured = Image.open(tmp_path / names[0])  # <name>.jpg sorts before <name>.json
+    assert max(captured.size) == 800
+    assert not captured.getexif()
+    trace = json.loads((tmp_path / names[1]).read_text())
+    assert trace["failed"] is True and trace["tried"] == ["plain", "contrast"]
+
+    corpus.max_bytes = sum(os.path.getsize(tmp_path / name) for name in names) * 3 // 2  # room for one sample
+    for _ in range(2):
+        corpus.sample(_photo_with_exif(), {"tried": []}, failed=True)
+    corpus.flush()
+    left = sorted(os.listdir(tmp_path))
+    assert len(left) == 2 and left[0][:-len(".jpg")] == left[1][:-len(".json")]  # a whole pair, no orphan
+
+
+def test_disabled_without_directory():
+    corpus = DecodeCorpus("", failure_rate=1, success_rate=1, max_bytes=1, max_side=1)
+    assert not corpus.sample(Image.new("RGB", (10, 10)), {}, failed=True)
+
+
+@patch('core.engine.decode')
+def test_replay_reports_recovered_failures(mock_decode, tmp_path, capsys):
+    corpus = DecodeCorpus(str(tmp_path), failure_rate=1, success_rate=0, max_bytes=10 ** 6, max_side=800)
+    corpus.sample(Image.new("RGB", (200, 200), "white"), {"tried": ["plain", "contrast"]}, failed=True)
+    corpus.flush()
+
+    mock_decode.side_effect = [[], [Mock(type='EAN13', data=b'7290000066318')]]
+    assert replay_main([str(tmp_path), "--strategies", "plain,contrast", "--json"]) == 0
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert lines[0]["winner"] == "contrast"
+    assert lines[-1]["summary"]["recovered"] == 1
+
+
+def test_samples_are_downscaled_before_queueing_and_dropped_when_backed_up(tmp_path):
+    corpus = DecodeCorpus(str(tmp_path), failure_rate=1, success_rate=0, max_bytes=10 ** 6, max_side=800,
+                          max_queued=1)
+    release = threading.Event()
+    queued = []
+
+    def slow_write(image, trace):
+        queued.append(image.size)
+        release.wait(5)
+        corpus._slots.release()
+
+    with patch.object(corpus, '_write', side_effect=slow_write):
+        assert corpus.sample(Image.new("RGB", (4000, 3000), "white"), {}, failed=True)
+        assert not corpus.sample(Image.new("RGB", (4000, 3000), "white"), {}, failed=True)  # queue full
+        release.set()
+        corpus.flush()
+    assert queued == [(800, 600)]
+    assert corpus.dropped == 1
+    assert corpus.sample(Image.new("RGB", (100, 100), "white"), {}, failed=True)  # slot free again
+    corpus.flush()
@@ -0,0 +1,52 @@
+import pytest
+import fakeredis
+from unittest.mock import patch, Mock
+from PIL import Image
+
+from core.engine import extract_barcode_from_image
+from utils.decode_tuner import DecodeTuner, decode_tuner, sync_decode_stats, STATS_KEY
+from utils.redis_manager import RedisManager
+
+
+def test_default_order_until_enough_samples():
+    tuner = DecodeTuner(explore_rate=0, min_samples=10)
+    for _ in range(9):
+        tuner.record("small:jpeg", ["plain", "contrast"], winner="contrast")
+    assert tuner.order("small:jpeg", ["plain", "contrast"]) == ["plain", "contrast"]
+    tuner.record("small:jpeg", ["plain", "contrast"], winner="contrast")
+    assert tuner.order("small:jpeg", ["plain", "contrast"]) == ["contrast", "plain"]
+    assert tuner.order("small:png", ["plain", "contrast"]) == ["plain", "contrast"]  # other context
+
+
+def test_exploration_samples_the_order():
+    tuner = DecodeTuner(explore_rate=1, min_samples=0)
+    for _ in range(10):
+        tuner.record("small:jpeg", ["plain"], winner="plain")
+        tuner.record("small:jpeg", ["plain", "contrast"], winner="contrast")
+        tuner.record("small:jpeg", ["plain", "contrast"])
+    orders = {tuple(tuner.order("small:jpeg", ["plain", "contrast"])) for _ in range(200)}
+    assert orders == {("plain", "contrast"), ("contrast", "plain")}
+
+
+@patch('core.engine.decode')
+def test_extract_records_the_winning_strategy(mock_decode):
+    image = Image.new('RGB', (100, 100), color='white')
+    mock_decode.side_effect = [[], [Mock()]]  # plain fails, contrast decodes
+    assert extract_barcode_from_image(image)
+    stats = decode_tuner.stats()
+    assert stats["small:unknown|contrast|wins"] == 1
+    assert stats["small:unknown|plain|tries"] == 1
+    assert "small:unknown|plain|wins" not in stats
+
+
+@pytest.mark.asyncio
+async def test_sync_merges_instances_through_redis():
+    db = RedisManager()
+    db.client = fakeredis.aioredis.FakeRedis()
+    await db.client.hset(STATS_KEY, mapping={"small:jpeg|images": 5, "small:jpeg|plain|tries": 5})
+    decode_tuner.record("small:jpeg", ["plain"], winner="plain")
+    await sync_decode_stats(db)
+    stats = decode_tuner.stats()
+    assert stats["small:jpeg|images"] == 6
+    assert stats["small:jpeg|plain|wins"] == 1
+    assert decode_tuner.drain() == {}
@@ -1,10 +1,13 @@
+import time
 import pytest
-from unittest.mock import patch, Mock, MagicMock
+from unittest.mock import patch, Mock, MagicMock, ANY
 from PIL import Image
 import io
 
+from config import STAGE_BUDGETS
 from core.engine import check_barcode
 from utils.texts import TEXTS
+from utils.deadline import Deadline, DeadlineExceeded
 
 
 @pytest.fixture
@@ -36,7 +39,7 @@ class TestCheckBarcodeText:
 
         result = check_barcode('7290000000000', text=True)
 
-        mock_ask_gok.assert_called_once_with('7290000000000')
+        mock_ask_gok.assert_called_once_with('7290000000000', deadline=ANY)
         assert TEXTS["barcode"]["prefix"] in result
         assert '7290000000000' in result
         assert "✅ כשר" in result
@@ -71,9 +74,9 @@ class TestCheckBarcodeImage:
 
         result = check_barcode('https://example.com/barcode.jpg')
 
-        mock_requests.assert_called_once_with('https://example.com/barcode.jpg')
+        mock_requests.assert_called_once_with('https://example.com/barcode.jpg', timeout=STAGE_BUDGETS['download'])
         assert mock_decode.call_count >= 1  # Called at least once (maybe twice with contrast)
-        mock_ask_gok.assert_called_once_with('7290000000000')
+        mock_ask_gok.assert_called_once_with('7290000000000', deadline=ANY)
         assert TEXTS["barcode"]["prefix"] in result
         assert '7290000000000' in result
         assert "✅ כשר" in result
@@ -124,6 +127,7 @@ class TestCheckBarcodeImage:
 
         assert result == TEXTS["errors"]["unsupported_barcode"]
 
+    @patch('core.engine.ask_gok_batch')
     @patch('core.engine.ask_gok')
     @patch('core.engine.decode')
     @patch('core.engine.requests.get')
@@ -132,9 +136,10 @@ class TestCheckBarcodeImage:
             mock_requests,
             mock_decode,
             mock_ask_gok,
+            mock_ask_gok_batch,
             mock_barcode_image
     ):
-        """Test when multiple barcodes are detected"""
+        """Test when multiple barcodes are detected - one batched lookup, one combined reply"""
         mock_response = Mock()
         mock_response.content = mock_barcode_image
         mock_response.raise_for_status = Mock()
@@ -149,11 +154,14 @@ class TestCheckBarcodeImage:
         barcode2.data = b'7290111111111'
         barcode2.type = 'EAN13'
 
-        mock_decode.return_value = [barcode1, barcode2]
+        mock_decode.return_value = [barcode1, barcode2, barcode1]
+        mock_ask_gok_batch.return_value = {'7290000000000': "Product A\n✅ כשר", '7290111111111': "Product B\n❌"}
 
         result = check_barcode('https://example.com/double.jpg')
 
-        assert result == TEXTS["errors"]["image_processing"]
+        mock_ask_gok_batch.assert_called_once_with(['7290000000000', '7290111111111'], deadline=ANY)
+        assert "7290000000000\nProduct A\n✅ כשר\n\n" in result
+        assert result.endswith("7290111111111\nProduct B\n❌")
         mock_ask_gok.assert_not_called()
 
     @patch('core.engine.decode')
@@ -196,7 +204,7 @@ class TestCheckBarcodeImage:
 
         result = check_barcode('https://example.com/ean8.jpg')
 
-        mock_ask_gok.assert_called_once_with('12345678')
+        mock_ask_gok.assert_called_once_with('12345678', deadline=ANY)
         assert TEXTS["barcode"]["prefix"] in result
 
     @patch('core.engine.ask_gok')
@@ -228,7 +236,7 @@ class TestCheckBarcodeImage:
 
         result = check_barcode('https://example.com/mixed.jpg')
 
-        mock_ask_gok.assert_called_once_with('7290000000000')
+        mock_ask_gok.assert_called_once_with('7290000000000', deadline=ANY)
         assert "✅" in result
 
 
@@ -259,7 +267,7 @@ class TestCheckBarcodeWithContrastEnhancement:
         result = check_barcode('https://example.com/low_contrast.jpg')
 
         assert mock_decode.call_count == 2
-        mock_ask_gok.assert_called_once_with('7290000000000')
+        mock_ask_gok.assert_called_once_with('7290000000000', deadline=ANY)
         assert "✅" in result
 
 
@@ -424,5 +432,94 @@ class TestCheckBarcodeWithLeadingZeros:
         result = check_barcode('0001234567890', text=True)
 
         # ask_gok should be called with the original barcode
-        mock_ask_gok.assert_called_once_with('0001234567890')
+        mock_ask_gok.assert_called_once_with('0001234567890', deadline=ANY)
         assert '0001234567890' in result
+
+
+class TestCheckBarcodeDeadline:
+    """Test deadline propagation"""
+
+    @patch('core.engine.requests.post')
+    @patch('core.engine.requests.get')
+    def test_expired_deadline_cancels_before_download(self, mock_get, mock_post):
+        """A message already past its deadline does not download or ask GOK"""
+        with pytest.raises(DeadlineExceeded) as e:
+            check_barcode('https://example.com/barcode.jpg', deadline=Deadline(time.time() - 1))
+        assert e.value.stage == 'download'
+        mock_get.assert_not_called()
+        mock_post.assert_not_called()
+
+    @patch('core.engine.time.sleep')
+    @patch('core.engine.requests.post', side_effect=Exception("GOK down"))
+    def test_no_smart_retry_without_time_left(self, mock_post, mock_sleep):
+        """GOK failure near the deadline answers at once instead of sleeping for a retry"""
+        result = check_barcode('7290000000000', text=True, deadline=Deadline(time.time() + 10))
+        assert TEXTS["errors"]["gok_server_error"] in result
+        mock_sleep.assert_not_called()
+        assert mock_post.call_args.kwargs['timeout'] <= 10
+
+    @patch('core.engine.time.sleep')
+    @patch('core.engine.requests.post', side_effect=Exception("GOK down"))
+    def test_background_refresh_never_sleeps_for_a_retry(self, mock_post, mock_sleep):
+        """Pre-warm / revalidation / index sync make one GOK call and move on"""
+        from core.engine import refresh_verdict
+        assert TEXTS["errors"]["gok_server_error"] in refresh_verdict('7290000000000')
+        mock_sleep.assert_not_called()
+        assert mock_post.call_count == 1
+
+
+class TestAskGokBatch:
+    """Several barcodes answered with one GOK request"""
+
+    @patch('core.engine.requests.post')
+    def test_batch_single_request_matched_by_barcode(self, mock_post):
+        from core.engine import ask_gok_batch
+        from utils.verdict_cache import not_found
+        mock_post.return_value = Mock(json=Mock(return_value=[
+            {},  # not found
+            {
+                'name': 'Product B',
+                'status': TEXTS["gok_strings"]["confirmed"],
+                'kashrutTypes': ['כשר חלבי'],
+                'kashrutCerts': ['GOK'],
+                'barcode': '7290111111111',
+            },
+        ]))
+        replies = ask_gok_batch(['7290000000000', '7290111111111'])
+
+        mock_post.assert_called_once()
+        assert mock_post.call_args.kwargs['json']['queries'] == [
+            {"barcode": '7290000000000'}, {"barcode": '7290111111111'}
+        ]
+        assert replies['7290000000000'] == TEXTS["errors"]["gok_not_found"]
+        assert not_found.get('7290000000000') == TEXTS["errors"]["gok_not_found"]
+        assert 'Product B' in replies['7290111111111']
+
+    @patch('core.engine.requests.post')
+    def test_batch_many_misses_cost_one_request(self, mock_post):
+        from core.engine import ask_gok_batch
+        mock_post.return_value = Mock(json=Mock(return_value=[]))
+        barcodes = [f'729000000000{i}' for i in range(5)]
+        replies = ask_gok_batch(barcodes)
+
+        mock_post.assert_called_once()
+        assert all(replies[b] == TEXTS["errors"]["gok_not_found"] for b in barcodes)
+        assert ask_gok_batch(barcodes) == replies  # served from the not-found cache
+        mock_post.assert_called_once()
+
+    @patch('core.engine.requests.post')
+    def test_batch_lone_miss_gets_the_unmatched_product(self, mock_post):
+        from core.engine import ask_gok_batch
+        from utils.verdict_cache import not_found
+        mock_post.return_value = Mock(json=Mock(return_value=[{
+            'name': 'Product A',
+            'status': TEXTS["gok_strings"]["confirmed"],
+            'kashrutTypes': ['כשר פרווה'],
+            'kashrutCerts': ['GOK'],
+            'barcode': '07290000000000',  # stored under a form the batch did not ask for
+        }]))
+        replies = ask_gok_batch(['7290000000000'])
+
+        mock_post.assert_called_once()
+        assert 'Product A' in replies['7290000000000']
+        assert not_found.get('7290000000000') is None
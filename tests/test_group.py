@@ -51,7 +51,7 @@ async def test_group_handler_night_duplicate(
 
     assert mock_is_night_hours.call_count == 3
 
-    redis_values = await mock_redis_manager.execute_command('KEYS', '*')
+    redis_values = await mock_redis_manager.execute_command('KEYS', 'dup:*')
     assert redis_values == [
         b'dup:msg-g:AC584E061E32C650FDE0817A965D54D6',
         f"dup:night:{whatsapp_request['senderData']['chatId']}".encode("utf-8"),
@@ -99,7 +99,7 @@ async def test_group_handler_barcode_not_found(
     result2 = await group_handler(group_pic_example2)
     assert result2['status'] == 'group_duplicate_barcode_ignored'
 
-    redis_values = await mock_redis_manager.execute_command('KEYS', '*')
+    redis_values = await mock_redis_manager.execute_command('KEYS', 'dup:*')
     assert redis_values == [
         b'dup:msg-g:AC584E061E32C650FDE0817A965D54D6',
         b'dup:barcode:123456789',
@@ -166,4 +166,38 @@ async def test_night_msg_shabbat(
     expected = 'כעת לילה בישראל 🤫😴✨\nהקבוצה פעילה בין 7:00 ל22:00,\nנשוב לפעילות בעוד כזמן מה, לאחר צאת השבת בישראל.'
     result = await group_handler(whatsapp_request)
     assert mock_green_send_message.call_args[0][1] == expected
-    assert result['status'] == 'group_outside_hours'
\ No newline at end of file
+    assert result['status'] == 'group_outside_hours'
+
+# image with several barcodes - one combined reply from check_barcodes
+@patch('services.group.check_barcode')
+@patch('services.group.green_send_message')
+@patch('services.group.is_night_hours', return_value="")
+@patch('services.group.is_too_old', return_value=False)
+@pytest.mark.asyncio
+async def test_group_handler_multiple_barcodes(
+        mock_is_too_old,
+        mock_is_night_hours,
+        mock_green_send_message,
+        mock_check_barcode,
+        mock_redis_manager
+):
+    prefix = TEXTS["barcode"]["prefix"]
+    mock_check_barcode.return_value = (
+        f"{prefix}7290000000001\nProduct 500g\n"
+        + TEXTS["product_status"]["kosher_template"].format(kashrut_type='כשר', cert='Cert 12') + "\n\n"
+        + f"{prefix}07290000000002\n7290000000002\n" + TEXTS["errors"]["gok_not_found"]
+    )
+    result = await group_handler(group_pic_example)
+
+    assert result['status'] == 'group_unlisted'
+    sent = mock_green_send_message.call_args[0][1]
+    assert sent.startswith("07290000000002\n7290000000002\n" + TEXTS['group']['unlisted'])
+    assert "7290000000001\n" + TEXTS['group']['listed'] in sent
+    assert "500" not in sent and "12" not in sent.replace("7290000000001", "").replace("7290000000002", "")
+    keys = await mock_redis_manager.execute_command('KEYS', 'dup:barcode:*')
+    assert sorted(keys) == [b'dup:barcode:07290000000002', b'dup:barcode:7290000000001']
+
+    group_pic_example2 = group_pic_example.copy()
+    group_pic_example2['idMessage'] = 'some_other_id_multi'
+    result2 = await group_handler(group_pic_example2)
+    assert result2['status'] == 'group_duplicate_barcode_ignored'
@@ -0,0 +1,37 @@
+import pytest
+
+from utils.gtin import check_digit, is_valid, normalize, canonical_key, variants, extract_gtins
+
+
+@pytest.mark.parametrize("code", ["7290000066318", "96385074", "036000291452", "10036000291459"])
+def test_valid_gtins(code):
+    assert is_valid(code)
+
+
+@pytest.mark.parametrize("digits, expected", [
+    ("7290000066318", "7290000066318"),   # EAN-13
+    ("96385074", "96385074"),             # EAN-8 keeps its own length
+    ("036000291452", "0036000291452"),    # UPC-A -> EAN-13
+    ("00036000291452", "0036000291452"),  # GTIN-14 with '0' indicator -> EAN-13
+    ("10036000291459", "10036000291459"), # case GTIN-14 stays
+    ("000007290000066318", "7290000066318"),  # extra zero padding
+    ("7290000066319", None),              # wrong check digit
+    ("0545551234", None),                 # phone number
+    ("1990", None),                       # price
+])
+def test_normalize(digits, expected):
+    assert normalize(digits) == expected
+
+
+def test_check_digit_and_keys():
+    assert check_digit("729000006631") == 8
+    assert canonical_key("036000291452") == canonical_key("0036000291452")
+    assert canonical_key("0003") == "0003"  # not a GTIN - left as is
+    assert variants("0036000291452") == ["0036000291452", "036000291452", "36000291452"]
+
+
+def test_extract_gtins_from_lists():
+    assert extract_gtins("729 0000 066318") == ["7290000066318"]
+    assert extract_gtins("7290000066318\n036000291452, 7290000066318") == ["7290000066318", "0036000291452"]
+    assert extract_gtins("7290000066318 96385074") == ["7290000066318", "96385074"]
+    assert extract_gtins("call 054-5551234") == []
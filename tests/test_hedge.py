@@ -0,0 +1,58 @@
+import threading
+import time
+
+import pytest
+
+from utils.hedge import Hedger
+from utils.metrics import metrics
+
+
+@pytest.fixture
+def hedger():
+    metrics.reset()
+    return Hedger("test", budget_ratio=0.0, min_delay=0.01, max_delay=0.05, pool_size=4)
+
+
+def test_fast_call_is_not_hedged(hedger):
+    calls = []
+    assert hedger.call(lambda: calls.append(1) or "ok") == "ok"
+    assert len(calls) == 1
+    assert metrics.get("test.hedge.sent") == 0
+
+
+def test_slow_primary_loses_to_hedge(hedger):
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:  # primary hangs until the test ends
+            release.wait(2)
+            return "primary"
+        return "hedge"
+
+    assert hedger.call(fn) == "hedge"
+    release.set()
+    assert metrics.get("test.hedge.sent") == 1
+    assert metrics.get("test.hedge.won") == 1
+
+
+def test_failed_call_falls_back_to_the_other(hedger):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.1)
+            raise ConnectionError("primary failed")
+        time.sleep(0.2)
+        return "hedge"
+
+    assert hedger.call(fn) == "hedge"
+
+
+def test_budget_limits_hedges(hedger):
+    slow = lambda: time.sleep(0.08) or "ok"
+    for _ in range(4):
+        assert hedger.call(slow) == "ok"
+    assert metrics.get("test.hedge.sent") == 2  # burst only, budget_ratio is 0
@@ -0,0 +1,54 @@
+import random
+
+import pytest
+from unittest.mock import patch, Mock
+from PIL import Image, ImageDraw
+
+np = pytest.importorskip("numpy")
+
+from core.engine import extract_barcode_from_image
+from core.localize import localize
+
+
+def _photo(rotation: int = 0, at=(700, 500)) -> Image.Image:
+    """ A noisy 1600x1200 'table' with a barcode-like stripe pattern pasted at `at` """
+    rng = random.Random(1)
+    barcode = Image.new("L", (300, 160), 255)
+    draw = ImageDraw.Draw(barcode)
+    x = 20
+    while x < 280:
+        width = rng.choice([2, 4, 6])
+        if rng.random() < 0.5:
+            draw.rectangle([x, 10, x + width - 1, 150], fill=0)
+        x += width
+    barcode = barcode.rotate(rotation, expand=True, fillcolor=255, resample=Image.BICUBIC)
+    noise = np.random.default_rng(0).integers(-20, 20, (1200, 1600))
+    photo = Image.fromarray((200 + noise).clip(0, 255).astype(np.uint8))
+    photo.paste(barcode, at)
+    return photo.convert("RGB")
+
+
+@pytest.mark.parametrize("rotation", [0, 30])
+def test_localize_crops_the_barcode_and_deskews(rotation):
+    crops = localize(_photo(rotation))
+    assert crops
+    crop = crops[0]
+    assert crop.width * crop.height < 1600 * 1200 / 4  # a small part of the photo
+    a = np.asarray(crop, dtype=np.float32)
+    h, w = a.shape
+    center = a[h // 3:2 * h // 3, w // 3:2 * w // 3]
+    gx, gy = np.diff(center, axis=1), np.diff(center, axis=0)
+    assert (gx ** 2).sum() > 2 * (gy ** 2).sum()  # bars are (about) vertical
+
+
+def test_plain_photo_has_no_candidates():
+    assert localize(Image.new("RGB", (1600, 1200), "white")) == []
+
+
+@patch('core.engine.decode')
+def test_large_photo_decodes_crops_before_full_frame(mock_decode):
+    barcode = Mock(type='EAN13', data=b'7290000066318')
+    mock_decode.return_value = [barcode]
+    photo = _photo()
+    assert extract_barcode_from_image(photo) == [barcode]
+    assert all(call.args[0].size != photo.size for call in mock_decode.call_args_list)
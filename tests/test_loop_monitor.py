@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+import pytest
+
+from utils.loop_monitor import LoopMonitor
+
+
+def _blocking_handler():
+    time.sleep(0.3)  # sync I/O inside an async handler
+
+
+@pytest.mark.asyncio
+async def test_stall_is_attributed_to_the_blocking_call_site():
+    monitor = LoopMonitor(interval=0.01, threshold=0.05)
+    monitor.start()
+    try:
+        await asyncio.sleep(0.05)
+        _blocking_handler()
+        await asyncio.sleep(0.05)
+    finally:
+        await monitor.stop()
+
+    stats = monitor.stats()
+    top = stats["blocking_sites"][0]
+    assert top["site"].startswith("tests/test_loop_monitor.py:") and top["site"].endswith("in _blocking_handler")
+    assert top["count"] == 1
+    assert 0.2 < top["blocked_seconds"] < 1
+    assert any("_blocking_handler" in line for line in top["stack"])
+    assert stats["stalls"] >= 1 and stats["lag"]["max"] >= 0.2
+
+
+@pytest.mark.asyncio
+async def test_no_capture_without_stalls():
+    monitor = LoopMonitor(interval=0.01, threshold=0.2)
+    monitor.start()
+    try:
+        await asyncio.sleep(0.1)
+    finally:
+        await monitor.stop()
+    assert monitor.stats()["blocking_sites"] == []
+
+
+def test_disabled_with_zero_threshold():
+    monitor = LoopMonitor(interval=0.01, threshold=0)
+    monitor.start()  # no running loop needed - nothing is started
+    assert not monitor.enabled and monitor._task is None
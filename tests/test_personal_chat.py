@@ -1,6 +1,7 @@
 # same as in test_group.py but for personal chat, check if incremrent counter works
 
 # image with no barcode
+from copy import deepcopy
 from unittest.mock import patch
 import pytest
 import fakeredis
@@ -9,7 +10,7 @@ from services.personal_chat import personal_chat_handler
 from utils.redis_manager import RedisManager
 from utils.texts import TEXTS
 
-from examples import personal_pic_example
+from examples import personal_pic_example, personal_text_example
 
 @pytest.fixture(autouse=True)
 def mock_redis_manager():
@@ -38,3 +39,31 @@ async def test_personal_chat_handler_no_barcode(
     assert mock_personal_chat_green_send_message.call_args_list[0][0][1] == TEXTS["welcome"] + TEXTS["bug"]["bug_report"]
     assert mock_personal_chat_green_send_message.call_args_list[1][0][1] == "check_barcode_expected_response"
 
+
+
+def _text_message(text, msg_id):
+    request = deepcopy(personal_text_example)
+    request["idMessage"] = msg_id
+    request["messageData"]["textMessageData"]["textMessage"] = text
+    return request
+
+
+@patch('services.personal_chat.check_barcode')
+@patch('services.personal_chat.green_send_message')
+@patch('services.reports.green_send_message')
+@pytest.mark.asyncio
+async def test_personal_chat_invalid_barcode_answered_locally(
+        mock_reports_green_send_message,
+        mock_personal_chat_green_send_message,
+        mock_check_barcode,
+):
+    await personal_chat_handler(_text_message("hello", "FIRST"))  # the welcome message
+    result = await personal_chat_handler(_text_message("054-5551234", "PHONE"))
+    assert result["status"] == "invalid_barcode"
+    mock_check_barcode.assert_not_called()
+    assert mock_personal_chat_green_send_message.call_args[0][1] == TEXTS["errors"]["invalid_barcode"]
+
+    mock_check_barcode.return_value = "verdict"
+    result = await personal_chat_handler(_text_message("036000291452", "UPC"))
+    assert result["status"] == "text_processed"
+    assert mock_check_barcode.call_args[0][0] == "0036000291452"
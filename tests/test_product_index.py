@@ -0,0 +1,118 @@
+import os
+import threading
+
+import pytest
+import fakeredis
+from time import time
+from unittest.mock import patch, Mock
+
+from core.engine import ask_gok
+from services.product_sync import sync_product_index
+from utils.product_index import ProductIndex, write_index
+from utils.redis_manager import RedisManager
+from utils.verdict_cache import verdicts, HOT_BARCODES_NAME
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = ProductIndex(str(tmp_path / "products.idx"))
+    with patch('core.engine.product_index', index), patch('services.product_sync.product_index', index):
+        yield index
+
+
+def test_lookup_and_merge(index):
+    write_index(index.path, {"7290000066318": (time(), "כשר"), "96385074": (time(), "לא כשר")})
+    assert index.get("7290000066318") == "כשר"
+    assert index.get("96385074") == "לא כשר"
+    assert index.get("7290000066319") is None
+    assert len(index) == 2
+
+    assert index.merge({"7290000066318": (time(), "updated"), "0036000291452": (time(), "new")}) == 3
+    assert index.get("7290000066318") == "updated"
+    assert index.get("0036000291452") == "new"
+
+
+def test_concurrent_merges_from_several_workers_keep_every_record(tmp_path):
+    path = str(tmp_path / "products.idx")
+    workers = [ProductIndex(path) for _ in range(4)]  # one instance per worker process
+
+    def sync(n):
+        for i in range(10):
+            workers[n].merge({f"{n}{i:012d}": (time(), f"verdict {n}-{i}")})
+
+    threads = [threading.Thread(target=sync, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    reader = ProductIndex(path)
+    assert len(reader) == 40
+    assert reader.get(f"3{9:012d}") == "verdict 3-9"
+    assert sorted(os.listdir(tmp_path)) == ["products.idx", "products.idx.lock"]  # no temp file left behind
+
+
+def test_disabled_index_misses():
+    assert ProductIndex("").get("7290000066318") is None
+
+
+@patch('core.engine.requests.post')
+def test_ask_gok_answers_from_index_without_network(mock_post, index):
+    write_index(index.path, {"7290000066318": (time(), "indexed verdict")})
+    assert ask_gok("7290000066318") == "indexed verdict"
+    mock_post.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch('core.engine.requests.post')
+async def test_sync_indexes_hot_barcodes_incrementally(mock_post, index):
+    mock_post.return_value = Mock(json=Mock(return_value=[{
+        'name': 'Test Product',
+        'status': 'מוצר מאושר ע"י הרב לשימוש במערכת',
+        'kashrutTypes': ['כשר חלבי'],
+        'kashrutCerts': ['GOK'],
+        'barcode': '7290000066318',
+    }]))
+    db = RedisManager()
+    db.client = fakeredis.aioredis.FakeRedis()
+    await db.add_daily_counts(HOT_BARCODES_NAME, {"7290000066318": 3})
+
+    result = await sync_product_index(db)
+    assert result["asked_gok"] == 1
+    assert '✅' in index.get("7290000066318")
+
+    verdicts.clear()
+    result = await sync_product_index(db)  # fresh in the index - not asked again
+    assert result["asked_gok"] == 0
+    assert mock_post.call_count == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("products", [
+    [],  # not found
+    [{'name': 'Test Product', 'status': 'ממתין', 'kashrutTypes': [], 'barcode': '7290000066318'}],  # in review
+])
+@patch('core.engine.requests.post')
+async def test_sync_drops_verdicts_gok_withdrew(mock_post, products, index):
+    mock_post.return_value = Mock(json=Mock(return_value=products))
+    write_index(index.path, {"7290000066318": (time() - 30 * 86400, "old verdict"), "7290000000001": (time(), "kept")})
+    db = RedisManager()
+    db.client = fakeredis.aioredis.FakeRedis()
+
+    result = await sync_product_index(db)
+    assert result["asked_gok"] == 1 and result["removed"] == 1
+    assert index.get("7290000066318") is None
+    assert index.get("7290000000001") == "kept"
+    assert ask_gok("7290000066318") != "old verdict"
+
+
+@pytest.mark.asyncio
+@patch('core.engine.requests.post', side_effect=Exception("GOK down"))
+async def test_sync_keeps_indexed_verdict_when_gok_fails(mock_post, index):
+    write_index(index.path, {"7290000066318": (time() - 30 * 86400, "old verdict")})
+    db = RedisManager()
+    db.client = fakeredis.aioredis.FakeRedis()
+
+    result = await sync_product_index(db)
+    assert result["removed"] == 0
+    assert index.get("7290000066318") == "old verdict"
@@ -0,0 +1,36 @@
+import pytest
+import fakeredis
+from unittest.mock import patch
+
+from utils.rate_limit import RateLimiter, is_rate_limited
+from utils.redis_manager import RedisManager
+
+
+@pytest.fixture
+def db():
+    rm = RedisManager()
+    rm.client = fakeredis.aioredis.FakeRedis()
+    return rm
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_burst_then_limit(db):
+    limiter = RateLimiter("sender", capacity=3, refill_per_minute=1, fast_path_ratio=1)  # no fast path
+    results = [await limiter.allow(db, "972500000000") for _ in range(4)]
+    assert results == [True, True, True, False]
+    assert await limiter.allow(db, "972511111111") is True  # other key has its own bucket
+
+
+@pytest.mark.asyncio
+async def test_fast_path_spending_is_charged_to_redis(db):
+    limiter = RateLimiter("sender", capacity=10, refill_per_minute=1, fast_path_ratio=0.5)
+    with patch.object(db, 'take_token', wraps=db.take_token) as take_token:
+        results = [await limiter.allow(db, "972500000000") for _ in range(11)]
+    assert results == [True] * 10 + [False]
+    assert take_token.call_count < 11  # some calls were answered locally
+
+
+@pytest.mark.asyncio
+async def test_is_rate_limited_fails_open():
+    broken = RedisManager()  # no client, no REDIS_URL
+    assert await is_rate_limited(broken, "972500000000@c.us", "123@g.us") is False
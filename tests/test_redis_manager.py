@@ -1,4 +1,6 @@
 import pytest
+from datetime import date, datetime, timedelta
+from config import tz_info
 from utils.redis_manager import RedisManager
 import fakeredis
 import asyncio
@@ -28,7 +30,7 @@ async def test_duplicate_checker(redis_client):
     assert is_dup is False
     is_dup = await db.is_duplicate('another', '12345')
     assert is_dup is False
-    all_keys = await redis_client.execute_command('KEYS', '*')
+    all_keys = await redis_client.execute_command('KEYS', 'dup:*')
     assert len(all_keys) == 2
 
 @pytest.mark.asyncio
@@ -42,5 +44,195 @@ async def test_increment_counter(redis_client):
     assert count == 2
     count = await db.increment_counter(topic)
     assert count == 3
-    all_keys = await redis_client.execute_command('KEYS', '*')
-    assert len(all_keys) == 1
\ No newline at end of file
+    all_keys = await redis_client.execute_command('KEYS', 'co:*')
+    assert len(all_keys) == 1
+
+@pytest.mark.asyncio
+async def test_iter_prefix_pages_with_cursor():
+    db = RedisManager()
+    db.client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    for i in range(25):
+        await db.client.set(f"co:{i}", i)
+    await db.client.hset("co:hash", mapping={"a": "1"})
+    await db.client.sadd("co:set", "y", "x")
+    await db.client.set("other:1", "ignored")
+
+    collected = {}
+    cursor = 0
+    while True:
+        async for cursor, entries in db.iter_prefix("co", cursor=cursor, limit=10, batch_size=5):
+            for key, key_type, value in entries:
+                collected[key] = (key_type, value)
+        if cursor == 0:
+            break
+
+    assert len(collected) == 27
+    assert collected["co:3"] == ("string", "3")
+    assert collected["co:hash"] == ("hash", {"a": "1"})
+    assert collected["co:set"] == ("set", ["x", "y"])
+    assert "other:1" not in collected
+
+
+@pytest.mark.asyncio
+async def test_iter_prefix_reports_cursor_of_empty_steps():
+    db = RedisManager()
+    db.client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    for i in range(300):
+        await db.client.set(f"other:{i}", i)
+    for i in range(5):
+        await db.client.set(f"co:{i}", i)
+
+    collected, cursor, pages = set(), 0, 0
+    while True:
+        page = []
+        async for cursor, entries in db.iter_prefix("co", cursor=cursor, limit=2, batch_size=10):
+            page.extend(key for key, _, _ in entries)
+        assert len(page) <= 2
+        collected.update(page)
+        pages += 1
+        if cursor == 0:
+            break
+        assert pages < 500, "scan never completed"
+
+    assert collected == {f"co:{i}" for i in range(5)}
+
+
+@pytest.mark.asyncio
+async def test_unlink_prefix_dry_run_and_delete(redis_client):
+    db = RedisManager()
+    db.client = redis_client
+    for i in range(30):
+        await redis_client.set(f"dup:msg-g:{i}", "1")
+    await redis_client.set("co:keep", "1")
+
+    progress = {}
+    assert await db.unlink_prefix("dup:", dry_run=True, batch_size=7, pause_seconds=0, progress=progress) == 30
+    assert progress["deleted"] == 0
+    assert await redis_client.dbsize() == 31
+
+    # fakeredis cursors are list offsets, so deleting mid-scan skips keys there; real Redis SCAN does not
+    assert await db.unlink_prefix("dup:", batch_size=100, pause_seconds=0) == 30
+    assert await redis_client.execute_command('KEYS', '*') == [b"co:keep"]
+
+
+
+@pytest.mark.asyncio
+async def test_count_keys_from_index(redis_client):
+    db = RedisManager()
+    db.client = redis_client
+    for i in range(5):
+        await db.is_duplicate('msg-g', f'id{i}', ttl_seconds=60)
+    await db.is_duplicate('msg-g', 'id0', ttl_seconds=60)  # duplicate, not counted twice
+    await db.is_duplicate('msg-p', 'id0', ttl_seconds=60)
+    await db.increment_counter('111')
+    await db.increment_counter('111')
+    await db.increment_counter('222')
+
+    assert await db.count_keys('dup:msg-g:*') == 5
+    assert await db.count_keys('dup:msg-p:*') == 1
+    assert await db.count_keys('co:*') == 2
+
+    await db.unlink_prefix('dup:msg-g:', pause_seconds=0)
+    await db.unlink_prefix('co:2', pause_seconds=0)
+    assert await db.count_keys('dup:msg-g:*') == 0
+    assert await db.count_keys('dup:msg-p:*') == 1
+    assert await db.count_keys('co:*') == 1
+
+
+@pytest.mark.asyncio
+async def test_count_keys_scans_patterns_wider_or_narrower_than_a_topic(redis_client):
+    db = RedisManager()
+    db.client = redis_client
+    for i in range(3):
+        await db.is_duplicate('msg-g', f'id{i}', ttl_seconds=60)
+    await db.is_duplicate('slow', '123@g.us:456@c.us', ttl_seconds=60)
+    await db.is_duplicate('slow', '123@g.us:789@c.us', ttl_seconds=60)
+
+    assert await db.count_keys('dup:*') == 5
+    assert await db.count_keys('dup:slow:123@g.us:*') == 2  # part of a topic, not a topic
+    assert await db.count_keys('dup:msg-?:*') == 3
+    assert await db.count_keys('dup::*') == 0
+
+
+@pytest.mark.asyncio
+async def test_partial_and_index_purges_keep_the_index(redis_client):
+    db = RedisManager()
+    db.client = redis_client
+    for i in range(5):
+        await db.is_duplicate('msg-g', f'5{i}', ttl_seconds=60)
+        await db.is_duplicate('msg-g', f'7{i}', ttl_seconds=60)
+    await db.increment_counter('111')
+
+    await db.unlink_prefix('dup:msg-g:5', pause_seconds=0)  # part of a topic - buckets kept
+    assert await db.count_keys('dup:msg-g:*') == 10  # approximate until the buckets expire, not 0
+
+    with pytest.raises(ValueError):
+        await db.unlink_prefix('idx:', pause_seconds=0)
+    with pytest.raises(ValueError):
+        await db.unlink_prefix('i', pause_seconds=0)
+    assert await db.unlink_prefix('idx:', dry_run=True, pause_seconds=0) > 0
+    assert await db.count_keys('co:*') == 1
+
+    await db.unlink_prefix('dup:msg', pause_seconds=0)  # whole topics by name prefix
+    assert await db.count_keys('dup:msg-g:*') == 0
+
+
+@pytest.mark.asyncio
+async def test_seed_key_index(redis_client):
+    db = RedisManager()
+    db.client = redis_client
+    await redis_client.set('co:1', 3)
+    await redis_client.set('co:2', 1)
+    await db.seed_key_index()
+    await db.increment_counter('3')
+    await db.seed_key_index()  # already seeded - keeps the maintained value
+    assert await db.count_keys('co:*') == 3
+
+
+@pytest.mark.asyncio
+async def test_stats_rollup_and_range(redis_client):
+    db = RedisManager()
+    db.client = redis_client
+    await db.track_received_message(is_group=True)
+    await db.track_received_message(is_group=True, is_admin=True)
+    await db.track_received_message(is_group=False)
+    await db.track_sent_message(is_group=False)
+    await db.track_received_message(is_group=False, failed_received=True)
+
+    weekly = await db.get_weekly_stats()
+    assert weekly["received"] == {"group": 1, "private": 1, "admin": 1}
+    assert weekly["sent"] == {"group": 0, "private": 1, "failed_group": 0, "failed_private": 1}
+
+    today = datetime.now(tz_info).date()
+    result = await db.get_stats_range(today - timedelta(days=2), today, "day")
+    assert len(result["series"]) == 3
+    assert result["series"][-1]["bucket"] == today.isoformat()
+    assert result["received"] == weekly["received"]
+    assert result["sent"] == weekly["sent"]
+
+    monthly = await db.get_stats_range(today, today, "month")
+    assert monthly["series"][0]["bucket"] == f"{today:%Y-%m}"
+    assert len((await db.get_stats_range(today, today, "hour"))["series"]) == 24
+
+
+@pytest.mark.asyncio
+async def test_stats_range_too_large(redis_client):
+    db = RedisManager()
+    db.client = redis_client
+    with pytest.raises(ValueError):
+        await db.get_stats_range(date(2020, 1, 1), date(2026, 1, 1), "hour")
+    with pytest.raises(ValueError):
+        await db.get_stats_range(date(2026, 1, 2), date(2026, 1, 1), "day")  # reversed range
+
+
+@pytest.mark.asyncio
+async def test_daily_counts_top(redis_client):
+    db = RedisManager()
+    db.client = redis_client
+    await db.add_daily_counts("hot:barcodes", {"111": 2, "222": 5})
+    await db.add_daily_counts("hot:barcodes", {"111": 4})
+    yesterday = datetime.now(tz_info).date() - timedelta(days=1)
+    await redis_client.zincrby(f"hot:barcodes:{yesterday:%Y-%m-%d}", 3, "333")
+
+    assert await db.top_daily_counts("hot:barcodes", days=2, limit=2) == [("111", 6), ("222", 5)]
+    assert await db.top_daily_counts("hot:barcodes", days=1) == [("111", 6), ("222", 5)]
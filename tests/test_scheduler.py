@@ -0,0 +1,75 @@
+import asyncio
+import pytest
+
+from utils.scheduler import FairScheduler
+
+
+def _job(order, name):
+    async def run():
+        order.append(name)
+    return run
+
+
+@pytest.mark.asyncio
+async def test_priority_then_fair_share_between_chats():
+    order = []
+    sched = FairScheduler(workers=1)
+    for i in range(3):
+        sched.submit("group_image", "busy@g.us", _job(order, f"busy{i}"))
+    sched.submit("group_image", "quiet@g.us", _job(order, "quiet0"))
+    sched.submit("private_image", "user@c.us", _job(order, "private_image"))
+    sched.submit("private_text", "user@c.us", _job(order, "private_text"))
+
+    sched.start()
+    while len(order) < 6:
+        await asyncio.sleep(0.01)
+    await sched.stop()
+
+    assert order == ["private_text", "private_image", "busy0", "quiet0", "busy1", "busy2"]
+
+
+@pytest.mark.asyncio
+async def test_weights_give_larger_share():
+    order = []
+    sched = FairScheduler(workers=1, weights={"vip@g.us": 2})
+    for i in range(4):
+        sched.submit("group_image", "vip@g.us", _job(order, "vip"))
+        sched.submit("group_image", "other@g.us", _job(order, "other"))
+
+    sched.start()
+    while len(order) < 8:
+        await asyncio.sleep(0.01)
+    await sched.stop()
+
+    assert order[:6].count("vip") == 4
+
+
+@pytest.mark.asyncio
+async def test_stop_drains_queued_and_running_jobs():
+    order = []
+    sched = FairScheduler(workers=1)
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        order.append("slow")
+
+    sched.start()
+    sched.submit("group_image", "a@g.us", slow)
+    sched.submit("group_image", "b@g.us", _job(order, "queued"))
+    await asyncio.sleep(0)
+    await sched.stop(timeout=5)
+
+    assert order == ["slow", "queued"]
+    with pytest.raises(RuntimeError):
+        sched.submit("private_text", "user@c.us", _job(order, "late"))
+
+
+@pytest.mark.asyncio
+async def test_stop_cancels_after_timeout():
+    sched = FairScheduler(workers=1)
+    sched.start()
+    sched.submit("group_image", "a@g.us", lambda: asyncio.sleep(10))
+    sched.submit("group_image", "b@g.us", lambda: asyncio.sleep(10))
+    await asyncio.sleep(0)
+    await asyncio.wait_for(sched.stop(timeout=0.1), 2)
+    assert len(sched) == 1
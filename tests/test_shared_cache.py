@@ -0,0 +1,68 @@
+import multiprocessing
+from time import time
+from unittest.mock import patch
+
+import pytest
+
+from core.engine import ask_gok
+from utils.shared_cache import SharedVerdictCache, SEQ, HEADER_SIZE, PROBE
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "verdicts")
+
+
+def _put_in_child(path, key, value):
+    SharedVerdictCache(path, slots=64, ttl_seconds=60).put(key, value)
+
+
+def test_shared_between_processes(path):
+    cache = SharedVerdictCache(path, slots=64, ttl_seconds=60)
+    assert cache.get("7290000066318") is None
+    child = multiprocessing.get_context("fork").Process(target=_put_in_child, args=(path, "7290000066318", "כשר ✅"))
+    child.start()
+    child.join(5)
+    assert cache.get("7290000066318") == "כשר ✅"
+
+
+def test_overwrite_ttl_and_too_long_values(path):
+    cache = SharedVerdictCache(path, slots=64, ttl_seconds=60)
+    cache.put("96385074", "a")
+    cache.put("96385074", "b")
+    assert cache.get("96385074") == "b"
+    assert not cache.put("96385074", "x" * 1000)
+    with patch('utils.shared_cache.time', return_value=time() + 61):
+        assert cache.get("96385074") is None
+
+
+def test_reader_skips_slot_while_written(path):
+    cache = SharedVerdictCache(path, slots=1, ttl_seconds=60)
+    cache.put("96385074", "a")
+    seq, = SEQ.unpack_from(cache._mm, HEADER_SIZE)
+    SEQ.pack_into(cache._mm, HEADER_SIZE, seq + 1)  # a writer in the middle of it
+    assert cache.get("96385074") is None
+    SEQ.pack_into(cache._mm, HEADER_SIZE, seq + 2)
+    assert cache.get("96385074") == "a"
+
+
+def test_clock_eviction_keeps_recently_read(path):
+    cache = SharedVerdictCache(path, slots=PROBE, ttl_seconds=60)  # one probe window: the whole table
+    keys = [f"{i:013d}" for i in range(PROBE)]
+    for key in keys:
+        assert cache.put(key, key)
+    for key in keys[:PROBE - 1]:  # all but the last were read
+        cache.get(key)
+    cache.put("9999999999999", "new")
+    assert cache.get("9999999999999") == "new"
+    assert cache.get(keys[-1]) is None
+    assert all(cache.get(key) == key for key in keys[:PROBE - 1])
+
+
+@patch('core.engine.requests.post')
+def test_ask_gok_uses_shared_verdict(mock_post, path):
+    shared = SharedVerdictCache(path, slots=64, ttl_seconds=60)
+    shared.put("7290000066318", "verdict from another worker")
+    with patch('core.engine.shared_verdicts', shared):
+        assert ask_gok("7290000066318") == "verdict from another worker"
+    mock_post.assert_not_called()
@@ -0,0 +1,20 @@
+import pytest
+
+from utils.startup import startup_timings, timed
+
+
+async def _fail():
+    raise ConnectionError("redis down")
+
+
+@pytest.mark.asyncio
+async def test_optional_step_failure_is_logged_and_timed():
+    assert await timed("optional", _fail()) is None
+    assert "optional" in startup_timings
+
+
+@pytest.mark.asyncio
+async def test_required_step_failure_fails_the_startup():
+    with pytest.raises(ConnectionError):
+        await timed("redis_connect", _fail(), required=True)
+    assert "redis_connect" in startup_timings
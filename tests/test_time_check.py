@@ -1,5 +1,5 @@
 from datetime import datetime, timezone
-from utils.time_check import is_night_hours
+from utils.time_check import is_night_hours, seconds_until_working_hours
 
 def test_is_night_hours_daytime():
     # 12/1/2026 5 PM in jerusalem (UTC+2) by unix seconds:
@@ -12,4 +12,13 @@ def test_is_night_hours_nighttime():
     # 12/1/2026 3 AM in jerusalem (UTC+2) by unix seconds:
     ts = int(datetime(2026, 1, 12, 1, 0, 0,
                        tzinfo=timezone.utc).timestamp())
-    assert is_night_hours(ts)
\ No newline at end of file
+    assert is_night_hours(ts)
+
+
+def test_seconds_until_working_hours():
+    # 12/1/2026 6:30 AM in jerusalem -> 30 minutes to 7:00
+    ts = int(datetime(2026, 1, 12, 4, 30, 0, tzinfo=timezone.utc).timestamp())
+    assert seconds_until_working_hours(ts) == 30 * 60
+    # 12/1/2026 7:00 AM exactly -> next day
+    ts = int(datetime(2026, 1, 12, 5, 0, 0, tzinfo=timezone.utc).timestamp())
+    assert seconds_until_working_hours(ts) == 24 * 3600
@@ -0,0 +1,114 @@
+import pytest
+import fakeredis
+from time import time
+from unittest.mock import patch, Mock
+
+from core.engine import ask_gok
+from utils.redis_manager import RedisManager
+from utils.texts import TEXTS
+from utils.verdict_cache import (
+    VerdictCache,
+    verdicts,
+    image_barcodes,
+    unknown_barcodes,
+    save_warm_snapshot,
+    load_warm_snapshot,
+    flush_requested_barcodes,
+    UNKNOWN_BARCODES_NAME,
+)
+
+
+def test_lru_eviction_and_ttl():
+    cache = VerdictCache(max_items=2, ttl_seconds=60)
+    cache.put('a', 'A')
+    cache.put('b', 'B')
+    assert cache.get('a') == 'A'  # 'a' is now most recently used
+    cache.put('c', 'C')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'A'
+
+    cache.put('old', 'OLD', stored_at=time() - 61)
+    assert cache.get('old') is None
+
+
+def test_hottest_and_load_drops_stale():
+    cache = VerdictCache(max_items=10, ttl_seconds=60)
+    cache.put('cold', 'x')
+    cache.put('hot', 'y')
+    for _ in range(3):
+        cache.get('hot')
+    hottest = cache.hottest(1)
+    assert [entry[0] for entry in hottest] == ['hot']
+
+    other = VerdictCache(max_items=10, ttl_seconds=60)
+    loaded = other.load(hottest + [['stale', 'z', time() - 120, 9]])
+    assert loaded == 1
+    assert other.get('hot') == 'y'
+    assert other.get('stale') is None
+
+
+@pytest.mark.asyncio
+async def test_warm_snapshot_roundtrip():
+    db = RedisManager()
+    db.client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    verdicts.put('7290000000000', 'Product\n✅ כשר')
+    image_barcodes.put('sha1', '7290000000000')
+    await save_warm_snapshot(db)
+
+    verdicts.clear()
+    image_barcodes.clear()
+    await load_warm_snapshot(db)
+    assert verdicts.get('7290000000000') == 'Product\n✅ כשר'
+    assert image_barcodes.get('sha1') == '7290000000000'
+
+
+@patch('core.engine.requests.post')
+def test_ask_gok_serves_repeated_verdict_from_cache(mock_post):
+    mock_post.return_value = Mock(json=Mock(return_value=[{
+        'name': 'Test Product',
+        'status': 'מוצר מאושר ע"י הרב לשימוש במערכת',
+        'kashrutTypes': ['כשר חלבי'],
+        'kashrutCerts': ['GOK'],
+        'barcode': '7290000000000',
+    }]))
+    first = ask_gok('7290000000000')
+    second = ask_gok('7290000000000')
+    assert first == second
+    assert '✅' in first
+    assert mock_post.call_count == 1
+
+
+@pytest.mark.asyncio
+@patch('core.engine.requests.post')
+async def test_not_found_cached_and_ranked(mock_post):
+    unknown_barcodes.drain()
+    mock_post.return_value = Mock(json=Mock(return_value=[]))
+    for _ in range(3):
+        assert ask_gok('7290000000001') == TEXTS["errors"]["gok_not_found"]
+    ask_gok('7290000000002')
+    assert mock_post.call_count == 2  # repeats served locally
+
+    db = RedisManager()
+    db.client = fakeredis.aioredis.FakeRedis()
+    await flush_requested_barcodes(db)
+    assert await db.top_daily_counts(UNKNOWN_BARCODES_NAME, days=1) == [('7290000000001', 3), ('7290000000002', 1)]
+
+
+def test_stale_verdict_served_in_grace_while_refreshed_once():
+    from core import engine
+    verdicts.put('7290000000003', 'old verdict', stored_at=time() - verdicts.ttl_seconds - 60)
+    with patch('core.engine.refresh_verdict', return_value='new verdict') as refresh, \
+            patch.object(engine, 'revalidate_pool') as pool:
+        assert ask_gok('7290000000003') == 'old verdict'
+        assert ask_gok('7290000000003') == 'old verdict'
+        assert pool.submit.call_count == 1  # one refresh in flight per barcode
+        pool.submit.call_args[0][0]()
+        refresh.assert_called_once_with('7290000000003')
+    assert engine.metrics.get("verdict.stale.grace") >= 2
+
+
+@patch('core.engine.requests.post', side_effect=ConnectionError("GOK down"))
+def test_old_stale_verdict_served_only_when_gok_fails(mock_post):
+    verdicts.put('7290000000004', 'known verdict', stored_at=time() - verdicts.ttl_seconds - 86400)
+    assert ask_gok('7290000000004') == 'known verdict'
+    assert mock_post.call_count == 1  # beyond the grace window GOK is asked first, no smart_retry sleep
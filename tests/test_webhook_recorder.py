@@ -0,0 +1,85 @@
+import gzip
+import json
+import os
+from unittest.mock import patch
+
+from tests.examples.jpg_personal import jpg_personal
+from tests.examples.jpg_in_group import income_jpg_msg_in_group
+from tools.replay_webhooks import send_offsets
+from utils.thin_log import redact_webhook
+from utils.webhook_recorder import WebhookRecorder, read_records, recorded_files
+
+
+def test_redaction_drops_thumbnails_names_and_phones():
+    redacted = redact_webhook(jpg_personal, salt="s")
+    dumped = json.dumps(redacted)
+    assert "972547654321" not in dumped and "972123456789" not in dumped
+    assert "David Levi" not in dumped
+    assert redacted["messageData"]["fileMessageData"]["jpegThumbnail"] == "..."
+    sender = redacted["senderData"]["sender"]
+    assert sender.endswith("@c.us") and sender == redacted["senderData"]["chatId"]  # same person, same stand-in
+    assert redact_webhook(jpg_personal, salt="s")["senderData"]["sender"] == sender
+    assert redact_webhook(jpg_personal, salt="other")["senderData"]["sender"] != sender
+    assert jpg_personal["senderData"]["sender"] == "972547654321@c.us"  # original untouched
+
+    group = redact_webhook(income_jpg_msg_in_group, salt="s")
+    assert group["senderData"]["chatId"].endswith("@g.us")
+
+
+def test_records_rotate_and_read_back(tmp_path):
+    recorder = WebhookRecorder(str(tmp_path), file_bytes=1, max_files=2, salt="s")
+    for _ in range(3):
+        assert recorder.record(jpg_personal)
+        recorder.flush()
+    recorder.close()
+
+    files = recorded_files(str(tmp_path))
+    assert len(files) == 2  # one record per file, the oldest pruned
+    records = list(read_records(files))
+    assert len(records) == 2
+    assert records[0]["received_at"] <= records[1]["received_at"]
+    assert records[0]["body"]["idMessage"] == jpg_personal["idMessage"]
+    assert recorder.stats()["recorded"] == 3
+
+
+
+@patch.object(WebhookRecorder, '_ensure_thread')  # writer stalled
+def test_queue_holds_stripped_requests_and_is_bounded(mock_thread, tmp_path):
+    recorder = WebhookRecorder(str(tmp_path), file_bytes=10 ** 6, max_files=5, salt="s", queue_size=2)
+    assert recorder.record(jpg_personal) and recorder.record(jpg_personal)
+    assert not recorder.record(jpg_personal)
+    assert recorder.stats()["dropped"] == 1
+
+    _, queued = recorder._queue.get_nowait()
+    assert queued["messageData"]["fileMessageData"]["jpegThumbnail"] == "..."
+    assert jpg_personal["messageData"]["fileMessageData"]["jpegThumbnail"] != "..."  # original untouched
+
+
+def test_truncated_log_replays_complete_lines(tmp_path):
+    recorder = WebhookRecorder(str(tmp_path), file_bytes=10 ** 6, max_files=5, salt="s")
+    recorder.record(jpg_personal)
+    recorder.record(jpg_personal)
+    recorder.flush()  # lines synced, the file is still open - as after a crash
+    path = recorded_files(str(tmp_path))[0]
+    with open(path, "rb") as f:
+        partial = f.read()
+    crashed = tmp_path / "crashed.ndjson.gz"
+    crashed.write_bytes(partial)
+    assert len(list(read_records([str(crashed)]))) == 2
+    recorder.close()
+    with gzip.open(path, "rt") as f:
+        assert len(f.readlines()) == 2
+
+
+def test_disabled_without_directory():
+    recorder = WebhookRecorder("", file_bytes=1, max_files=1, salt="")
+    assert not recorder.record(jpg_personal)
+    assert recorder._thread is None
+
+
+def test_replay_schedule_keeps_gaps():
+    records = [{"received_at": 100.0}, {"received_at": 101.0}, {"received_at": 104.0}]
+    assert send_offsets(records, 1.0) == [0.0, 1.0, 4.0]
+    assert send_offsets(records, 4.0) == [0.0, 0.25, 1.0]
+    assert send_offsets(records, 0.0) == [0.0, 0.0, 0.0]  # max speed
+    assert not os.environ.get("WEBHOOK_RECORD_DIR")  # never records during the test run
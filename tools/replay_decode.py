@@ -0,0 +1,99 @@
+"""
+Replays a captured decode corpus (DECODE_CAPTURE_DIR) through a decoder configuration - the decode benchmark.
+
+    python -m tools.replay_decode /data/decode-corpus
+    python -m tools.replay_decode /data/decode-corpus --strategies contrast,plain --failed-only
+    python -m tools.replay_decode /data/decode-corpus --localize-min-side 600 --json > run.json
+
+Per image: the strategies tried in the given order until one decodes, and the time spent.
+Summary: decode rate, images recovered that failed in production, attempts and milliseconds per image.
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from time import perf_counter
+
+from PIL import Image
+
+from core.engine import DECODE_STRATEGIES, FOOD_BARCODES
+
+
+def replay_image(path: str, strategies: list, localize_min_side: int) -> dict:
+    image = Image.open(path)
+    image.load()
+    result = {"image": os.path.basename(path), "tried": [], "winner": None, "barcodes": []}
+    started = perf_counter()
+    for name in strategies:
+        if name == "localized" and max(image.size) < localize_min_side:
+            continue
+        result["tried"].append(name)
+        barcodes = [b for b in DECODE_STRATEGIES[name](image) if b.type in FOOD_BARCODES]
+        if barcodes:
+            result["winner"] = name
+            result["barcodes"] = [b.data.decode("utf-8") for b in barcodes]
+            break
+    result["ms"] = round((perf_counter() - started) * 1000, 1)
+    return result
+
+
+def load_trace(image_path: str) -> dict:
+    try:
+        with open(os.path.splitext(image_path)[0] + ".json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="directory with captured <name>.jpg + <name>.json samples")
+    parser.add_argument("--strategies", default=",".join(DECODE_STRATEGIES),
+                        help=f"comma separated order, of: {', '.join(DECODE_STRATEGIES)}")
+    parser.add_argument("--localize-min-side", type=int, default=1000,
+                        help="'localized' only runs on images with a longest side of at least this")
+    parser.add_argument("--failed-only", action="store_true", help="only samples that failed in production")
+    parser.add_argument("--json", action="store_true", help="one JSON result per line instead of a table")
+    args = parser.parse_args(argv)
+
+    strategies = [name.strip() for name in args.strategies.split(",") if name.strip()]
+    if unknown := set(strategies) - set(DECODE_STRATEGIES):
+        parser.error(f"unknown strategies: {', '.join(sorted(unknown))}")
+
+    images = sorted(
+        os.path.join(args.corpus, name) for name in os.listdir(args.corpus) if name.endswith(".jpg")
+    )
+    results, wins = [], Counter()
+    for path in images:
+        trace = load_trace(path)
+        if args.failed_only and not trace.get("failed", True):
+            continue
+        result = replay_image(path, strategies, args.localize_min_side)
+        result["failed_before"] = trace.get("failed")
+        results.append(result)
+        wins[result["winner"]] += 1
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(f"{result['image']:<28} {result['winner'] or '-':<10} {','.join(result['tried']):<26} {result['ms']:>8}ms")
+
+    if not results:
+        print("No samples found", file=sys.stderr)
+        return 1
+    decoded = [r for r in results if r["winner"]]
+    summary = {
+        "images": len(results),
+        "decoded": len(decoded),
+        "decode_rate": round(len(decoded) / len(results), 3),
+        "recovered": sum(1 for r in decoded if r["failed_before"]),
+        "avg_attempts": round(sum(len(r["tried"]) for r in results) / len(results), 2),
+        "avg_ms": round(sum(r["ms"] for r in results) / len(results), 1),
+        "wins": {name or "none": count for name, count in wins.most_common()},
+    }
+    print(json.dumps({"summary": summary}) if args.json else "\n" + json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
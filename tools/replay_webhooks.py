@@ -0,0 +1,123 @@
+"""
+Re-drives recorded webhooks (WEBHOOK_RECORD_DIR) against a running instance - capacity tests on real traffic shapes.
+
+    python -m tools.replay_webhooks /data/webhooks
+    python -m tools.replay_webhooks /data/webhooks/webhooks-1768380439000-0000.ndjson.gz --speed 10
+    python -m tools.replay_webhooks /data/webhooks --speed max --url http://127.0.0.1:8000/webhook-green
+
+--speed 1 keeps the recorded inter-arrival gaps, N divides them by N, max sends as fast as --concurrency allows.
+Each request's 'timestamp' is moved to its send time (the bot drops stale messages) unless --keep-timestamps.
+Point the instance at test Green/GOK credentials - phone numbers in the log are stand-ins, not real chats.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from collections import Counter
+from time import perf_counter, time
+
+import aiohttp
+
+from utils.webhook_recorder import read_records, recorded_files
+
+
+def parse_speed(value: str) -> float:
+    if value == "max":
+        return 0.0
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+
+def send_offsets(records: list, speed: float) -> list:
+    """ Seconds from the start of the replay at which each record is sent """
+    if not speed or not records:
+        return [0.0] * len(records)
+    first = records[0]["received_at"]
+    return [max(0.0, record["received_at"] - first) / speed for record in records]
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def replay(records: list, url: str, speed: float, concurrency: int, keep_timestamps: bool) -> dict:
+    statuses, latencies = Counter(), []
+    limit = asyncio.Semaphore(concurrency)
+    lag = 0.0  # how far behind the recorded schedule sending fell
+
+    async def send(session, body):
+        async with limit:
+            started = perf_counter()
+            try:
+                async with session.post(url, json=body) as response:
+                    await response.read()
+                    statuses[response.status] += 1
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                statuses[type(e).__name__] += 1
+            latencies.append((perf_counter() - started) * 1000)
+
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        tasks = []
+        started = perf_counter()
+        for record, offset in zip(records, send_offsets(records, speed)):
+            delay = offset - (perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                lag = max(lag, -delay)
+            body = record["body"]
+            if not keep_timestamps and "timestamp" in body:
+                body = {**body, "timestamp": int(time())}
+            tasks.append(asyncio.create_task(send(session, body)))
+        await asyncio.gather(*tasks)
+        elapsed = perf_counter() - started
+
+    return {
+        "sent": len(records),
+        "seconds": round(elapsed, 2),
+        "rate_per_second": round(len(records) / elapsed, 1) if elapsed else None,
+        "max_schedule_lag_ms": round(lag * 1000, 1),
+        "statuses": {str(status): count for status, count in statuses.most_common()},
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.5), 1),
+            "p95": round(percentile(latencies, 0.95), 1),
+            "p99": round(percentile(latencies, 0.99), 1),
+            "max": round(max(latencies, default=0.0), 1),
+        },
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="+", help="recorded .ndjson.gz files, or directories holding them")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/webhook-green")
+    parser.add_argument("--speed", type=parse_speed, default=1.0, help="1 (recorded pace), N (N times faster) or max")
+    parser.add_argument("--concurrency", type=int, default=100, help="max requests in flight")
+    parser.add_argument("--limit", type=int, default=0, help="replay only the first N records")
+    parser.add_argument("--keep-timestamps", action="store_true", help="send the recorded 'timestamp' as is")
+    args = parser.parse_args(argv)
+
+    paths = []
+    for path in args.logs:
+        paths.extend(recorded_files(path) if os.path.isdir(path) else [path])
+    records = list(read_records(paths))
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("No records found", file=sys.stderr)
+        return 1
+
+    summary = asyncio.run(replay(records, args.url, args.speed, args.concurrency, args.keep_timestamps))
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import threading
+from contextlib import contextmanager
+from time import time
+
+from config import (
+    logger,
+    ADMISSION_SOFT_PENDING,
+    ADMISSION_MAX_PENDING,
+    ADMISSION_STALE_SECONDS,
+    STAGE_LIMITS,
+    DECODE_MEMORY_BUDGET_MB,
+)
+from utils.metrics import metrics
+from utils.verdict_cache import VerdictCache
+
+WORK_CLASSES = ("private_text", "private_image", "group_image")
+
+ADMITTED = "admitted"
+SHED = "shed"    # dropped silently - cheap to lose (group images)
+RETRY = "retry"  # tell Green to redeliver later (a private user is waiting)
+
+
+class AdmissionController:
+    """
+    Bounds the work waiting behind the webhook ack and the concurrency of each engine stage.
+    Under overload, work is shed cheapest-first: stale group images, then group lookups of barcodes
+    that were just asked (duplicates), then all group images. Private work is answered with RETRY.
+    """
+    def __init__(self, soft_pending: int, max_pending: int, stale_seconds: int,
+                 stage_limits: dict, memory_budget_bytes: int):
+        self.soft_pending = soft_pending
+        self.max_pending = max_pending
+        self.stale_seconds = stale_seconds
+        self.memory_budget_bytes = memory_budget_bytes
+        self._pending = dict.fromkeys(WORK_CLASSES, 0)
+        self._stages = {name: threading.BoundedSemaphore(limit) for name, limit in stage_limits.items()}
+        self._stage_limits = dict(stage_limits)
+        self._memory_in_use = 0
+        self._memory_cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._recent_group_barcodes = VerdictCache(max_items=1000, ttl_seconds=300)
+
+    @property
+    def pending(self) -> int:
+        return sum(self._pending.values())
+
+    def overloaded(self) -> bool:
+        return self.pending >= self.soft_pending
+
+    def admit(self, work_class: str, timestamp: int = None) -> str:
+        """ Decides whether a webhook message is queued. Call release(work_class) when ADMITTED work is done """
+        with self._lock:
+            pending = self.pending
+            decision, reason = ADMITTED, None
+            if work_class == "group_image":
+                if pending >= self.max_pending:
+                    decision, reason = SHED, "group_image_overload"
+                elif pending >= self.soft_pending and timestamp and time() - timestamp > self.stale_seconds:
+                    decision, reason = SHED, "group_image_stale"
+            elif pending >= self.max_pending:
+                decision, reason = RETRY, work_class
+
+            if decision == ADMITTED:
+                self._pending[work_class] += 1
+                metrics.incr(f"admission.admitted.{work_class}")
+            else:
+                metrics.incr(f"admission.{decision}.{reason}")
+                logger.info(f"Admission {decision} ({reason}), pending: {self._pending}")
+            return decision
+
+    def release(self, work_class: str) -> None:
+        with self._lock:
+            self._pending[work_class] -= 1
+
+    def shed_duplicate_group_barcode(self, barcode_data: str) -> bool:
+        """ True if a group lookup of this barcode should be skipped: overloaded and it was just looked up """
+        if self._recent_group_barcodes.get(barcode_data) is not None:
+            if self.overloaded():
+                metrics.incr("admission.shed.duplicate_barcode")
+                return True
+        self._recent_group_barcodes.put(barcode_data, "1")
+        return False
+
+    @contextmanager
+    def stage(self, name: str, memory_bytes: int = 0):
+        """
+        Runs a block within the concurrency limit of stage `name` (blocking - call from worker threads),
+        reserving `memory_bytes` from the shared memory budget. An oversized single job is still let in
+        alone rather than never running.
+        """
+        with self._stages[name]:
+            with self._memory_cond:
+                while self._memory_in_use and self._memory_in_use + memory_bytes > self.memory_budget_bytes:
+                    self._memory_cond.wait()
+                self._memory_in_use += memory_bytes
+            try:
+                yield
+            finally:
+                with self._memory_cond:
+                    self._memory_in_use -= memory_bytes
+                    self._memory_cond.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "pending": dict(self._pending),
+            "soft_pending": self.soft_pending,
+            "max_pending": self.max_pending,
+            "stage_limits": self._stage_limits,
+            "memory_in_use_mb": round(self._memory_in_use / 2**20, 1),
+            "memory_budget_mb": round(self.memory_budget_bytes / 2**20, 1),
+        }
+
+
+admission = AdmissionController(
+    soft_pending=ADMISSION_SOFT_PENDING,
+    max_pending=ADMISSION_MAX_PENDING,
+    stale_seconds=ADMISSION_STALE_SECONDS,
+    stage_limits=STAGE_LIMITS,
+    memory_budget_bytes=DECODE_MEMORY_BUDGET_MB * 2**20,
+)  # Singleton instance
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+from collections import deque
+from time import time
+
+from config import (
+    logger,
+    BREAKER_ERROR_RATE,
+    BREAKER_MIN_CALLS,
+    BREAKER_WINDOW_SECONDS,
+    BREAKER_OPEN_SECONDS,
+    BREAKER_SYNC_SECONDS,
+)
+from utils.metrics import metrics
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    """
+    closed: calls pass, outcomes of the last `window_seconds` are kept. At `min_calls` or more with an
+            error rate >= `error_rate` it opens.
+    open: calls fail fast for `open_seconds`, then one probe call is let through (half_open).
+    half_open: the probe's success closes the breaker, its failure opens it again.
+    Thread-safe (engine calls run in worker threads). Shared between instances by breaker_sync_loop.
+    """
+    def __init__(self, name: str, error_rate: float, min_calls: int, window_seconds: int, open_seconds: int):
+        self.name = name
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self._state = CLOSED
+        self._open_until = 0.0
+        self._opened_here = False  # opened by our own failures (published) or by another instance (applied)
+        self._probe_in_flight = False
+        self._calls = deque()  # (timestamp, ok)
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now >= self._open_until:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        """ False = fail fast. A True from half_open is the probe - its outcome must be recorded """
+        with self._lock:
+            state = self._current_state(time())
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+        metrics.incr(f"breaker.{self.name}.rejected")
+        return False
+
+    def record(self, ok: bool) -> None:
+        now = time()
+        with self._lock:
+            if self._current_state(now) == HALF_OPEN:
+                self._probe_in_flight = False
+                if ok:
+                    self._state = CLOSED
+                    self._calls.clear()
+                    logger.info(f"Circuit {self.name} closed")
+                else:
+                    self._open(now)
+                return
+            self._calls.append((now, ok))
+            while self._calls and self._calls[0][0] < now - self.window_seconds:
+                self._calls.popleft()
+            failures = sum(1 for _, call_ok in self._calls if not call_ok)
+            if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.error_rate:
+                self._open(now)
+
+    def _open(self, now: float, until: float = None, here: bool = True) -> None:
+        self._state = OPEN
+        self._open_until = until or now + self.open_seconds
+        self._opened_here = here
+        metrics.incr(f"breaker.{self.name}.opened")
+        logger.warning(f"Circuit {self.name} open until {self._open_until:.0f} ({'local' if here else 'shared'})")
+
+    def apply_shared(self, open_until: float) -> None:
+        """ Another instance opened this breaker - fail fast here too until it expires """
+        with self._lock:
+            if self._current_state(time()) == CLOSED and open_until > time():
+                self._open(time(), until=open_until, here=False)
+
+    def published_open_until(self):
+        """ open_until to share with other instances, None if not opened by our own failures """
+        with self._lock:
+            if self._current_state(time()) == OPEN and self._opened_here:
+                return self._open_until
+        return None
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._calls.clear()
+            self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        state = self.state
+        return {"state": state, "open_until": round(self._open_until) if state == OPEN else None}
+
+
+gok_breaker = CircuitBreaker(
+    "gok", BREAKER_ERROR_RATE, BREAKER_MIN_CALLS, BREAKER_WINDOW_SECONDS, BREAKER_OPEN_SECONDS
+)
+green_breaker = CircuitBreaker(
+    "green", BREAKER_ERROR_RATE, BREAKER_MIN_CALLS, BREAKER_WINDOW_SECONDS, BREAKER_OPEN_SECONDS
+)
+BREAKERS = (gok_breaker, green_breaker)
+
+
+async def sync_breakers(db) -> None:
+    """ Publishes breakers opened here and applies the ones opened by other instances (one MGET) """
+    for breaker in BREAKERS:
+        if (open_until := breaker.published_open_until()) is not None:
+            await db.publish_breaker(breaker.name, open_until)
+    shared = await db.get_breakers([breaker.name for breaker in BREAKERS])
+    for breaker in BREAKERS:
+        if shared.get(breaker.name):
+            breaker.apply_shared(shared[breaker.name])
+
+
+async def breaker_sync_loop(db) -> None:
+    while True:
+        await asyncio.sleep(BREAKER_SYNC_SECONDS)
+        try:
+            await sync_breakers(db)
+        except Exception as e:
+            logger.error(f"Failed to sync circuit breakers: {e}")
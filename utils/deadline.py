@@ -0,0 +1,40 @@
+from time import time
+from typing import Optional
+
+from config import STAGE_BUDGETS, REPLY_MAX_AGE_GROUP, REPLY_MAX_AGE_PRIVATE
+from utils.metrics import metrics
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage: str):
+        super().__init__(f"Deadline exceeded before/at stage '{stage}'")
+        self.stage = stage
+
+
+class Deadline:
+    """
+    Time budget of one message: an absolute expiry derived from its webhook timestamp,
+    and a maximum per stage (download/decode/gok/send). Stages ask for their timeout,
+    which is the smaller of the two; once nothing is left the stage is cancelled cooperatively.
+    """
+    def __init__(self, expires_at: Optional[float] = None, budgets: dict = None):
+        self.expires_at = expires_at
+        self.budgets = budgets or STAGE_BUDGETS
+
+    @classmethod
+    def for_message(cls, timestamp: int, is_group: bool) -> "Deadline":
+        """ A group reply older than a few minutes is noise; a private user waits longer """
+        return cls(timestamp + (REPLY_MAX_AGE_GROUP if is_group else REPLY_MAX_AGE_PRIVATE))
+
+    def remaining(self) -> float:
+        return float("inf") if self.expires_at is None else self.expires_at - time()
+
+    def timeout(self, stage: str) -> float:
+        """ Seconds `stage` may take. Raises DeadlineExceeded (and counts it) if the message ran out of time """
+        remaining = self.remaining()
+        if remaining <= 0:
+            metrics.incr(f"deadline.exceeded.{stage}")
+            raise DeadlineExceeded(stage)
+        return min(self.budgets[stage], remaining)
+
+    check = timeout  # for stages that cannot take a timeout (decode) - just verify there is time left
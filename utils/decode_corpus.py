@@ -0,0 +1,100 @@
+import io
+import json
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+from config import (
+    logger,
+    DECODE_CAPTURE_DIR,
+    DECODE_CAPTURE_FAILURE_RATE,
+    DECODE_CAPTURE_SUCCESS_RATE,
+    DECODE_CAPTURE_MAX_MB,
+    DECODE_CAPTURE_MAX_SIDE,
+)
+
+
+class DecodeCorpus:
+    """
+    Opt-in sampled capture of decoded/undecodable images for offline tuning (replay: tools/replay_decode.py).
+    Each sample is a re-encoded JPEG - downscaled to `max_side`, no EXIF/ICC/GPS metadata - and a JSON
+    trace of the decode attempts next to it. The oldest samples are removed past `max_bytes`.
+    Writing runs on a single background thread, off the reply path; at most `max_queued` samples wait
+    for it (the rest are dropped). Disabled when `directory` is empty.
+    """
+    def __init__(self, directory: str, failure_rate: float, success_rate: float, max_bytes: int, max_side: int,
+                 max_queued: int = 4):
+        self.directory = directory
+        self.failure_rate = failure_rate
+        self.success_rate = success_rate
+        self.max_bytes = max_bytes
+        self.max_side = max_side
+        self.dropped = 0
+        self._slots = threading.BoundedSemaphore(max_queued)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="decode-corpus")
+
+    def sample(self, image: "Image.Image", trace: dict, failed: bool) -> bool:
+        """ Queues `image` for capture with probability by outcome. True if it was queued """
+        if not self.directory or random.random() >= (self.failure_rate if failed else self.success_rate):
+            return False
+        if not self._slots.acquire(blocking=False):
+            self.dropped += 1  # the writer is behind - never hold more than a few bitmaps for it
+            return False
+        try:
+            # downscale now - the caller releases the bitmap (and its decode memory budget) right after,
+            # a full resolution copy would be that budget again outside of it
+            sample = image.convert("RGB") if image.mode not in ("RGB", "L") else image
+            factor = max(sample.size) // self.max_side
+            sample = sample.reduce(factor) if factor > 1 else sample.copy()
+            sample.thumbnail((self.max_side, self.max_side))
+            self._writer.submit(self._write, sample, {**trace, "failed": failed, "captured_at": round(time())})
+        except Exception:
+            self._slots.release()
+            raise
+        return True
+
+    def _write(self, image: "Image.Image", trace: dict) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=85)  # no exif/icc_profile passed = stripped
+            name = f"{trace['captured_at']}-{random.getrandbits(32):08x}"
+            with open(os.path.join(self.directory, f"{name}.jpg"), "wb") as f:
+                f.write(buffer.getvalue())
+            with open(os.path.join(self.directory, f"{name}.json"), "w") as f:
+                json.dump({**trace, "size": list(image.size)}, f)
+            self._rotate()
+        except Exception:
+            logger.exception("Failed to capture decode sample")
+        finally:
+            self._slots.release()
+
+    def _rotate(self) -> None:
+        """ Deletes the oldest samples, image and trace together, until the store fits `max_bytes` """
+        samples = {}  # name -> [(path, size)] of its .jpg and .json
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                name = os.path.splitext(entry.name)[0]
+                samples.setdefault(name, []).append((entry.path, entry.stat().st_size))
+        total = sum(size for files in samples.values() for _, size in files)
+        for name in sorted(samples):  # names start with the capture time
+            if total <= self.max_bytes:
+                break
+            for path, size in samples[name]:
+                os.remove(path)
+                total -= size
+
+    def flush(self) -> None:
+        """ Waits for queued captures (tests, shutdown) """
+        self._writer.submit(lambda: None).result()
+
+
+decode_corpus = DecodeCorpus(
+    DECODE_CAPTURE_DIR,
+    DECODE_CAPTURE_FAILURE_RATE,
+    DECODE_CAPTURE_SUCCESS_RATE,
+    DECODE_CAPTURE_MAX_MB * 1024 * 1024,
+    DECODE_CAPTURE_MAX_SIDE,
+)  # Singleton instance
@@ -0,0 +1,92 @@
+import asyncio
+import random
+import threading
+from collections import Counter
+
+from config import logger, DECODE_EXPLORE_RATE, DECODE_MIN_SAMPLES, DECODE_STATS_INTERVAL
+
+STATS_KEY = "decode:stats"  # hash of "<context>|<strategy>|tries" / "|wins" -> count, shared by all instances
+
+
+class DecodeTuner:
+    """
+    Orders decode strategies per image context (size bucket + format) by their observed success rate,
+    so most images are decoded by the first attempt.
+    - a strategy's estimate is the Beta posterior mean (wins + 1) / (tries + 2);
+    - until a context has DECODE_MIN_SAMPLES images the default order is kept;
+    - then, on DECODE_EXPLORE_RATE of the images, the order is Thompson-sampled instead of greedy,
+      so a strategy that lost the lead still gets tried first now and then.
+    Counts are kept in-process and merged with the other instances' through Redis by decode_stats_loop.
+    """
+    def __init__(self, explore_rate: float, min_samples: int):
+        self.explore_rate = explore_rate
+        self.min_samples = min_samples
+        self._totals = Counter()  # everything known, including the pending counts
+        self._pending = Counter()  # not yet flushed to Redis
+        self._lock = threading.Lock()
+
+    def order(self, context: str, strategies: list) -> list:
+        with self._lock:
+            stats = {s: (self._totals[f"{context}|{s}|wins"], self._totals[f"{context}|{s}|tries"]) for s in strategies}
+            images = self._totals[f"{context}|images"]
+        if images < self.min_samples:
+            return list(strategies)
+        if random.random() < self.explore_rate:
+            score = {s: random.betavariate(wins + 1, tries - wins + 1) for s, (wins, tries) in stats.items()}
+        else:
+            score = {s: (wins + 1) / (tries + 2) for s, (wins, tries) in stats.items()}
+        return sorted(strategies, key=lambda s: score[s], reverse=True)  # stable: ties keep the default order
+
+    def record(self, context: str, tried: list, winner: str = None) -> None:
+        with self._lock:
+            for counts in (self._totals, self._pending):
+                counts[f"{context}|images"] += 1
+                for strategy in tried:
+                    counts[f"{context}|{strategy}|tries"] += 1
+                if winner:
+                    counts[f"{context}|{winner}|wins"] += 1
+
+    def drain(self) -> dict:
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        return dict(pending)
+
+    def restore(self, pending: dict) -> None:
+        """ Puts back drained counts that could not be flushed """
+        with self._lock:
+            self._pending.update(pending)
+
+    def load(self, totals: dict) -> None:
+        """ Replaces the known counts with Redis totals, keeping what is still pending """
+        with self._lock:
+            self._totals = Counter(totals) + self._pending
+
+    def reset(self) -> None:
+        with self._lock:
+            self._totals.clear()
+            self._pending.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._totals)
+
+
+decode_tuner = DecodeTuner(DECODE_EXPLORE_RATE, DECODE_MIN_SAMPLES)  # Singleton instance
+
+
+async def sync_decode_stats(db) -> None:
+    """ Adds our pending counts to the shared hash and loads everyone's totals (one round trip) """
+    pending = decode_tuner.drain()
+    try:
+        totals = await db.add_hash_counts(STATS_KEY, pending)
+    except Exception:
+        logger.exception("Failed to sync decode stats")
+        decode_tuner.restore(pending)
+        return
+    decode_tuner.load(totals)
+
+
+async def decode_stats_loop(db) -> None:
+    while True:
+        await sync_decode_stats(db)
+        await asyncio.sleep(DECODE_STATS_INTERVAL)
@@ -0,0 +1,59 @@
+import re
+from typing import Optional
+
+GTIN_LENGTHS = (8, 12, 13, 14)  # EAN-8, UPC-A, EAN-13, GTIN-14
+
+
+def check_digit(body: str) -> int:
+    """ GS1 mod-10 check digit of `body` (all digits but the last): weights 3,1,3,... from the right """
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(body)))
+    return (10 - total % 10) % 10
+
+
+def is_valid(code: str) -> bool:
+    return code.isdigit() and len(code) in GTIN_LENGTHS and int(code[-1]) == check_digit(code[:-1])
+
+
+def normalize(digits: str) -> Optional[str]:
+    """
+    Canonical form of a typed/decoded GTIN, None if it is not one (wrong length or check digit).
+    UPC-A and GTIN-14 with a '0' indicator become EAN-13 (GS1 zero padding); EAN-8 stays 8 digits.
+    Zero padding beyond 14 digits is dropped.
+    """
+    if not digits.isdigit():
+        return None
+    if len(digits) > 14:
+        digits = digits.lstrip("0").rjust(13, "0")
+    if not is_valid(digits):
+        return None
+    if len(digits) == 12:
+        return "0" + digits
+    if len(digits) == 14 and digits.startswith("0"):
+        return digits[1:]
+    return digits
+
+
+def canonical_key(code: str) -> str:
+    """ Key for caches and dedup: the normalized GTIN, or `code` itself when it is not a valid one """
+    return normalize(code) or code
+
+
+def variants(code: str) -> list:
+    """ `code` and every form without its leading zeros - GOK may store any of them """
+    num_leading_zeros = len(code) - len(code.lstrip("0"))
+    return [code] + [code[i:] for i in range(1, num_leading_zeros + 1)]
+
+
+def extract_gtins(text: str) -> list:
+    """
+    Valid GTINs in a typed message, normalized and deduplicated, in order.
+    Each line (or comma separated item) is one barcode, spaces/dashes inside it allowed;
+    a line that is not one valid GTIN is tried as several whitespace separated ones.
+    """
+    found = []
+    for item in re.split(r"[\n,;]+", text):
+        if code := normalize("".join(c for c in item if c.isdigit())):
+            found.append(code)
+            continue
+        found.extend(code for token in re.findall(r"\d+", item) if (code := normalize(token)))
+    return list(dict.fromkeys(found))
@@ -0,0 +1,93 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import perf_counter
+from typing import Callable
+
+from config import HEDGE_BUDGET_RATIO, HEDGE_MIN_DELAY, HEDGE_MAX_DELAY, STAGE_LIMITS
+from utils.metrics import metrics
+
+BUDGET_BURST = 2  # hedges allowed before any request history exists
+BUDGET_HALVE_AT = 1000  # requests; halving both counters keeps the budget about recent traffic
+
+
+class Hedger:
+    """
+    Runs a blocking call and, if it has not answered within the p95 of recent latencies,
+    an identical second call. The first success wins; the loser is cancelled if it has not started,
+    otherwise its result is ignored (a blocking requests call cannot be aborted mid-flight).
+    Hedges are limited to `budget_ratio` of all calls.
+    """
+    def __init__(self, name: str, budget_ratio: float, min_delay: float, max_delay: float,
+                 pool_size: int, samples: int = 200):
+        self.name = name
+        self.budget_ratio = budget_ratio
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._latencies = deque(maxlen=samples)
+        self._calls = 0
+        self._hedges = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix=f"{name}-hedge")
+
+    def delay(self) -> float:
+        """ p95 of recent successful latencies, clamped; max_delay until there are enough samples """
+        with self._lock:
+            if len(self._latencies) < 20:
+                return self.max_delay
+            ordered = sorted(self._latencies)
+        p95 = ordered[int(len(ordered) * 0.95) - 1]
+        return min(max(p95, self.min_delay), self.max_delay)
+
+    def _try_spend(self) -> bool:
+        with self._lock:
+            if self._hedges >= self._calls * self.budget_ratio + BUDGET_BURST:
+                return False
+            self._hedges += 1
+            return True
+
+    def _timed(self, fn: Callable):
+        started = perf_counter()
+        result = fn()
+        elapsed = perf_counter() - started
+        with self._lock:
+            self._latencies.append(elapsed)
+        metrics.observe(f"{self.name}.latency", elapsed)
+        return result
+
+    def call(self, fn: Callable):
+        with self._lock:
+            self._calls += 1
+            if self._calls >= BUDGET_HALVE_AT:
+                self._calls //= 2
+                self._hedges //= 2
+        primary = self._pool.submit(self._timed, fn)
+        done, _ = wait([primary], timeout=self.delay())
+        if done or not self._try_spend():
+            return primary.result()
+
+        metrics.incr(f"{self.name}.hedge.sent")
+        hedge = self._pool.submit(self._timed, fn)
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                metrics.incr(f"{self.name}.hedge.{'won' if future is hedge else 'lost'}")
+                return result
+        raise error
+
+    def stats(self) -> dict:
+        delay = self.delay()
+        with self._lock:
+            return {"delay": round(delay, 3), "calls": self._calls, "hedges": self._hedges}
+
+
+# pool: one primary and at most one hedge per GOK stage slot
+gok_hedger = Hedger("gok", HEDGE_BUDGET_RATIO, HEDGE_MIN_DELAY, HEDGE_MAX_DELAY, pool_size=STAGE_LIMITS["gok"] * 2)
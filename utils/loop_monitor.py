@@ -0,0 +1,151 @@
+import asyncio
+import os
+import sys
+import threading
+import traceback
+from time import perf_counter
+
+from config import logger, LOOP_MONITOR_INTERVAL, LOOP_LAG_THRESHOLD
+from utils.metrics import metrics
+
+LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+THIS_FILE = os.path.abspath(__file__)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(THIS_FILE))
+
+
+def _call_site(stack: traceback.StackSummary) -> str:
+    """ The innermost frame of our own code ("core/engine.py:120 in check_barcode"), else the innermost one """
+    for frame in reversed(stack):
+        path = os.path.abspath(frame.filename)
+        if path.startswith(PROJECT_ROOT + os.sep) and "site-packages" not in path and path != THIS_FILE:
+            return f"{os.path.relpath(path, PROJECT_ROOT)}:{frame.lineno} in {frame.name}"
+    frame = stack[-1]
+    return f"{frame.filename}:{frame.lineno} in {frame.name}"
+
+
+class LoopMonitor:
+    """
+    Measures event-loop lag with a heartbeat task (how late each `interval` sleep wakes up, "event_loop.lag").
+    A watchdog thread checks the heartbeat; once it is `threshold` late, the loop thread's stack is captured
+    (sys._current_frames) and counted under its call site - the sync code that blocks the loop.
+    The stall's measured length is added to that site when the heartbeat resumes.
+    Disabled when `threshold` is 0.
+    """
+    def __init__(self, interval: float, threshold: float, max_sites: int = 50, stack_depth: int = 12):
+        self.interval = interval
+        self.threshold = threshold
+        self.max_sites = max_sites
+        self.stack_depth = stack_depth
+        self._sites = {}  # call site -> {"count", "blocked_seconds", "max_seconds", "stack"}
+        self._stall_site = None  # site captured for the stall in progress
+        self._last_beat = perf_counter()
+        self._loop_thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._task = None
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def start(self) -> None:
+        """ Starts the heartbeat on the running loop and the watchdog thread """
+        if not self.enabled or self._task:
+            return
+        self._loop_thread = threading.get_ident()
+        self._last_beat = perf_counter()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = perf_counter()
+            self.beat(max(0.0, now - expected), now)
+
+    def beat(self, lag: float, now: float) -> None:
+        metrics.observe("event_loop.lag", lag, buckets=LAG_BUCKETS)
+        with self._lock:
+            self._last_beat = now
+            site, self._stall_site = self._stall_site, None
+            if site in self._sites:
+                entry = self._sites[site]
+                entry["blocked_seconds"] += lag
+                entry["max_seconds"] = max(entry["max_seconds"], lag)
+        if lag >= self.threshold:
+            metrics.incr("event_loop.stalls")
+
+    def _watch(self) -> None:
+        while not self._stop.wait(min(self.interval, self.threshold) / 2):
+            try:
+                self.check(perf_counter())
+            except Exception:
+                logger.exception("Event loop watchdog failed")
+
+    def check(self, now: float):
+        """ Captures the loop thread's stack once per stall. Returns the call site, or None """
+        with self._lock:
+            last_beat = self._last_beat
+            if self._stall_site is not None or now - last_beat < self.interval + self.threshold:
+                return None
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return None
+        stack = traceback.extract_stack(frame)
+        del frame
+        site = _call_site(stack)
+        with self._lock:
+            if self._last_beat != last_beat:
+                return None  # the stall ended while capturing - the stack is of whatever runs now
+            if site not in self._sites and len(self._sites) >= self.max_sites:
+                least = min(self._sites, key=lambda s: self._sites[s]["blocked_seconds"])
+                del self._sites[least]
+            entry = self._sites.setdefault(site, {"count": 0, "blocked_seconds": 0.0, "max_seconds": 0.0})
+            entry["count"] += 1
+            entry["stack"] = [f"{f.filename}:{f.lineno} in {f.name}" for f in stack[-self.stack_depth:]]
+            self._stall_site = site
+        logger.warning(f"Event loop blocked {now - last_beat - self.interval:.2f}s at {site}")
+        return site
+
+    def stats(self, top: int = 10) -> dict:
+        with self._lock:
+            sites = sorted(self._sites.items(), key=lambda item: item[1]["blocked_seconds"], reverse=True)
+            blocking = [
+                {
+                    "site": site,
+                    "count": entry["count"],
+                    "blocked_seconds": round(entry["blocked_seconds"], 3),
+                    "max_seconds": round(entry["max_seconds"], 3),
+                    "stack": entry["stack"],
+                }
+                for site, entry in sites[:top]
+            ]
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "stalls": metrics.get("event_loop.stalls"),
+            "lag": metrics.snapshot()["histograms"].get("event_loop.lag"),
+            "blocking_sites": blocking,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._sites.clear()
+            self._stall_site = None
+
+
+loop_monitor = LoopMonitor(LOOP_MONITOR_INTERVAL, LOOP_LAG_THRESHOLD)  # Singleton instance
@@ -0,0 +1,60 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # seconds
+
+
+class Metrics:
+    """
+    Minimal thread-safe in-process counters and histograms (served by /health/metrics).
+    Names are dotted strings, e.g. "admission.shed.group_image_stale".
+    """
+    def __init__(self):
+        self._counters = defaultdict(int)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS) -> None:
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = {
+                    "buckets": buckets, "counts": [0] * (len(buckets) + 1), "count": 0, "sum": 0.0, "max": 0.0
+                }
+            hist["counts"][bisect_left(hist["buckets"], value)] += 1
+            hist["count"] += 1
+            hist["sum"] += value
+            hist["max"] = max(hist["max"], value)
+
+    def get(self, name: str) -> int:
+        return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = {
+                name: {
+                    "count": h["count"],
+                    "avg": round(h["sum"] / h["count"], 4) if h["count"] else 0,
+                    "max": round(h["max"], 4),
+                    # cumulative counts per upper bound, like Prometheus "le" buckets
+                    "le": {
+                        str(bound): sum(h["counts"][:i + 1])
+                        for i, bound in enumerate(h["buckets"])
+                    } | {"inf": h["count"]},
+                }
+                for name, h in self._histograms.items()
+            }
+            return {"counters": dict(self._counters), "histograms": histograms}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+metrics = Metrics()  # Singleton instance
@@ -0,0 +1,164 @@
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from bisect import bisect_left
+from time import time
+from typing import Optional
+
+from config import logger, PRODUCT_INDEX_PATH
+
+MAGIC = b"GOKIDX1\0"
+HEADER = struct.Struct("<8sI4x")  # magic, record count
+KEY_WIDTH = 14  # GTIN-14, shorter keys are NUL padded on the right
+OFFSET = struct.Struct("<I")
+RELOAD_CHECK_SECONDS = 60
+
+
+def _pack_key(key: str) -> bytes:
+    return key.encode("ascii").ljust(KEY_WIDTH, b"\0")
+
+
+def write_index(path: str, records: dict) -> int:
+    """
+    Writes {key: (stored_at, reply)} as: header | sorted fixed-width keys | (count + 1) offsets | records.
+    A record is "<stored_at>\\t<reply>" in UTF-8. The file is replaced atomically, through a temp file
+    of its own (several workers may write at once - ProductIndex.merge serializes them).
+    """
+    keys = sorted(key for key in records if len(key) <= KEY_WIDTH and key.isascii())
+    blobs = [f"{int(records[key][0])}\t{records[key][1]}".encode("utf-8") for key in keys]
+    offsets, position = [], 0
+    for blob in blobs + [b""]:
+        offsets.append(position)
+        position += len(blob)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".product-index-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(keys)))
+            f.write(b"".join(_pack_key(key) for key in keys))
+            f.write(b"".join(OFFSET.pack(offset) for offset in offsets))
+            f.write(b"".join(blobs))
+            os.fchmod(f.fileno(), 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(keys)
+
+
+class ProductIndex:
+    """
+    Read-only memory-mapped barcode -> verdict index, filled by services/product_sync.py.
+    Lookups are a binary search over the key array, no parsing of the file.
+    Other processes see a rewritten file within RELOAD_CHECK_SECONDS.
+    Disabled (every lookup misses) when `path` is empty.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._mm = None
+        self._count = 0
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _reload_if_changed(self) -> None:
+        now = time()
+        if now - self._checked_at < RELOAD_CHECK_SECONDS and self._mm is not None:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            mtime = (stat.st_ino, stat.st_mtime_ns)  # a replaced file is a new inode
+            if mtime == self._mtime:
+                return
+            with open(self.path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, count = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC:
+                logger.error(f"{self.path} is not a product index")
+                mm.close()
+                return
+            # the previous map is left to the GC - a lookup in another thread may still be reading it
+            self._mm, self._count, self._mtime = mm, count, mtime
+            logger.info(f"Product index loaded: {count} products")
+
+    def _key_at(self, mm, i: int) -> bytes:
+        start = HEADER.size + i * KEY_WIDTH
+        return mm[start:start + KEY_WIDTH]
+
+    def _record_at(self, mm, count: int, i: int) -> tuple:
+        offsets_start = HEADER.size + count * KEY_WIDTH
+        data_start = offsets_start + (count + 1) * OFFSET.size
+        begin, = OFFSET.unpack_from(mm, offsets_start + i * OFFSET.size)
+        end, = OFFSET.unpack_from(mm, offsets_start + (i + 1) * OFFSET.size)
+        stored_at, reply = mm[data_start + begin:data_start + end].decode("utf-8").split("\t", 1)
+        return int(stored_at), reply
+
+    def _find(self, key: str) -> Optional[tuple]:
+        if not self.enabled or len(key) > KEY_WIDTH:
+            return None
+        self._reload_if_changed()
+        mm, count = self._mm, self._count
+        if mm is None:
+            return None
+        packed = _pack_key(key)
+        i = bisect_left(range(count), packed, key=lambda j: self._key_at(mm, j))
+        if i < count and self._key_at(mm, i) == packed:
+            return self._record_at(mm, count, i)
+        return None
+
+    def get(self, key: str) -> Optional[str]:
+        """ The indexed reply for `key`, None if not indexed """
+        record = self._find(key)
+        return record[1] if record else None
+
+    def items(self) -> dict:
+        """ All records as {key: (stored_at, reply)} - used by the sync to merge an update """
+        if not self.enabled:
+            return {}
+        self._reload_if_changed()
+        mm, count = self._mm, self._count
+        if mm is None:
+            return {}
+        return {
+            self._key_at(mm, i).rstrip(b"\0").decode("ascii"): self._record_at(mm, count, i)
+            for i in range(count)
+        }
+
+    def merge(self, records: dict, removed=()) -> int:
+        """
+        Adds/replaces `records` ({key: (stored_at, reply)}), drops the `removed` keys and rewrites the file.
+        Returns the total count.
+        Every worker runs the sync - an exclusive lock file keeps read-merge-replace one at a time,
+        so no worker overwrites what another just merged.
+        """
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._checked_at = 0.0  # read what the last writer published
+                merged = self.items() | records
+                for key in removed:
+                    merged.pop(key, None)
+                total = write_index(self.path, merged)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self._checked_at = 0.0  # reload on the next lookup
+        return total
+
+    def __len__(self):
+        if self.enabled:
+            self._reload_if_changed()
+        return self._count
+
+
+product_index = ProductIndex(PRODUCT_INDEX_PATH)  # Singleton instance
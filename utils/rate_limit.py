@@ -0,0 +1,63 @@
+from time import time
+
+from config import logger, RATE_LIMIT_SENDER, RATE_LIMIT_CHAT
+from utils.metrics import metrics
+
+
+class RateLimiter:
+    """
+    Token bucket per key kept in Redis (atomic script, shared by all workers/machines).
+    Local fast path: while the last Redis answer leaves at least `fast_path_ratio` of the burst
+    after local spending, calls are allowed without Redis; the spent tokens are charged on the next sync.
+    """
+    def __init__(self, name: str, capacity: float, refill_per_minute: float, fast_path_ratio: float = 0.5):
+        self.name = name
+        self.capacity = capacity
+        self.refill_per_second = refill_per_minute / 60
+        self.fast_path_tokens = capacity * fast_path_ratio
+        self._local = {}  # key -> [tokens at last sync, sync time, spent since sync]
+
+    async def allow(self, db, key: str) -> bool:
+        now = time()
+        local = self._local.get(key)
+        if local:
+            tokens, synced_at, spent = local
+            estimate = min(self.capacity, tokens + (now - synced_at) * self.refill_per_second) - spent
+            if estimate - 1 >= self.fast_path_tokens:
+                local[2] += 1
+                metrics.incr(f"rate_limit.fast_path.{self.name}")
+                return True
+
+        allowed, tokens = await db.take_token(
+            f"{self.name}:{key}", self.capacity, self.refill_per_second, debt=local[2] if local else 0
+        )
+        if len(self._local) > 10000:
+            self._prune(now)
+        self._local[key] = [tokens, now, 0]
+        return allowed
+
+    def _prune(self, now: float) -> None:
+        full_after = self.capacity / self.refill_per_second
+        self._local = {k: v for k, v in self._local.items() if now - v[1] < full_after}
+
+
+sender_limiter = RateLimiter("sender", *RATE_LIMIT_SENDER)
+chat_limiter = RateLimiter("chat", *RATE_LIMIT_CHAT)
+
+
+async def is_rate_limited(db, sender: str, chat_id: str = None) -> bool:
+    """
+    True if the sender (or, in groups, the whole chat) used up its budget.
+    Checked before any media download or GOK lookup. Fails open if Redis is unavailable.
+    """
+    try:
+        sender_digits = "".join(c for c in sender if c.isdigit())
+        if not await sender_limiter.allow(db, sender_digits):
+            metrics.incr("rate_limit.limited.sender")
+            return True
+        if chat_id and not await chat_limiter.allow(db, chat_id):
+            metrics.incr("rate_limit.limited.chat")
+            return True
+    except Exception as e:
+        logger.error(f"Rate limiter failed, allowing: {e}")
+    return False
@@ -1,8 +1,41 @@
+import asyncio
+import json
+from time import time
 from typing import Tuple, Optional
 
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import redis.asyncio as redis
-from config import logger, REDIS_URL
+from config import logger, REDIS_URL, STATS_RETENTION_DAYS, tz_info
+
+# Live-key index: every new dup:<topic>:* key is counted in a 5-minute bucket that expires together
+# with the last key it counted, so summing the buckets gives the live count without SCAN.
+KEY_INDEX_BUCKET_SECONDS = 300
+KEY_INDEX_WINDOW_SECONDS = 86400  # longest dup TTL that is indexed
+INDEX_PREFIX = "idx:"
+COUNTERS_INDEX_KEY = "idx:co"  # number of co:* keys (they never expire)
+# Atomic token bucket: refills by elapsed time, charges `debt` (tokens spent on the caller's local
+# fast path) unconditionally, then takes `cost` if available. Returns {allowed, tokens left}.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill_per_second = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local debt = tonumber(ARGV[5])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill_per_second)
+tokens = math.max(0, tokens - debt)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill_per_second) + 1)
+return {allowed, tostring(tokens)}
+"""
+MAX_STATS_BUCKETS = 2000  # keeps a single /stats pipeline bounded (~83 days of hours)
 
 
 class RedisManager:
@@ -43,15 +76,37 @@ class RedisManager:
         if not was_set:
             logger.info(f"Duplicate detected for {key}")
             return True
+        if ttl_seconds <= KEY_INDEX_WINDOW_SECONDS:
+            await self._index_new_key(topic, ttl_seconds)
         return False
 
+    async def _index_new_key(self, topic, ttl_seconds: int) -> None:
+        bucket = int(time()) // KEY_INDEX_BUCKET_SECONDS
+        bucket_key = f"idx:dup:{topic}:{bucket}"
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.incr(bucket_key)
+            # the bucket lives exactly as long as the newest key it counted
+            pipe.expireat(bucket_key, (bucket + 1) * KEY_INDEX_BUCKET_SECONDS + ttl_seconds)
+            await pipe.execute()
+
     async def increment_counter(self, name: str, amount: int = 1) -> int:
         """ Increments a named counter by the specified amount """
         await self._ensure_connection()
         key = f"co:{name}"
         new_value = await self.client.incrby(key, amount)
+        if new_value == amount:  # the counter was just created
+            await self.client.incr(COUNTERS_INDEX_KEY)
         return new_value
 
+    async def take_token(self, key: str, capacity: float, refill_per_second: float,
+                         cost: float = 1, debt: float = 0) -> Tuple[bool, float]:
+        """ Token bucket at rl:<key>, see TOKEN_BUCKET_SCRIPT. Returns (allowed, tokens left) """
+        await self._ensure_connection()
+        allowed, tokens = await self.client.eval(
+            TOKEN_BUCKET_SCRIPT, 1, f"rl:{key}", capacity, refill_per_second, time(), cost, debt
+        )
+        return bool(allowed), float(tokens)
+
     async def ping(self) -> bool:
         """Simple health check"""
         try:
@@ -62,10 +117,19 @@ class RedisManager:
             return False
 
     async def count_keys(self, match: str = '*') -> int:
-        """ Returns the number of keys in the current Redis DB """
+        """
+        Returns the number of keys matching `match`.
+        '*', 'co:*' and 'dup:<topic>:*' (one whole topic) are answered from the maintained index (O(1) round-trips),
+        the 'dup' count is approximate by at most one 5-minute bucket of already-expired keys.
+        Any other pattern falls back to a full SCAN.
+        """
         await self._ensure_connection()
         if match == '*':
             count = await self.client.dbsize()
+        elif match == 'co:*':
+            count = int(await self.client.get(COUNTERS_INDEX_KEY) or 0)
+        elif topic := self._dup_topic(match):
+            count = await self._count_indexed_dup(topic)
         else:
             count = 0
             async for _ in self.client.scan_iter(match=match):
@@ -73,6 +137,210 @@ class RedisManager:
         logger.debug(f"Number of {match} keys in Redis: {count}")
         return count
 
+    @staticmethod
+    def _dup_topic(match: str) -> Optional[str]:
+        """ The topic of a 'dup:<topic>:*' pattern covering one whole topic, None for any other pattern """
+        if not (match.startswith('dup:') and match.endswith(':*')):
+            return None
+        topic = match[len('dup:'):-len(':*')]
+        if not topic or any(c in topic for c in ':*?[]\\'):
+            return None
+        return topic
+
+    async def _count_indexed_dup(self, topic: str) -> int:
+        last_bucket = int(time()) // KEY_INDEX_BUCKET_SECONDS
+        first_bucket = last_bucket - KEY_INDEX_WINDOW_SECONDS // KEY_INDEX_BUCKET_SECONDS
+        bucket_keys = [f"idx:dup:{topic}:{b}" for b in range(first_bucket, last_bucket + 1)]
+        return sum(int(v or 0) for v in await self.client.mget(*bucket_keys))
+
+    async def seed_key_index(self, force: bool = False) -> None:
+        """
+        Counts co:* keys once with SCAN and stores it as the counters index.
+        Without `force` does nothing if the index already exists (called on every startup).
+        """
+        await self._ensure_connection()
+        if not force and await self.client.exists(COUNTERS_INDEX_KEY):
+            return
+        count = 0
+        async for _ in self.client.scan_iter(match='co:*', count=500):
+            count += 1
+        await self.client.set(COUNTERS_INDEX_KEY, count)
+        logger.info(f"Counters index seeded: {count} co:* keys")
+
+    async def iter_prefix(self, prefix: str, cursor: int = 0, limit: int = 100, batch_size: int = 100):
+        """
+        Async generator over keys starting with `prefix`, resuming from a SCAN cursor.
+        Yields (next_cursor, [(key, type, value), ...]) once per SCAN step - also for steps that
+        matched nothing, so the last cursor yielded is always where to resume (0 = scan complete).
+        Values are fetched type-aware: strings in one MGET, hashes/sets/lists/zsets
+        in a single pipeline, so every SCAN step costs 3 round-trips at most.
+        Stops after `limit` keys or when the scan completes. A step never scans more than the keys
+        still allowed (SCAN COUNT), since a step cannot be resumed halfway.
+        """
+        await self._ensure_connection()
+        seen = 0
+        while seen < limit:
+            cursor, keys = await self.client.scan(
+                cursor=cursor, match=f"{prefix}*", count=min(batch_size, limit - seen)
+            )
+            yield cursor, await self._fetch_typed(keys) if keys else []
+            seen += len(keys)
+            if cursor == 0:
+                return
+
+    async def _fetch_typed(self, keys: list) -> list:
+        """ Returns [(key, type, value), ...] for the given keys, batched by type """
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.type(key)
+            types = [t.decode() if isinstance(t, bytes) else t for t in await pipe.execute()]
+
+        strings = [k for k, t in zip(keys, types) if t == "string"]
+        values = dict(zip(strings, await self.client.mget(*strings))) if strings else {}
+
+        readers = {
+            "hash": lambda p, k: p.hgetall(k),
+            "set": lambda p, k: p.smembers(k),
+            "list": lambda p, k: p.lrange(k, 0, -1),
+            "zset": lambda p, k: p.zrange(k, 0, -1, withscores=True),
+        }
+        others = [k for k, t in zip(keys, types) if t in readers]
+        if others:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key, key_type in zip(keys, types):
+                    if key_type in readers:
+                        readers[key_type](pipe, key)
+                results = await pipe.execute()
+            for key, value in zip(others, results):
+                values[key] = sorted(value) if isinstance(value, set) else value
+
+        # unsupported types (streams etc.) and keys expired mid-scan are reported with value None
+        return [(key, key_type, values.get(key)) for key, key_type in zip(keys, types)]
+
+    async def unlink_prefix(self, prefix: str, dry_run: bool = False, batch_size: int = 500,
+                            pause_seconds: float = 0.05, progress: Optional[dict] = None) -> int:
+        """
+        Removes every key starting with `prefix` using SCAN + non-blocking UNLINK, one batch per SCAN step.
+        Sleeps `pause_seconds` between batches so live traffic keeps its share of Redis.
+        With dry_run only counts the matching keys (SCAN may report a key twice, so it is an upper bound).
+        `progress` (if given) is updated in place with "scanned" and "deleted".
+        Raises ValueError for prefixes reaching the live-key index (idx:*) - it is maintained, not purged.
+        """
+        if not dry_run and self.is_index_prefix(prefix):
+            raise ValueError(f"'{prefix}' would purge the key index (idx:*)")
+        await self._ensure_connection()
+        progress = progress if progress is not None else {}
+        progress.update(scanned=0, deleted=0)
+        cursor = 0
+        while True:
+            cursor, keys = await self.client.scan(cursor=cursor, match=f"{prefix}*", count=batch_size)
+            progress["scanned"] += len(keys)
+            if keys and not dry_run:
+                progress["deleted"] += await self.client.unlink(*keys)
+            if cursor == 0:
+                break
+            await asyncio.sleep(pause_seconds)
+        logger.info(f"Purge of '{prefix}*' finished (dry_run={dry_run}): {progress}")
+        if not dry_run:
+            await self._reindex_after_purge(prefix)
+        return progress["scanned"] if dry_run else progress["deleted"]
+
+    @staticmethod
+    def is_index_prefix(prefix: str) -> bool:
+        """ True if keys starting with `prefix` include the live-key index (idx:*) """
+        return prefix.startswith(INDEX_PREFIX) or INDEX_PREFIX.startswith(prefix)
+
+    async def _reindex_after_purge(self, prefix: str) -> None:
+        """ Keeps the live-key index in line with keys removed by unlink_prefix """
+        if 'dup:'.startswith(prefix):
+            bucket_match = "idx:dup:*"  # every topic purged
+        elif prefix.startswith('dup:') and not prefix[len('dup:'):].partition(':')[2]:
+            bucket_match = f"idx:{prefix}*"  # whole topics: 'dup:<topic>:' or a topic name prefix
+        else:
+            bucket_match = None
+        if bucket_match:
+            # buckets of the purged topics (idx:dup:<topic>:<bucket>) count keys that no longer exist
+            async for key in self.client.scan_iter(match=bucket_match):
+                await self.client.unlink(key)
+        elif prefix.startswith('dup:'):
+            # buckets count a topic's keys as a whole - the purged part is counted until its buckets expire
+            logger.info(f"'{prefix}' is part of a topic - its dup count stays approximate for up to "
+                        f"{KEY_INDEX_WINDOW_SECONDS}s")
+        if prefix.startswith('co:') or 'co:'.startswith(prefix):
+            await self.seed_key_index(force=True)
+
+    async def save_snapshot(self, name: str, payload: dict, ttl_seconds: int = 7 * 86400) -> None:
+        """ Stores a JSON blob under snapshot:<name> """
+        await self._ensure_connection()
+        payload = {"saved_at": time(), **payload}
+        await self.client.set(f"snapshot:{name}", json.dumps(payload, separators=(",", ":")), ex=ttl_seconds)
+
+    async def load_snapshot(self, name: str) -> Optional[dict]:
+        await self._ensure_connection()
+        raw = await self.client.get(f"snapshot:{name}")
+        return json.loads(raw) if raw else None
+
+    async def add_daily_counts(self, name: str, counts: dict, retention_days: int = 14) -> None:
+        """ ZINCRBY every member of `counts` into today's <name>:<YYYY-MM-DD> sorted set """
+        if not counts:
+            return
+        await self._ensure_connection()
+        key = f"{name}:{datetime.now(tz_info):%Y-%m-%d}"
+        async with self.client.pipeline(transaction=False) as pipe:
+            for member, amount in counts.items():
+                pipe.zincrby(key, amount, member)
+            pipe.expire(key, retention_days * 86400)
+            await pipe.execute()
+
+    async def top_daily_counts(self, name: str, days: int = 3, limit: int = 50) -> list:
+        """ [(member, count), ...] summed over the last `days` daily sets of `name`, highest first """
+        await self._ensure_connection()
+        today = datetime.now(tz_info).date()
+        async with self.client.pipeline(transaction=False) as pipe:
+            for offset in range(days):
+                pipe.zrange(f"{name}:{today - timedelta(days=offset):%Y-%m-%d}", 0, -1, withscores=True)
+            daily = await pipe.execute()
+        totals = {}
+        for members in daily:
+            for member, score in members:
+                member = self._to_str(member)
+                totals[member] = totals.get(member, 0) + int(score)
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    async def add_hash_counts(self, name: str, counts: dict) -> dict:
+        """ HINCRBY every field of `counts` into hash `name`, returns the whole hash as {field: int} """
+        await self._ensure_connection()
+        async with self.client.pipeline(transaction=False) as pipe:
+            for field, amount in counts.items():
+                pipe.hincrby(name, field, amount)
+            pipe.hgetall(name)
+            *_, totals = await pipe.execute()
+        return {self._to_str(field): int(value) for field, value in totals.items()}
+
+    async def publish_breaker(self, name: str, open_until: float) -> None:
+        """ Shares an open circuit breaker with other instances until it is due to half-open """
+        await self._ensure_connection()
+        await self.client.set(f"cb:{name}", open_until, exat=int(open_until) + 1)
+
+    async def get_breakers(self, names: list) -> dict:
+        """ name -> open_until of breakers currently opened by any instance """
+        await self._ensure_connection()
+        values = await self.client.mget(*[f"cb:{name}" for name in names])
+        return {name: float(value) for name, value in zip(names, values) if value}
+
+    async def push_deferred(self, name: str, item: dict, max_items: int = 500) -> None:
+        """ Appends a JSON item to the deferred:<name> list, keeping only the newest max_items """
+        await self._ensure_connection()
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.rpush(f"deferred:{name}", json.dumps(item, ensure_ascii=False))
+            pipe.ltrim(f"deferred:{name}", -max_items, -1)
+            await pipe.execute()
+
+    async def pop_deferred(self, name: str) -> Optional[dict]:
+        await self._ensure_connection()
+        raw = await self.client.lpop(f"deferred:{name}")
+        return json.loads(raw) if raw else None
+
     async def sync_app_version(self, cur_version: str) -> Tuple[bool, Optional[str]]:
         """
         Stores current_version in Redis only if different.
@@ -89,26 +357,33 @@ class RedisManager:
         return True, cur_version
 
     @staticmethod
-    def _get_current_week_key() -> str:
-        """Get the current week key based on Sunday as start of week"""
-        today = datetime.now()
-        days_since_sunday = (today.weekday() + 1) % 7
-        start_of_week = today - timedelta(days=days_since_sunday)
-        return start_of_week.strftime("%d/%m")
+    def _stats_keys(moment: datetime) -> dict:
+        """ Stats hash key of every granularity containing `moment` (weeks start on Sunday) """
+        start_of_week = moment - timedelta(days=(moment.weekday() + 1) % 7)
+        return {
+            "hour": f"stats:h:{moment:%Y-%m-%dT%H}",
+            "day": f"stats:d:{moment:%Y-%m-%d}",
+            "week": f"stats:w:{start_of_week:%Y-%m-%d}",
+            "month": f"stats:m:{moment:%Y-%m}",
+        }
+
+    async def _track_stat(self, field: str) -> None:
+        """ HINCRBY `field` in the current hour/day/week/month hashes - the roll-up happens at write time """
+        keys = self._stats_keys(datetime.now(tz_info))
+        async with self.client.pipeline(transaction=True) as pipe:
+            for granularity, key in keys.items():
+                pipe.hincrby(key, field, 1)
+                # nx to set ttl only on the first increment of the bucket
+                pipe.expire(key, STATS_RETENTION_DAYS[granularity] * 86400, nx=True)
+            await pipe.execute()
 
     async def track_received_message(self, is_group: bool, is_admin: bool = False, failed_received: bool = False) -> None:
         """Track incoming message statistics (async)"""
         try:
-            week_key = self._get_current_week_key()
             message_type = "group" if is_group else "private"
             message_type += ":admin" if is_admin else ""
             status = "failed_received" if failed_received else "received"
-            redis_key = f"stats:{week_key}:{status}:{message_type}"
-
-            async with self.client.pipeline(transaction=True) as pipe:
-                pipe.incr(redis_key)
-                pipe.expire(redis_key, 1209600, nx=True) # nx to set ttl only on the first increment. 14 days = 1209600
-                await pipe.execute()
+            await self._track_stat(f"{status}:{message_type}")
 
         except Exception as e:
             logger.info(f"Failed to track received message: {e}")
@@ -116,57 +391,98 @@ class RedisManager:
     async def track_sent_message(self, is_group: bool) -> None:
         """Track outgoing message statistics (async)"""
         try:
-            week_key = self._get_current_week_key()
             message_type = "group" if is_group else "private"
-            redis_key = f"stats:{week_key}:sent:{message_type}"
-
-            async with self.client.pipeline(transaction=True) as pipe:
-                pipe.incr(redis_key)
-                pipe.expire(redis_key, 1209600, nx=True) # nx to set ttl only on the first increment. 14 days = 1209600
-                await pipe.execute()
+            await self._track_stat(f"sent:{message_type}")
 
         except Exception as e:
             logger.info(f"Failed to track sent message: {e}")
 
+    @staticmethod
+    def _stats_summary(fields: dict) -> dict:
+        """ Maps raw hash fields to the report shape used by /stats and the weekly report """
+        def get(field):
+            return int(fields.get(field, 0))
+
+        return {
+            "received": {
+                "group": get("received:group"),
+                "private": get("received:private"),
+                "admin": get("received:group:admin"),
+            },
+            "sent": {
+                "group": get("sent:group"),
+                "private": get("sent:private"),
+                "failed_group": get("failed_received:group"),
+                "failed_private": get("failed_received:private"),
+            }
+        }
+
+    @classmethod
+    def _stats_range_keys(cls, start: date, end: date, granularity: str) -> list:
+        """ Ordered, de-duplicated bucket keys of `granularity` covering start..end (inclusive) """
+        step = timedelta(hours=1) if granularity == "hour" else timedelta(days=1)
+        moment = datetime.combine(start, datetime.min.time())
+        last = datetime.combine(end, datetime.max.time())
+        keys = []
+        while moment <= last:
+            key = cls._stats_keys(moment)[granularity]
+            if not keys or keys[-1] != key:
+                keys.append(key)
+            moment += step
+        return keys
+
+    async def get_stats_range(self, start: date, end: date, granularity: str = "day") -> dict:
+        """
+        Statistics for start..end (inclusive) as a series of `granularity` buckets plus their total.
+        All buckets are read in a single pipelined round-trip.
+        """
+        if granularity not in STATS_RETENTION_DAYS:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        if start > end:
+            raise ValueError(f"start {start.isoformat()} is after end {end.isoformat()}")
+        keys = self._stats_range_keys(start, end, granularity)
+        if len(keys) > MAX_STATS_BUCKETS:
+            raise ValueError(f"Range too large: {len(keys)} {granularity} buckets (max {MAX_STATS_BUCKETS})")
+
+        await self._ensure_connection()
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hgetall(key)
+            buckets = await pipe.execute()
+
+        total = {}
+        series = []
+        for key, fields in zip(keys, buckets):
+            fields = {self._to_str(k): int(v) for k, v in fields.items()}
+            for field, value in fields.items():
+                total[field] = total.get(field, 0) + value
+            series.append({"bucket": key.split(":", 2)[2], **self._stats_summary(fields)})
+
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "granularity": granularity,
+            **self._stats_summary(total),
+            "series": series,
+        }
+
+    @staticmethod
+    def _to_str(value) -> str:
+        return value.decode() if isinstance(value, bytes) else value
+
     async def get_weekly_stats(self, week_offset: int = 0) -> dict:
          """ Get statistics for a specific week (Sunday to Saturday) """
          try:
-             today = datetime.now()
-
-             # Calculate target date based on offset
-             target_date = today - timedelta(weeks=week_offset)
-
-             # Find the Sunday of that week
-             days_since_sunday = (target_date.weekday() + 1) % 7
-             start_of_week = target_date - timedelta(days=days_since_sunday)
-             week_key = start_of_week.strftime("%d/%m")
+             target_date = datetime.now(tz_info) - timedelta(weeks=week_offset)
+             week_key = self._stats_keys(target_date)["week"]
 
              # Single hit to redis (Counts as 1 request)
-             keys = [
-                 f"stats:{week_key}:received:group",
-                 f"stats:{week_key}:received:private",
-                 f"stats:{week_key}:received:group:admin",
-                 f"stats:{week_key}:sent:group",
-                 f"stats:{week_key}:sent:private",
-                 f"stats:{week_key}:failed_received:group",
-                 f"stats:{week_key}:failed_received:private"
-             ]
-             raw_results = await self.client.mget(*keys)
-             data = [int(val or 0) for val in raw_results]
+             fields = await self.client.hgetall(week_key)
+             fields = {self._to_str(k): v for k, v in fields.items()}
 
              return {
-                 "week_start": week_key,
-                 "received": {
-                    "group": data[0],
-                    "private": data[1],
-                    "admin": data[2],
-                 },
-                 "sent": {
-                    "group": data[3],
-                    "private": data[4],
-                    "failed_group": data[5],
-                    "failed_private": data[6],
-                 }
+                 "week_start": week_key.split(":", 2)[2],
+                 **self._stats_summary(fields),
              }
          except Exception as e:
              logger.error(f"Failed to get weekly stats: {e}")
@@ -0,0 +1,102 @@
+import asyncio
+import heapq
+import itertools
+from time import perf_counter
+
+from config import logger, SCHEDULER_WORKERS, SCHEDULER_DRAIN_TIMEOUT, FAIR_SHARE_WEIGHTS
+from utils.metrics import metrics
+
+PRIORITY_CLASSES = ("private_text", "private_image", "group_image")  # served strictly in this order
+
+
+class FairScheduler:
+    """
+    Runs queued handlers on a fixed pool of asyncio workers.
+    Classes are served in strict priority order; within a class, chats share the workers by
+    weighted fair queuing (each job gets a virtual finish tag of max(class time, chat's last tag) + 1/weight,
+    the lowest tag runs first), so one busy group cannot delay every other chat.
+    On stop, the queued and running jobs are drained first - Green got a 200 for them and won't redeliver.
+    """
+    def __init__(self, workers: int, weights: dict = None):
+        self.workers = workers
+        self.weights = weights or {}
+        self._heaps = {work_class: [] for work_class in PRIORITY_CLASSES}
+        self._virtual_time = dict.fromkeys(PRIORITY_CLASSES, 0.0)
+        self._last_finish = {}  # (work_class, chat_id) -> finish tag of the chat's last queued job
+        self._seq = itertools.count()
+        self._ready = None
+        self._tasks = []
+        self._running = 0
+        self._closed = False
+
+    def __len__(self):
+        return sum(len(heap) for heap in self._heaps.values())
+
+    def submit(self, work_class: str, chat_id: str, job_factory) -> None:
+        """ Queues `job_factory()` (a coroutine function without args) for `chat_id` in `work_class` """
+        if self._closed:
+            raise RuntimeError("Scheduler is stopping")
+        key = (work_class, chat_id)
+        weight = self.weights.get(chat_id, 1)
+        finish = max(self._virtual_time[work_class], self._last_finish.get(key, 0.0)) + 1 / weight
+        self._last_finish[key] = finish
+        heapq.heappush(self._heaps[work_class], (finish, next(self._seq), chat_id, perf_counter(), job_factory))
+        if self._ready:
+            self._ready.release()
+
+    def _next_job(self):
+        for work_class in PRIORITY_CLASSES:
+            heap = self._heaps[work_class]
+            if heap:
+                finish, _, chat_id, enqueued, job_factory = heapq.heappop(heap)
+                self._virtual_time[work_class] = finish
+                if self._last_finish.get((work_class, chat_id)) == finish:
+                    del self._last_finish[(work_class, chat_id)]  # chat has nothing else queued
+                return work_class, enqueued, job_factory
+        return None
+
+    async def _worker(self):
+        while True:
+            await self._ready.acquire()
+            job = self._next_job()
+            if job is None:
+                continue
+            work_class, enqueued, job_factory = job
+            metrics.observe(f"scheduler.wait.{work_class}", perf_counter() - enqueued)
+            self._running += 1
+            try:
+                await job_factory()
+            except Exception:
+                logger.exception(f"Scheduled {work_class} job failed")
+            finally:
+                self._running -= 1
+
+    def start(self) -> None:
+        """ Starts the workers on the running loop (jobs submitted before start are kept) """
+        self._ready = asyncio.Semaphore(len(self))
+        self._closed = False
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = SCHEDULER_DRAIN_TIMEOUT) -> None:
+        """ Stops taking jobs, waits up to `timeout` seconds for the queued and running ones, then cancels """
+        self._closed = True
+        deadline = perf_counter() + timeout
+        while self._tasks and (len(self) or self._running) and perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        if len(self) or self._running:
+            logger.warning(f"Scheduler drain timed out: {len(self)} queued and {self._running} running jobs dropped")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._ready = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self._running,
+            "queued": {c: len(h) for c, h in self._heaps.items()},
+        }
+
+
+scheduler = FairScheduler(SCHEDULER_WORKERS, FAIR_SHARE_WEIGHTS)  # Singleton instance
@@ -0,0 +1,170 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+from time import time
+from typing import Optional
+from zlib import crc32
+
+from config import logger, SHARED_CACHE_PATH, SHARED_CACHE_SLOTS, VERDICT_CACHE_TTL
+from utils.metrics import metrics
+
+MAGIC = b"GOKSHC1\0"
+HEADER = struct.Struct("<8sIII")  # magic, slots, slot size, clock hand
+HEADER_SIZE = 64
+SEQ = struct.Struct("<I")
+# seq | ref (clock bit) | used | key length | pad | stored_at | value length | key
+SLOT = struct.Struct("<IBBBxdH14s")
+REF_OFFSET = 4
+SLOT_SIZE = 512
+VALUE_MAX = SLOT_SIZE - SLOT.size
+PROBE = 16  # slots looked at per key - a key lives within PROBE slots of its hash
+READ_RETRIES = 3
+
+
+class SharedVerdictCache:
+    """
+    Verdict cache shared by all worker processes of a machine: a memory-mapped file
+    (e.g. under /dev/shm) holding a fixed-size open-addressing table of barcode -> reply.
+    - reads take no lock: each slot has a sequence number that a writer makes odd while writing
+      (seqlock); a reader that sees it odd or changed retries, then treats it as a miss;
+    - writes are serialized across processes with flock - they only follow GOK misses;
+    - slots are never emptied, only overwritten, so a lookup stops at the first empty slot;
+    - a full probe window evicts with the clock algorithm: a read sets the slot's ref bit,
+      the writer's hand clears set bits and takes the first clear (or expired) slot.
+    Disabled (every lookup misses) when `path` is empty.
+    """
+    def __init__(self, path: str, slots: int, ttl_seconds: int):
+        self.path = path
+        self.slots = slots
+        self.ttl_seconds = ttl_seconds
+        self._mm = None
+        self._file = None
+        self._lock = threading.Lock()  # flock is per open file - threads of one process need their own lock
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _open(self) -> bool:
+        if self._mm is not None:
+            return True
+        if not self.enabled:
+            return False
+        with self._lock:
+            if self._mm is not None:
+                return True
+            size = HEADER_SIZE + self.slots * SLOT_SIZE
+            f = open(self.path, "a+b")
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size or HEADER.unpack(header)[:3] != (MAGIC, self.slots, SLOT_SIZE):
+                    # first process, or a different layout - start empty
+                    f.truncate(0)
+                    f.truncate(size)
+                    f.seek(0)
+                    f.write(HEADER.pack(MAGIC, self.slots, SLOT_SIZE, 0))
+                    f.flush()
+                    logger.info(f"Shared verdict cache created: {self.path} ({self.slots} slots)")
+                self._mm = mmap.mmap(f.fileno(), size)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            self._file = f
+        return True
+
+    def _slot_offset(self, index: int) -> int:
+        return HEADER_SIZE + (index % self.slots) * SLOT_SIZE
+
+    def _read_slot(self, offset: int, key: bytes) -> Optional[tuple]:
+        """ (used, key matches, stored_at, value) read consistently, None if a writer kept it busy """
+        mm = self._mm
+        for _ in range(READ_RETRIES):
+            seq, = SEQ.unpack_from(mm, offset)
+            if seq & 1:
+                continue
+            _, _, used, key_len, stored_at, value_len, slot_key = SLOT.unpack_from(mm, offset)
+            match = used and slot_key[:key_len] == key
+            value = mm[offset + SLOT.size:offset + SLOT.size + value_len] if match else b""
+            if SEQ.unpack_from(mm, offset)[0] == seq:
+                return used, match, stored_at, value
+        return None
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def get_entry(self, key: str) -> Optional[tuple]:
+        """ (value, stored_at) of a fresh entry, None on a miss """
+        if not self._open():
+            return None
+        packed = key.encode("ascii")
+        start = crc32(packed)  # not hash() - it differs between processes
+        for i in range(PROBE):
+            offset = self._slot_offset(start + i)
+            slot = self._read_slot(offset, packed)
+            if slot is None:
+                break
+            used, match, stored_at, value = slot
+            if not used:
+                break
+            if match:
+                if time() - stored_at > self.ttl_seconds:
+                    break
+                if not self._mm[offset + REF_OFFSET]:
+                    self._mm[offset + REF_OFFSET] = 1  # a hint for the clock, outside the seqlock
+                metrics.incr("shared_cache.hit")
+                return value.decode("utf-8"), stored_at
+        metrics.incr("shared_cache.miss")
+        return None
+
+    def _victim(self, start: int, packed: bytes) -> int:
+        """ Slot for `packed`: its own, else the first empty one, else the clock's pick within the window """
+        mm = self._mm
+        for i in range(PROBE):
+            offset = self._slot_offset(start + i)
+            _, _, used, key_len, _, _, slot_key = SLOT.unpack_from(mm, offset)
+            if not used or slot_key[:key_len] == packed:
+                return offset
+        magic, slots, slot_size, hand = HEADER.unpack_from(mm, 0)
+        now = time()
+        for step in range(2 * PROBE):  # two rounds: the first may only clear ref bits
+            offset = self._slot_offset(start + (hand + step) % PROBE)
+            _, ref, _, _, stored_at, _, _ = SLOT.unpack_from(mm, offset)
+            if not ref or now - stored_at > self.ttl_seconds:
+                break
+            mm[offset + REF_OFFSET] = 0
+        HEADER.pack_into(mm, 0, magic, slots, slot_size, (hand + step + 1) % PROBE)
+        metrics.incr("shared_cache.evicted")
+        return offset
+
+    def put(self, key: str, value: str) -> bool:
+        packed, data = key.encode("ascii"), value.encode("utf-8")
+        if len(packed) > 14 or len(data) > VALUE_MAX or not self._open():
+            return False
+        mm = self._mm
+        with self._lock:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                offset = self._victim(crc32(packed), packed)
+                seq, = SEQ.unpack_from(mm, offset)
+                busy = (seq + 1) & 0xFFFFFFFF
+                SEQ.pack_into(mm, offset, busy)  # odd: readers retry
+                SLOT.pack_into(mm, offset, busy, 0, 1, len(packed), time(), len(data), packed)
+                mm[offset + SLOT.size:offset + SLOT.size + len(data)] = data
+                SEQ.pack_into(mm, offset, (seq + 2) & 0xFFFFFFFF)
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+        return True
+
+    def close(self) -> None:
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._file.close()
+                self._mm = self._file = None
+
+
+shared_verdicts = SharedVerdictCache(SHARED_CACHE_PATH, SHARED_CACHE_SLOTS, VERDICT_CACHE_TTL)  # Singleton instance
@@ -0,0 +1,29 @@
+import time
+
+IMPORT_STARTED = time.perf_counter()  # imported first by main.py, so this is ~ when the app started loading
+
+from config import logger
+
+startup_timings = {}
+
+
+def mark(step: str, since: float = IMPORT_STARTED) -> None:
+    """ Record seconds elapsed since `since` (default: start of app import) under `step` """
+    startup_timings[step] = round(time.perf_counter() - since, 3)
+
+
+async def timed(step: str, awaitable, required: bool = False):
+    """
+    Await `awaitable` and record how long it took under `step`.
+    Failures are logged, not raised - unless the step is `required`, then they fail the startup.
+    """
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    except Exception:
+        logger.exception(f"Startup step '{step}' failed")
+        if required:
+            raise
+    finally:
+        mark(step, since=started)
+        logger.debug(f"Startup step '{step}' took {startup_timings[step]}s")
@@ -28,8 +28,10 @@ TEXTS = {
         "exception": "שגיאה פנימית בטיפול בבקשה. אנא נסה שוב מאוחר יותר.",
         "barcode_not_found": "🙄 קשה לי לחלץ את הברקוד. נסו לחתוך רק את הברקוד או לשנות זווית ותאורה."
                              " או פשוט הקלידו את הספרות",
+        "invalid_barcode": "🔢 הספרות שנשלחו אינן ברקוד תקין (8, 12, 13 או 14 ספרות עם ספרת ביקורת). נא לבדוק ולשלוח שוב.",
         "unsupported_barcode": "בתמונה מופיע ברקוד שאיננו נתמך, נא לשלוח תמונה בה יש ברקוד סטנדרטי בלבד.",
         "internal_logic_error": "שגיאת שרת, נסה שוב מאוחר יותר⏳ או פנה לתמיכה🛠️",
+        "rate_limited": "🐢 נשלחו הרבה בקשות בזמן קצר, נא להמתין מספר דקות ולנסות שוב.",
         "out_of_working_hours":"כעת לילה בישראל 🤫😴✨\nהקבוצה פעילה בין 7:00 ל22:00,\nנשוב לפעילות בעוד כ{rounded}.",
 
         # GOK-related
@@ -55,6 +57,7 @@ TEXTS = {
     "barcode": {
         "prefix": "ברקוד: ",
         "edited": "ברקוד שנמצא: ",
+        "truncated": "נבדקו {limit} הברקודים הראשונים בלבד, את השאר נא לשלוח בהודעה נפרדת.",
     },
     "gok_strings": {
         "confirmed": 'מוצר מאושר ע"י הרב לשימוש במערכת',
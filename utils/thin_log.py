@@ -1,6 +1,10 @@
 import copy
+import hashlib
 from config import logger
 
+PHONE_FIELDS = {"wid", "chatId", "sender", "participant"}
+NAME_FIELDS = {"chatName", "senderName", "senderContactName"}
+
 def _redact_sensitive_data(data, target_key="jpegThumbnail", replacement="..."):
     """
     Recursively traverse a dictionary or list to replace target_key values.
@@ -17,6 +21,53 @@ def _redact_sensitive_data(data, target_key="jpegThumbnail", replacement="..."):
     return data
 
 
+def _pseudonymize_phone(value: str, salt: str) -> str:
+    """ '972547654321@c.us' -> a stable 12 digit stand-in with the same suffix (groups stay groups) """
+    number, at, domain = value.partition("@")
+    if not number:
+        return value
+    digest = hashlib.sha256(f"{salt}:{number}".encode()).hexdigest()
+    return f"{int(digest[:15], 16) % 10 ** 12:012d}{at}{domain}"
+
+
+def _redact_identities(data, salt: str):
+    """
+    Recursively pseudonymize phone numbers and blank contact names, in place.
+    """
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key in PHONE_FIELDS and isinstance(value, str):
+                data[key] = _pseudonymize_phone(value, salt)
+            elif key in NAME_FIELDS and value:
+                data[key] = "..."
+            else:
+                _redact_identities(value, salt)
+    elif isinstance(data, list):
+        for item in data:
+            _redact_identities(item, salt)
+    return data
+
+
+def strip_thumbnails(data, target_key="jpegThumbnail", replacement="..."):
+    """
+    A copy of the request without thumbnails. Only dicts and lists are copied, the other values are
+    shared - cheap enough to run on the webhook.
+    """
+    if isinstance(data, dict):
+        return {
+            key: replacement if key == target_key else strip_thumbnails(value, target_key, replacement)
+            for key, value in data.items()
+        }
+    if isinstance(data, list):
+        return [strip_thumbnails(item, target_key, replacement) for item in data]
+    return data
+
+
+def redact_webhook(whatsapp_request, salt: str):
+    """ A copy of the request without thumbnails, phone numbers and names - safe to store """
+    return _redact_identities(strip_thumbnails(whatsapp_request), salt)
+
+
 def thin_log(whatsapp_request):
     log_view = copy.deepcopy(whatsapp_request)
     _redact_sensitive_data(log_view)
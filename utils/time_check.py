@@ -58,3 +58,13 @@ def is_too_old(timestamp: int, max_age_hours: int = 3) -> bool:
     max_age_seconds = max_age_hours * 3600
     now_ts = datetime.now(tz=timezone.utc).timestamp()
     return timestamp < (now_ts - max_age_seconds)
+
+
+def seconds_until_working_hours(timestamp: float) -> int:
+    """ Seconds from the timestamp (unix seconds) until working hours next start, counted in Israel local time """
+    start_hour, _ = map(int, WORKING_HOURS.split(","))
+    dt = datetime.fromtimestamp(timestamp, tz=timezone.utc).astimezone(tz_info)
+    start_dt = dt.replace(hour=start_hour, minute=0, second=0, microsecond=0)
+    if start_dt <= dt:
+        start_dt += timedelta(days=1)  # wall-clock arithmetic, keeps 7:00 across DST changes
+    return int(start_dt.timestamp() - timestamp)
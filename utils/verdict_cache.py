@@ -0,0 +1,167 @@
+import asyncio
+import threading
+from collections import Counter, OrderedDict
+from time import time
+from typing import Optional
+
+from config import (
+    logger,
+    VERDICT_CACHE_SIZE,
+    VERDICT_CACHE_TTL,
+    IMAGE_CACHE_SIZE,
+    WARM_SNAPSHOT_SIZE,
+    WARM_SNAPSHOT_INTERVAL,
+    NOT_FOUND_CACHE_SIZE,
+    NOT_FOUND_CACHE_TTL,
+    UNKNOWN_RETENTION_DAYS,
+)
+
+SNAPSHOT_NAME = "warm-cache"
+HOT_BARCODES_NAME = "hot:barcodes"
+UNKNOWN_BARCODES_NAME = "unknown:barcodes"
+
+
+class VerdictCache:
+    """
+    Thread-safe in-process LRU with a TTL, counting hits per key to know the hot set.
+    Engine code runs in worker threads, so every access takes the lock.
+    """
+    def __init__(self, max_items: int, ttl_seconds: int):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._items = OrderedDict()  # key -> [value, stored_at, hits]
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        """ The value if still fresh. An expired entry is kept (until evicted) for get_stale """
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or time() - item[1] > self.ttl_seconds:
+                return None
+            item[2] += 1
+            self._items.move_to_end(key)
+            return item[0]
+
+    def peek(self, key: str) -> Optional[str]:
+        """ The value if still fresh, without counting a hit or refreshing its LRU position """
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or time() - item[1] > self.ttl_seconds:
+                return None
+            return item[0]
+
+    def get_stale(self, key: str, max_stale: int) -> Optional[tuple]:
+        """ (value, seconds past the TTL) of an expired entry at most `max_stale` seconds past it """
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            staleness = time() - item[1] - self.ttl_seconds
+            if not 0 < staleness <= max_stale:
+                return None
+            self._items.move_to_end(key)
+            return item[0], staleness
+
+    def put(self, key: str, value: str, stored_at: float = None, hits: int = 0) -> None:
+        with self._lock:
+            self._items[key] = [value, stored_at or time(), hits]
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+    def hottest(self, limit: int) -> list:
+        """ [key, value, stored_at, hits] of the `limit` most hit, still fresh entries """
+        now = time()
+        with self._lock:
+            fresh = [[k, *item] for k, item in self._items.items() if now - item[1] <= self.ttl_seconds]
+        return sorted(fresh, key=lambda entry: entry[3], reverse=True)[:limit]
+
+    def load(self, entries: list) -> int:
+        """ Loads hottest() output, dropping entries older than the TTL. Returns how many were loaded """
+        now = time()
+        loaded = 0
+        # coldest first, so the hottest end up most recently used
+        for key, value, stored_at, hits in reversed(entries):
+            if now - stored_at <= self.ttl_seconds:
+                self.put(key, value, stored_at=stored_at, hits=hits)
+                loaded += 1
+        return loaded
+
+
+class PendingCounts:
+    """ Thread-safe Counter, drained periodically into Redis daily sorted sets """
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counts[key] += amount
+
+    def drain(self) -> dict:
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        return dict(counts)
+
+
+verdicts = VerdictCache(VERDICT_CACHE_SIZE, VERDICT_CACHE_TTL)  # barcode -> GOK reply text
+image_barcodes = VerdictCache(IMAGE_CACHE_SIZE, VERDICT_CACHE_TTL)  # image sha1 -> decoded barcode
+requested_barcodes = PendingCounts()  # barcode -> lookups since last flush, feeds the morning pre-warm
+not_found = VerdictCache(NOT_FOUND_CACHE_SIZE, NOT_FOUND_CACHE_TTL)  # barcode -> gok_not_found reply
+unknown_barcodes = PendingCounts()  # barcode -> not-found lookups since last flush, feeds the unknown report
+
+
+async def save_warm_snapshot(db) -> None:
+    """ Stores the hottest verdicts and image digests in Redis, for the next process to start warm """
+    try:
+        await db.save_snapshot(SNAPSHOT_NAME, {
+            "verdicts": verdicts.hottest(WARM_SNAPSHOT_SIZE),
+            "image_barcodes": image_barcodes.hottest(WARM_SNAPSHOT_SIZE),
+        })
+    except Exception:
+        logger.exception("Failed to save warm cache snapshot")
+
+
+async def load_warm_snapshot(db) -> None:
+    """ Reloads the last snapshot into the caches, verdicts older than VERDICT_CACHE_TTL are dropped """
+    snapshot = await db.load_snapshot(SNAPSHOT_NAME)
+    if not snapshot:
+        logger.info("No warm cache snapshot found")
+        return
+    loaded_verdicts = verdicts.load(snapshot.get("verdicts", []))
+    loaded_images = image_barcodes.load(snapshot.get("image_barcodes", []))
+    logger.info(f"Warm cache loaded: {loaded_verdicts} verdicts, {loaded_images} image digests")
+
+
+async def flush_requested_barcodes(db) -> None:
+    """ Flushes the requested and the unknown barcode counts into their daily sorted sets """
+    for name, pending, retention_days in (
+        (HOT_BARCODES_NAME, requested_barcodes, 14),
+        (UNKNOWN_BARCODES_NAME, unknown_barcodes, UNKNOWN_RETENTION_DAYS),
+    ):
+        counts = pending.drain()
+        try:
+            await db.add_daily_counts(name, counts, retention_days=retention_days)
+        except Exception:
+            logger.exception(f"Failed to flush {name} counts")
+            for barcode, amount in counts.items():
+                pending.add(barcode, amount)
+
+
+async def warm_snapshot_loop(db) -> None:
+    """ Persists the hot set every WARM_SNAPSHOT_INTERVAL seconds - Fly may stop the machine without much notice """
+    while True:
+        await asyncio.sleep(WARM_SNAPSHOT_INTERVAL)
+        await save_warm_snapshot(db)
+        await flush_requested_barcodes(db)
@@ -0,0 +1,174 @@
+import gzip
+import json
+import os
+import queue
+import secrets
+import threading
+from time import time
+
+from config import (
+    logger,
+    WEBHOOK_RECORD_DIR,
+    WEBHOOK_RECORD_FILE_MB,
+    WEBHOOK_RECORD_MAX_FILES,
+    WEBHOOK_RECORD_SALT,
+)
+from utils.thin_log import redact_webhook, strip_thumbnails
+
+FILE_PREFIX = "webhooks-"
+FILE_SUFFIX = ".ndjson.gz"
+
+
+class WebhookRecorder:
+    """
+    Opt-in recording of incoming webhooks for capacity tests (replay: tools/replay_webhooks.py).
+    Each line is {"received_at": <epoch float>, "body": <redacted request>} - no thumbnails, phone numbers
+    replaced by stable salted stand-ins, no contact names. Lines go to gzip NDJSON files rotated every
+    `file_bytes` (uncompressed), keeping the newest `max_files`.
+    The webhook only strips the thumbnails (the bulk of a request) and enqueues; the rest of the redaction,
+    compression and disk IO run on one background thread. Past `queue_size` waiting requests, new ones are
+    dropped - a stalled disk costs a bounded amount of memory.
+    Disabled when `directory` is empty.
+    """
+    def __init__(self, directory: str, file_bytes: int, max_files: int, salt: str, queue_size: int = 500):
+        self.directory = directory
+        self.file_bytes = file_bytes
+        self.max_files = max_files
+        self.salt = salt or secrets.token_hex(16)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_written = 0
+        self._files_opened = 0
+        self.recorded = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def record(self, whatsapp_request: dict) -> bool:
+        """ Queues the request with its arrival time. True if queued, False when disabled or backed up """
+        if not self.enabled:
+            return False
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((time(), strip_thumbnails(whatsapp_request)))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="webhook-recorder", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # drain what piled up and flush once - one sync flush per record would hurt the compression
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception:
+                logger.exception("Failed to record webhooks")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: list) -> None:
+        for item in batch:
+            if item is None:  # close marker
+                self._close_file()
+                continue
+            received_at, whatsapp_request = item
+            line = json.dumps(
+                {"received_at": round(received_at, 3), "body": redact_webhook(whatsapp_request, self.salt)},
+                ensure_ascii=False,
+            ) + "\n"
+            if self._file is None:
+                self._open_file()
+            data = line.encode("utf-8")
+            self._file.write(data)
+            self._file_written += len(data)
+            self.recorded += 1
+            if self._file_written >= self.file_bytes:
+                self._close_file()
+        if self._file is not None:
+            self._file.flush()  # sync flush - a crash loses at most the gzip trailer, not the lines
+
+    def _open_file(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        # sortable by the first arrival, the counter keeps rotations within one millisecond apart
+        name = f"{FILE_PREFIX}{int(time() * 1000)}-{self._files_opened % 10000:04d}{FILE_SUFFIX}"
+        self._files_opened += 1
+        self._file = gzip.open(os.path.join(self.directory, name), "ab")
+        self._file_written = 0
+        self._prune()
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _prune(self) -> None:
+        """ Deletes the oldest logs past `max_files` (the one being written included) """
+        files = recorded_files(self.directory)
+        for path in files[:max(0, len(files) - self.max_files)]:
+            os.remove(path)
+
+    def flush(self) -> None:
+        """ Waits until the queued requests are on disk (tests, shutdown) """
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        """ Flushes and finishes the current file, the next record opens a new one """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._queue.join()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize(),
+        }
+
+
+def recorded_files(directory: str) -> list:
+    """ The recorded logs in `directory`, oldest first """
+    return sorted(
+        entry.path for entry in os.scandir(directory)
+        if entry.is_file() and entry.name.startswith(FILE_PREFIX) and entry.name.endswith(FILE_SUFFIX)
+    )
+
+
+def read_records(paths: list):
+    """ Yields the records of the given logs in order. Tolerates a file cut short by a crash """
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    if line.endswith("\n"):
+                        yield json.loads(line)
+            except (EOFError, gzip.BadGzipFile):
+                logger.warning(f"{path} is truncated, replaying the complete lines only")
+
+
+webhook_recorder = WebhookRecorder(
+    WEBHOOK_RECORD_DIR,
+    WEBHOOK_RECORD_FILE_MB * 1024 * 1024,
+    WEBHOOK_RECORD_MAX_FILES,
+    WEBHOOK_RECORD_SALT,
+)  # Singleton instance